@@ -15,24 +15,34 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import time
+
 from order_matching.execution import Execution
+from order_matching.side import Side
+from order_matching.status import Status
 
 from exdb import EXCHANGE_DATABASE
+from journal import JournalEvent
 from unet.protocol import *
 
 from global_market import GlobalMarket
 from historydb import HistoryDB
+from quotes import QuoteBoard
+from order_store import TimeInForce
+from risk import RiskCache
 import utils
 
 
 def increment_balance(username: str, qty: int):
     with EXCHANGE_DATABASE.users[username] as user:
         user['immediate']['settled']['balance'] += qty
+        EXCHANGE_DATABASE.journal_account(JournalEvent.PAYMENT, username, user)
 
 
 def set_balance(username: str, qty: int):
     with EXCHANGE_DATABASE.users[username] as user:
         user['immediate']['settled']['balance'] = qty
+        EXCHANGE_DATABASE.journal_account(JournalEvent.PAYMENT, username, user)
 
 
 def change_balance(changer, username: str, qty: str):
@@ -57,7 +67,7 @@ def change_balance(changer, username: str, qty: str):
             }
         )
 
-    changer(username, real_qty)
+    changer(username, utils.to_ticks(real_qty))
 
     return unet_make_status_message(
         mode=UNetStatusMode.OK,
@@ -115,11 +125,13 @@ def _today_chart(ticker: str, property: str):
         data = HistoryDB().get_asset_intraday_of(ticker, EXCHANGE_DATABASE.get_open_date())
         x, y, xfmt = _spread_series(data)
 
-        bid = EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate']['bid']
-        ask = EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate']['ask']
+        # Bid and ask come from the same published snapshot, so the spread is never torn
+        quote = QuoteBoard().get(ticker)
+        bid = quote.bid if quote is not None else None
+        ask = quote.ask if quote is not None else None
         
         x.append(utils.now())
-        y.append(round((ask - bid) / round((ask + bid) / 2, 2) * 10000, 2)\
+        y.append(round((ask - bid) / ((ask + bid) / 2) * 10000, 2)\
                  if bid != None and ask != None
                  else None)
 
@@ -128,40 +140,31 @@ def _today_chart(ticker: str, property: str):
         return x, y, xfmt
     
     if property == '__DEPTH__':
-        bids = EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate']['depth']['bids']
-        offers = EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate']['depth']['offers']
-        
-        bidkeys = sorted([float(k) for k in bids])
-        offerkeys = sorted([float(k) for k in offers])
-
-        fbids = {float(k): bids[str(k)] for k in bidkeys}
-        foffers = {float(k): offers[str(k)] for k in offerkeys}
-        
-        both = {}
-        both.update(fbids)
-        both.update(foffers)
+        depth = GlobalMarket().markets[ticker].depth()
 
         x = []
         y = []
 
-        bid_qty = sum([fbids[i] for i in fbids])
-        offer_qty = 0
-        
-        for bid in bidkeys:
-            x.append(bid)
+        # Ladder comes best level first, bids are walked backwards to get ascending prices
+        bid_qty = 0
+        for price, size in depth['bids']:
+            bid_qty += size
+            x.append(utils.from_ticks(price))
             y.append(bid_qty)
-            bid_qty -= both[bid]
+        x.reverse()
+        y.reverse()
 
-        for offer in offerkeys:
-            offer_qty += both[offer]
-            x.append(offer)
+        offer_qty = 0
+        for price, size in depth['offers']:
+            offer_qty += size
+            x.append(utils.from_ticks(price))
             y.append(offer_qty)
         return x, y, None
 
 
     data = HistoryDB().get_asset_intraday_of(ticker, EXCHANGE_DATABASE.get_open_date())
     return _now_series(data,
-                       EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate'][property])
+                       utils.from_ticks(EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate'][property]))
 
 
 def _intraday_chart(ticker: str, property: str, day: str):
@@ -183,7 +186,7 @@ def _daily_chart(ticker: str, *args, **kwargs):
         y.append(day[6])
 
     x.append(utils.now())
-    y.append(EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate']['mid'])
+    y.append(utils.from_ticks(EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate']['mid']))
 
     return x, y, 'd/m/Y H:M'
 
@@ -229,12 +232,47 @@ def _spread_series(data: list):
 
     return x, y, 'd/m/Y H:M'
 
-def place_order(ticker: str, issuer: str, exec: any, side: any, size: str, price: str):
-    real_price = 0
+def show_tape(ticker: str, count=None, since=None):
+    ticker = ticker.upper()
+
+    if ticker not in GlobalMarket().markets:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'content': f"No such ticker '{ticker}'"
+            }
+        )
+    
     try:
-        real_price = float(price)
-        if real_price == float('inf') or real_price == float('nan'):
+        count = int(count) if count is not None else None
+        since = int(since) if since is not None else 0
+        if (count is not None and count <= 0) or since < 0:
             raise Exception()
+    except:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'content': f"Invalid value '{count if since == 0 else since}' for tape query"
+            }
+        )
+
+    # Bots poll with the last sequence they saw and only get what was printed after it
+    prints = GlobalMarket().markets[ticker].tape.since(since, limit=count)
+    return unet_make_table_message(
+        title=f'{ticker} TAPE',
+        columns=['SEQ', 'TIME', 'PRICE', 'SIZE', 'AGGRESSOR'],
+        rows=[[sequence, utils.timestamp_fmt(timestamp), utils.from_ticks(price), size, 'BUY' if side == Side.BUY else 'SELL']
+              for sequence, price, size, side, timestamp in prints]
+    )
+
+
+def place_order(ticker: str, issuer: str, exec: any, side: any, size: str, price: str, tif='GTC', expiry=None, risk_check=True):
+    real_price = 0
+    try:
+        # inf and nan can't be turned into ticks and end up here too
+        real_price = utils.to_ticks(price)
         if exec != Execution.MARKET and real_price <= 0:
             raise Exception()
     except:
@@ -252,7 +290,7 @@ def place_order(ticker: str, issuer: str, exec: any, side: any, size: str, price
     real_size = 0
     try:
         real_size = int(size)
-        if real_price == float('inf') or real_price == float('nan') or real_size <= 0:
+        if real_size <= 0:
             raise Exception()
     except:
         return unet_make_status_message(
@@ -266,22 +304,54 @@ def place_order(ticker: str, issuer: str, exec: any, side: any, size: str, price
             }
         )
     
+    real_tif = None
+    expires_at = None
+    try:
+        real_tif = TimeInForce.NAMES.index(tif.upper())
+        # Only GTD orders take an expiry, given as a duration from now
+        if real_tif == TimeInForce.GTD:
+            expires_at = time.time() + utils.parse_duration(expiry)
+        elif expiry is not None:
+            raise Exception()
+    except:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'filled': 0,
+                'price': 0,
+                'id': None,
+                'content': f"Invalid time in force '{tif}'" if real_tif is None else f"Invalid expiry '{expiry}' for {tif.upper()} order"
+            }
+        )
+
     order_id = 0
     order = None
     order_fill = real_size
     fill_price = 0
     try:
+        # Checked against cached exposure, a rejected order never waits on the engine
+        reserve, reason = RiskCache().reserve(issuer, ticker, side, exec, real_price, real_size, check=risk_check)
+        if reason is not None:
+            return unet_make_status_message(
+                mode=UNetStatusMode.ERR,
+                code=UNetStatusCode.DENY,
+                message={
+                    'filled': 0,
+                    'price': 0,
+                    'id': None,
+                    'content': f'Order rejected: {reason}'
+                }
+            )
+
         if exec == Execution.LIMIT:
-            order = GlobalMarket().add_limit_order(ticker, side, real_price, real_size, issuer)
-            order_id = order.order_id
-            order_fill -= order.left
+            order = GlobalMarket().add_limit_order(ticker, side, real_price, real_size, issuer, real_tif, expires_at, reserve)
 
         if exec == Execution.MARKET:
-            order = GlobalMarket().add_market_order(ticker, side, real_size, issuer)
-            order_id = order.order_id
-            order_fill -= order.left
+            order = GlobalMarket().add_market_order(ticker, side, real_size, issuer, real_tif, expires_at, reserve)
 
         if order == None:
+            RiskCache().release(issuer, ticker, side, reserve, real_size)
             return unet_make_status_message(
                 mode=UNetStatusMode.ERR,
                 code=UNetStatusCode.DENY,
@@ -293,7 +363,9 @@ def place_order(ticker: str, issuer: str, exec: any, side: any, size: str, price
                 }
             )
         
-        fill_price = round(order.fill_cost / order_fill, 2) if order_fill > 0 else 0
+        order_id = str(order.order_id)
+        order_fill -= order.left
+        fill_price = utils.from_ticks(round(order.fill_cost / order_fill)) if order_fill > 0 else 0
     except KeyError as ke:
         return unet_make_status_message(
             mode=UNetStatusMode.ERR,
@@ -314,5 +386,278 @@ def place_order(ticker: str, issuer: str, exec: any, side: any, size: str, price
             'price': fill_price,
             'id': order_id,
             'content': f"Order placed with ID={order_id}. {order_fill} Already filled at price '{fill_price}'"
+                       + ('. Remainder cancelled' if order.status == Status.CANCEL else '')
+        }
+    )
+
+
+def place_orders(ticker: str, issuer: str, orders: str):
+    # Orders are given as space separated specs: <b|s>:<size>[@<price>], no price means market
+    specs = []
+
+    for spec in orders.split():
+        try:
+            side_str, order_str = spec.split(':')
+            side = {'b': Side.BUY, 's': Side.SELL}[side_str.lower()]
+            size_str, _, price_str = order_str.partition('@')
+
+            size = int(size_str)
+            if size <= 0:
+                raise Exception()
+
+            if price_str == '':
+                specs.append((Execution.MARKET, side, size, 0, issuer))
+                continue
+
+            price = utils.to_ticks(price_str)
+            if price <= 0:
+                raise Exception()
+
+            specs.append((Execution.LIMIT, side, size, price, issuer))
+        except:
+            return unet_make_status_message(
+                mode=UNetStatusMode.ERR,
+                code=UNetStatusCode.BAD,
+                message={
+                    'orders': [],
+                    'content': f"Invalid order specification '{spec}'"
+                }
+            )
+
+    if len(specs) == 0:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'orders': [],
+                'content': 'No orders given'
+            }
+        )
+
+    placed = []
+    risk = RiskCache()
+    try:
+        # The batch is admitted as a whole, one rejected order gives back what the others held
+        for i, (execution, side, size, price, _) in enumerate(specs):
+            reserve, reason = risk.reserve(issuer, ticker, side, execution, price, size)
+            if reason is not None:
+                for held in specs[:i]:
+                    risk.release(issuer, ticker, held[1], held[-1], held[2])
+                return unet_make_status_message(
+                    mode=UNetStatusMode.ERR,
+                    code=UNetStatusCode.DENY,
+                    message={
+                        'orders': [],
+                        'content': f"Order {i + 1} rejected: {reason}"
+                    }
+                )
+
+            specs[i] = specs[i] + (reserve,)
+
+        # One engine call for the whole batch, limit and market orders keep their places
+        result = GlobalMarket().add_orders(ticker, specs)
+        if result == None:
+            for held in specs:
+                risk.release(issuer, ticker, held[1], held[-1], held[2])
+            return unet_make_status_message(
+                mode=UNetStatusMode.ERR,
+                code=UNetStatusCode.DENY,
+                message={
+                    'orders': [],
+                    'content': 'Sorry, market service on this ticker is not available'
+                }
+            )
+
+        for spec, order in zip(specs, result):
+            order_fill = spec[2] - order.left
+            placed.append({
+                'filled': order_fill,
+                'price': utils.from_ticks(round(order.fill_cost / order_fill)) if order_fill > 0 else 0,
+                'id': str(order.order_id)
+            })
+    except KeyError as ke:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'orders': [],
+                'content': f"No such ticker '{ticker}'"
+            }
+        )
+
+    return unet_make_status_message(
+        mode=UNetStatusMode.OK,
+        code=UNetStatusCode.DONE,
+        message={
+            'orders': placed,
+            'content': f'{len(placed)} orders placed'
+        }
+    )
+
+
+def amend_order(order_id: str, issuer: str, size: str, price: str = None):
+    return _change_order(GlobalMarket().amend_order, order_id, issuer, size, price)
+
+
+def replace_order(order_id: str, issuer: str, size: str, price: str):
+    return _change_order(GlobalMarket().replace_order, order_id, issuer, size, price)
+
+
+def _change_order(change, order_id: str, issuer: str, size: str, price: str):
+    real_size = 0
+    real_price = None
+    try:
+        real_size = int(size)
+        if real_size <= 0:
+            raise Exception()
+    except:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'filled': 0,
+                'price': 0,
+                'id': None,
+                'content': f"Invalid value '{size}' for order size"
+            }
+        )
+
+    try:
+        if price is not None:
+            real_price = utils.to_ticks(price)
+            if real_price <= 0:
+                raise Exception()
+    except:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'filled': 0,
+                'price': 0,
+                'id': None,
+                'content': f"Invalid value '{price}' for order price"
+            }
+        )
+
+    r = change(order_id, issuer, real_size, real_price)
+    if r is None or isinstance(r, (int, str)):
+        message = {
+            -1: f"No such Order ID '{order_id}'",
+            -2: 'Permission denied',
+            None: 'Sorry, market service on this ticker is not available'
+        }.get(r, f'Order rejected: {r}')
+
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.DENY,
+            message={
+                'filled': 0,
+                'price': 0,
+                'id': None,
+                'content': message
+            }
+        )
+
+    # Fills only count from the change on, what the order traded before is not reported again
+    order_fill = real_size - r.left
+    fill_price = utils.from_ticks(round(r.fill_cost / order_fill)) if order_fill > 0 else 0
+    return unet_make_status_message(
+        mode=UNetStatusMode.OK,
+        code=UNetStatusCode.DONE,
+        message={
+            'filled': order_fill,
+            'price': fill_price,
+            'id': str(r.order_id),
+            'content': f"Order ID={r.order_id} now {real_size} at price '{utils.from_ticks(r.price) if r.execution == Execution.LIMIT else 'MARKET'}'. "
+                       f"{order_fill} Already filled at price '{fill_price}'"
+        }
+    )
+
+
+def mass_quote(ticker: str, issuer: str, bids: str, asks: str):
+    # Each side is given as space separated levels: <size>@<price>
+    sides = []
+    for levels in (bids, asks):
+        parsed = []
+        for level in levels.split():
+            try:
+                size_str, price_str = level.split('@')
+                size = int(size_str)
+                price = utils.to_ticks(price_str)
+                if size <= 0 or price <= 0:
+                    raise Exception()
+
+                parsed.append((size, price))
+            except:
+                return unet_make_status_message(
+                    mode=UNetStatusMode.ERR,
+                    code=UNetStatusCode.BAD,
+                    message={
+                        'bids': [],
+                        'asks': [],
+                        'content': f"Invalid quote level '{level}'"
+                    }
+                )
+
+        sides.append(parsed)
+
+    real_bids, real_asks = sides
+    if len(real_bids) > 0 and len(real_asks) > 0 \
+        and max([price for _, price in real_bids]) >= min([price for _, price in real_asks]):
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'bids': [],
+                'asks': [],
+                'content': 'Bids and asks cross'
+            }
+        )
+
+    try:
+        r = GlobalMarket().mass_quote(ticker, issuer, real_bids, real_asks)
+    except KeyError as ke:
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.BAD,
+            message={
+                'bids': [],
+                'asks': [],
+                'content': f"No such ticker '{ticker}'"
+            }
+        )
+
+    if r is None or isinstance(r, str):
+        return unet_make_status_message(
+            mode=UNetStatusMode.ERR,
+            code=UNetStatusCode.DENY,
+            message={
+                'bids': [],
+                'asks': [],
+                'content': 'Sorry, market service on this ticker is not available' if r is None else f'Quotes rejected: {r}'
+            }
+        )
+
+    quotes, cancelled = r
+    reports = []
+    for (size, price), order in zip(real_bids + real_asks, quotes):
+        order_fill = size - order.left
+        reports.append({
+            'id': str(order.order_id),
+            'quote': utils.from_ticks(price),
+            'size': size,
+            'filled': order_fill,
+            'price': utils.from_ticks(round(order.fill_cost / order_fill)) if order_fill > 0 else 0
+        })
+
+    return unet_make_status_message(
+        mode=UNetStatusMode.OK,
+        code=UNetStatusCode.DONE,
+        message={
+            'bids': reports[:len(real_bids)],
+            'asks': reports[len(real_bids):],
+            'cancelled': cancelled,
+            'content': f'{len(reports)} levels quoted, {cancelled} orders cancelled, '
+                       f'{sum([report["filled"] for report in reports])} filled'
         }
     )
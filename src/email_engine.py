@@ -24,6 +24,7 @@ from texttable import Texttable
 from unet.singleton import UNetSingleton
 from exdb import EXCHANGE_DATABASE
 from unet.database import UNetUserDatabase
+from quotes import QuoteBoard
 
 import utils
 
@@ -39,17 +40,21 @@ class EmailEngine(UNetSingleton):
         table.set_cols_dtype(['t', 'f', 't'])
         table.add_row(['SYMBOL', 'PRICE', 'CHANGE'])
 
+        quotes = QuoteBoard().snapshots()
         for aclass in sorted(list(EXCHANGE_DATABASE.asset_classes.keys())):
             assets = EXCHANGE_DATABASE.asset_classes[aclass]
             for assetname in sorted(assets):
-                with EXCHANGE_DATABASE.assets[assetname] as asset:
-                    price = utils.value_fmt(asset['immediate']['mid'])
-                    symbol = f'{assetname}={aclass}'
-                    change = (f"{((asset['immediate']['mid'] - asset['sessionData']['previousClose']) / asset['sessionData']['previousClose'] * 100):+.2f}%"
-                                    if utils.are_none(asset['immediate']['mid'], asset['sessionData']['previousClose'])
-                                    else utils.value_fmt(None))
-                    
-                    table.add_row([symbol, price, change])
+                quote = quotes.get(assetname)
+                if quote is None:
+                    continue
+
+                price = utils.ticks_fmt(quote.mid)
+                symbol = f'{assetname}={aclass}'
+                change = (f"{((quote.mid - quote.previous_close) / quote.previous_close * 100):+.2f}%"
+                                if utils.are_none(quote.mid, quote.previous_close)
+                                else utils.value_fmt(None))
+                
+                table.add_row([symbol, price, change])
 
         addresses = [email for user, email in UNetUserDatabase().get_users()]
         addresses.remove(UNetUserDatabase().get_email_address('admin'))
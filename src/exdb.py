@@ -15,28 +15,73 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import logging
+import os
+
 from collections import defaultdict
 from platformdb import PlatformDB
+from sqlitedb import SQLiteDB
 from unet.singleton import UNetSingleton
 from object_lock import ObjectLock
+from order_store import OrderStore, OrderRecord
+from journal import Journal, JournalEvent, pack_account, pack_market, unpack
 import utils
 
 
+# What the numbers in the database mean, stamped by fixers/fix_ticks.py. Version 1 keeps prices and cash in ticks
+SCHEMA_VERSION = 1
+
+
 class ExchangeDatabase(UNetSingleton):
     def __setup__(self) -> None:
-        self.db = PlatformDB(filename='db/exchange.json', schema={
+        self.journal = Journal('db/exchange')
+        schema = {
             'usersByName': self.user(),
             'assetsByTicker': self.asset(),
             'assetsByClass': {},
             'ordersById': self.order()
-        })
+        }
+
+        # A database moved to SQLite by fixers/migrate_sqlite.py keeps a row per record
+        if os.path.exists('db/exchange.sqlite'):
+            self.db = SQLiteDB(filename='db/exchange.sqlite', schema=schema, journal=self.journal)
+        else:
+            # A database moved to another codec by fixers/migrate_codec.py is found by its extension
+            codec = PlatformDB.detect_codec('db/exchange')
+            self.db = PlatformDB(filename='db/exchange' + codec.extension, schema=schema, journal=self.journal, codec=codec)
 
         self.users = self.db.db['usersByName']
         self.assets = self.db.db['assetsByTicker']
         self.asset_classes = self.db.db['assetsByClass']
-        self.orders = self.db.db['ordersById']
+
+        # An unconverted database reads prices and balances as ticks, 100 times off. Only one with no records is new
+        version = self.db.db.get('schemaVersion')
+        if version is None and len(self.users) == 0 and len(self.assets) == 0 and len(self.db.db['ordersById']) == 0:
+            version = SCHEMA_VERSION
+
+        if version != SCHEMA_VERSION:
+            logging.critical(f'Database schema version is {version}, expected {SCHEMA_VERSION}. Run fixers/fix_ticks.py first')
+            exit(1)
+
+        self.db.db.__setitem__('schemaVersion', version)
+
+        # Persisted orders are replayed into the books by GlobalMarket, the live ones only exist in the store
+        self.restored_orders = self.db.db['ordersById']
+        self.orders = OrderStore()
+        self.db.db['ordersById'] = self.orders
+
+        for user in self.users.values():
+            user.get_unsafe()['immediate'].pop('orders', None)
+
+        for event, payload in self.journal.replay(self.db.db.get('journalSegment', 0), self.db.db.get('journalSequence')):
+            self.redo(event, unpack(event, payload))
+
+        # Components holding deferred changes register here to flush them before every snapshot
+        self.save_hooks = []
+        self.db.timer.function = self.save
 
         self.db.db.setdefault('openDate', utils.today())
+        self.journal.start()
         self.db.timer.start()
 
     def user(self,
@@ -51,8 +96,7 @@ class ExchangeDatabase(UNetSingleton):
                 'settled': {
                     'balance': balance,
                     'assets': defaultdict(lambda: 0)
-                },
-                'orders': []
+                }
             }
         }
     
@@ -63,7 +107,9 @@ class ExchangeDatabase(UNetSingleton):
         return {
             'info': {
                 'class': aclass,
-                'issuer': issuer
+                'issuer': issuer,
+                # Seconds of call auction at the start of each session, 0 trades continuously from the first order
+                'openingAuction': 0
             },
             'immediate': {
                 'bid': None,
@@ -73,11 +119,7 @@ class ExchangeDatabase(UNetSingleton):
                 'mid': None,
                 'lastBid': None,
                 'lastAsk': None,
-                'last': None,
-                'depth': {
-                    'bids': defaultdict(lambda: 0),
-                    'offers': defaultdict(lambda: 0)
-                }
+                'last': None
             },
             'sessionData': {
                 'buyVolume': 0,
@@ -135,31 +177,56 @@ class ExchangeDatabase(UNetSingleton):
         classdb.setdefault(aclass, []).append(ticker)
         return True
     
-    def add_order(self,
-                  order_id,
-                  execution=None,
-                  issuer=None,
-                  side=None,
-                  ticker=None,
-                  size=None,
-                  price=None):
-        
-        self.orders.__setitem__(order_id, self.order(execution,
-                                                     issuer,
-                                                     side,
-                                                     ticker,
-                                                     size,
-                                                     price))
-        
-        self.users[issuer].get_unsafe()['immediate']['orders'].append(order_id)
-
+    def add_order(self, order: OrderRecord):
+        self.orders.add(order)
         return True
-        
-    def update_order(self,
-                     order_id,
-                     size):
-    
-        self.orders[order_id]['size'] = size
+
+    def journal_account(self, event: int, username: str, user: dict):
+        self.journal.append(event, pack_account(username, user))
+
+    def journal_market(self, ticker: str, asset: dict):
+        self.journal.append(JournalEvent.MARKET, pack_market(ticker, asset))
+
+    def redo(self, event: int, record):
+        match (event):
+            case JournalEvent.ORDER:
+                order_id, order = record
+                if order['size'] > 0:
+                    self.restored_orders.__setitem__(str(order_id), order)
+                else:
+                    self.restored_orders.pop(str(order_id), None)
+                    self.orders.touch(int(order_id))
+
+            case JournalEvent.CANCEL | JournalEvent.FILLED:
+                self.restored_orders.pop(str(record), None)
+                # Gone before the books were rebuilt, its row goes with the next commit
+                self.orders.touch(int(record))
+
+            case JournalEvent.TRADE | JournalEvent.PAYMENT | JournalEvent.TRANSFER:
+                username, account = record
+                self.add_user(username)
+                with self.users[username] as user:
+                    for state in ('current', 'settled'):
+                        user['immediate'][state]['balance'] = account[state]['balance']
+                        user['immediate'][state]['assets'].clear()
+                        user['immediate'][state]['assets'].update(account[state]['assets'])
+
+            case JournalEvent.MARKET:
+                ticker, stats = record
+                if ticker not in self.assets:
+                    return
+
+                with self.assets[ticker] as asset:
+                    asset['sessionData']['buyVolume'] = stats['buyVolume']
+                    asset['sessionData']['sellVolume'] = stats['sellVolume']
+                    asset['sessionData']['tradedValue'] = stats['tradedValue']
+                    asset['immediate']['last'] = stats['last']
+
+    def save(self):
+        for hook in self.save_hooks:
+            hook()
+
+        self.db.save()
 
     def get_open_date(self):
         return self.db.db['openDate']
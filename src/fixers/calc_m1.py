@@ -11,6 +11,6 @@ for name, user in file['usersByName'].items():
 
 m1 -= file["usersByName"]["UNBMM"]["immediate"]["settled"]["balance"]
 m1 -= file["usersByName"]["UNB"]["immediate"]["settled"]["balance"]
-print(int(m1))
+print(int(m1 / 100))
 
 
@@ -0,0 +1,39 @@
+import json
+
+
+# Has to match SCHEMA_VERSION in exdb.py
+SCHEMA_VERSION = 1
+
+
+def to_ticks(value):
+    if value is None or value == float('inf'):
+        return value
+    return int(round(value * 100))
+
+
+file = None 
+with open("db/exchange.json", 'r') as f:
+    file = json.loads(f.read())
+
+if 'schemaVersion' in file:
+    print(f'db/exchange.json already has schema version {file["schemaVersion"]}')
+    exit()
+
+for name, user in file['usersByName'].items():
+    for state in ('current', 'settled'):
+        user['immediate'][state]['balance'] = to_ticks(user['immediate'][state]['balance'])
+
+for ticker, asset in file['assetsByTicker'].items():
+    asset['immediate'].pop('depth', None)
+    for key in ('bid', 'ask', 'mid', 'lastBid', 'lastAsk', 'last'):
+        asset['immediate'][key] = to_ticks(asset['immediate'][key])
+    for key in ('tradedValue', 'previousClose', 'open', 'close'):
+        asset['sessionData'][key] = to_ticks(asset['sessionData'][key])
+
+for order_id, order in file['ordersById'].items():
+    order['price'] = to_ticks(order['price'])
+
+file['schemaVersion'] = SCHEMA_VERSION
+
+with open('db/exchange.json', 'w') as f:
+    f.write(json.dumps(file))
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platformdb import PlatformDB
+from snapshot_codec import CODECS
+
+
+# Run with the server stopped, from the directory holding db/: python fixers/migrate_codec.py <json|binary>
+NAME = 'db/exchange'
+
+target = CODECS[sys.argv[1]]()
+source = PlatformDB.detect_codec(NAME)
+if source.extension == target.extension:
+    print(f'{NAME}{target.extension} already uses the {sys.argv[1]} codec')
+    exit()
+
+# Loading applies the delta log, the journal is left for the server to replay
+db = PlatformDB(filename=NAME + source.extension, codec=source)
+db.convert(NAME + target.extension, target)
+
+# The old files are kept, but out of the way of codec detection
+for suffix in PlatformDB.generations:
+    for filename in (NAME + source.extension + suffix, NAME + source.extension + suffix + '.delta'):
+        if os.path.exists(filename):
+            os.replace(filename, filename + '.bak')
+
+print(f'{NAME}{source.extension} -> {NAME}{target.extension}')
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platformdb import PlatformDB
+from sqlitedb import SQLiteDB
+
+
+# Run with the server stopped, from the directory holding db/: python fixers/migrate_sqlite.py
+NAME = 'db/exchange'
+
+if os.path.exists(NAME + '.sqlite'):
+    print(f'{NAME}.sqlite already exists')
+    exit()
+
+# Loading applies the delta log, the journal is left for the server to replay
+codec = PlatformDB.detect_codec(NAME)
+source = PlatformDB(filename=NAME + codec.extension, codec=codec)
+target = SQLiteDB(filename=NAME + '.sqlite')
+
+for key, value in source.db.items():
+    if key not in SQLiteDB.tables:
+        target.db.__setitem__(key, value)
+        continue
+
+    for record_key, record in value.items():
+        target.db[key].__setitem__(record_key, record)
+
+target.save()
+
+# The old files are kept, but out of the way of backend detection
+for suffix in PlatformDB.generations:
+    for filename in (NAME + codec.extension + suffix, NAME + codec.extension + suffix + '.delta'):
+        if os.path.exists(filename):
+            os.replace(filename, filename + '.bak')
+
+print(f'{NAME}{codec.extension} -> {NAME}.sqlite')
@@ -15,104 +15,184 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import threading
+import time
+
 from order_matching.side import Side
-from order_matching.execution import Execution
 from object_lock import ObjectLock
 
 from unet.singleton import UNetSingleton
+from shard import ShardPool
 
 from exdb import EXCHANGE_DATABASE
+from order_store import OrderRecord, TimeInForce
+from timing_wheel import TimingWheel
+from repeated_timer import RepeatedTimer
 
 
 class MarketIndex:
     def __init__(self, index=0) -> None:
         self.index = index
 
-    def next(self):
-        self.index += 1
-        return self.index
-    
     def set(self, index):
         self.index = index
 
 
 class GlobalMarket(UNetSingleton):
+    # Set before the first instantiation to run every market on its own sequencer thread
+    sequenced = False
+    # Set before the first instantiation to spread order matching across this many worker processes
+    shards = 0
+    # Order IDs each market reserves at once, the shared counter is only touched when a block runs out
+    order_id_block = 256
+    # Seconds between passes of the expiry wheel
+    expiry_interval = 1
+
     def __setup__(self):
         self.markets = {}
-        self.orders = {}
+        self.orders = EXCHANGE_DATABASE.orders
         self.ready = False
         self.order_index = ObjectLock(MarketIndex())
+        self.shard_pool = ShardPool(self.shards) if self.shards > 0 else None
+        # Order ID -> expiry of the resting GTD orders, filled and cancelled orders are skipped when they come due
+        self.expiry = ObjectLock(TimingWheel(time.time()))
+        self.expiry_timer = RepeatedTimer(self.expiry_interval, self.expire_orders)
 
         for ticker in EXCHANGE_DATABASE.assets:
             if ticker not in self.markets:
-                EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate']['depth'] = EXCHANGE_DATABASE.asset()['immediate']['depth']
+                # Depth now lives in the matching layer and is rebuilt from the resting orders
+                EXCHANGE_DATABASE.assets[ticker].get_unsafe()['immediate'].pop('depth', None)
+                EXCHANGE_DATABASE.assets[ticker].get_unsafe()['info'].setdefault('openingAuction', 0)
                 self.create_market(ticker)
 
-        if len(EXCHANGE_DATABASE.orders.keys()) > 0:
-            final_id = 0
-            for order_id, order in EXCHANGE_DATABASE.orders.copy().items():
-                final_id = max(final_id, int(order_id))
-                self.order_index.get_unsafe().set(int(order_id) - 1)
-                match (order['execution']):
-                    case 'LIMIT':
-                        self.add_limit_order(order['ticker'],
-                                             Side.BUY if order['side'] == 'BUY'
-                                             else Side.SELL,
-                                             order['price'],
-                                             order['size'],
-                                             order['issuer'])
-
-                    case 'MARKET':
-                        self.add_market_order(order['ticker'],
-                                              Side.BUY if order['side'] == 'BUY'
-                                              else Side.SELL,
-                                              order['size'],
-                                              order['issuer'])
-
-            self.order_index.get_unsafe().set(final_id)
+        self.restore_orders(EXCHANGE_DATABASE.restored_orders)
+        EXCHANGE_DATABASE.restored_orders = {}
         self.ready = True
+        self.expiry_timer.start()
+
+    def restore_orders(self, restored):
+        orders_by_ticker = {}
+        final_id = 0
+
+        # Orders saved before amends kept their IDs have no priority, their ID is their time
+        for order_id, order in sorted(restored.items(), key=lambda item: item[1].get('priority', int(item[0]))):
+            if order['ticker'] not in self.markets:
+                self.orders.touch(int(order_id))
+                continue
+
+            priority = order.get('priority', int(order_id))
+            final_id = max(final_id, int(order_id), priority)
+            side = Side.BUY if order['side'] == 'BUY' else Side.SELL
+            # Orders saved before time in force existed are good till cancelled
+            tif = TimeInForce.NAMES.index(order.get('tif', 'GTC'))
+            match (order['execution']):
+                case 'LIMIT':
+                    record = OrderRecord.limit(int(order_id), order['ticker'], order['issuer'], side, order['price'], order['size'],
+                                               tif, order.get('expiresAt'))
+
+                case 'MARKET':
+                    record = OrderRecord.market(int(order_id), order['ticker'], order['issuer'], side, order['size'],
+                                                tif, order.get('expiresAt'))
+
+            record.priority = priority
+            record.quote = order.get('quote', False)
+            orders_by_ticker.setdefault(order['ticker'], []).append(record)
+
+        for ticker, orders in orders_by_ticker.items():
+            self.markets[ticker].restore_orders(orders)
+
+        with self.order_index as oi:
+            oi.set(max(oi.index, final_id))
 
-    def next_order_index(self):
+    def reserve_order_ids(self, count: int):
         with self.order_index as oi:
-            return str(oi.next())
+            first = oi.index + 1
+            oi.set(oi.index + count)
+            return range(first, oi.index + 1)
 
-    def add_limit_order(self, ticker, side, price, size, issuer):
+    def add_limit_order(self, ticker, side, price, size, issuer, tif=TimeInForce.GTC, expires_at=None, reserve=0):
         market = self.markets[ticker]
-        return market.add_limit_order(side, size, price, issuer)
+        return market.add_limit_order(side, size, price, issuer, tif, expires_at, reserve)
     
-    def add_market_order(self, ticker, side, size, issuer):
+    def add_market_order(self, ticker, side, size, issuer, tif=TimeInForce.GTC, expires_at=None, reserve=0):
+        market = self.markets[ticker]
+        return market.add_market_order(side, size, issuer, tif, expires_at, reserve)
+
+    def add_orders(self, ticker, specs):
         market = self.markets[ticker]
-        return market.add_market_order(side, size, issuer)
+        return market.add_orders(specs)
+
+    def mass_quote(self, ticker, issuer, bids, asks):
+        market = self.markets[ticker]
+        return market.mass_quote(issuer, bids, asks)
 
     def cancel_order(self, order_id, issuer):
         try:
-            return self.markets[EXCHANGE_DATABASE.orders[order_id]['ticker']].cancel_order(self.orders[order_id],
-                                                                                            issuer)
-        except KeyError as ke:
+            order = self.orders[int(order_id)]
+            return self.markets[order.ticker].cancel_order(order, issuer)
+        except (KeyError, ValueError) as e:
             return -1
     
+    def amend_order(self, order_id, issuer, size, price=None):
+        try:
+            order = self.orders[int(order_id)]
+            return self.markets[order.ticker].amend_order(order, issuer, size, price)
+        except (KeyError, ValueError) as e:
+            return -1
+
+    def replace_order(self, order_id, issuer, size, price):
+        try:
+            order = self.orders[int(order_id)]
+            return self.markets[order.ticker].replace_order(order, issuer, size, price)
+        except (KeyError, ValueError) as e:
+            return -1
+
     def add_order(self, ticker: str, order):
-        self.orders.__setitem__(order.order_id, order)
-
-        if self.ready:
-            EXCHANGE_DATABASE.add_order(order.order_id,
-                                        'LIMIT' if order.execution == Execution.LIMIT
-                                        else 'MARKET',
-                                        order.trader_id,
-                                        'BUY' if order.side == Side.BUY
-                                        else 'SELL',
-                                        ticker,
-                                        order.size,
-                                        order.price)
+        EXCHANGE_DATABASE.add_order(order)
+        if order.tif == TimeInForce.GTD and order.size > 0:
+            with self.expiry as wheel:
+                wheel.add(order.order_id, order.expires_at)
+
+    def expire_orders(self, now=None):
+        now = time.time() if now is None else now
+        with self.expiry as wheel:
+            expired = wheel.advance(now)
+
+        orders = [self.orders.get(order_id) for order_id in expired]
+        self._expire([order for order in orders if order is not None and order.tif == TimeInForce.GTD and order.expires_at <= now])
+
+    def open_auctions(self):
+        for ticker, market in list(self.markets.items()):
+            duration = EXCHANGE_DATABASE.assets[ticker].get_unsafe()['info'].get('openingAuction', 0)
+            if duration <= 0:
+                continue
+
+            market.start_auction()
+            timer = threading.Timer(duration, market.uncross)
+            timer.daemon = True
+            timer.start()
+
+    def expire_day_orders(self):
+        # All DAY orders leave at settlement, one bulk cancel per market
+        self._expire([order for order in self.orders if order.tif == TimeInForce.DAY])
+
+    def _expire(self, orders):
+        orders_by_ticker = {}
+        for order in orders:
+            if order.ticker in self.markets:
+                orders_by_ticker.setdefault(order.ticker, []).append(order)
+
+        for ticker, ticker_orders in orders_by_ticker.items():
+            self.markets[ticker].expire_orders(ticker_orders)
 
     def remove_order(self, order_id):
-        EXCHANGE_DATABASE.users[self.orders[order_id].trader_id].get_unsafe()['immediate']['orders'].remove(order_id)
         self.orders.pop(order_id)
-        EXCHANGE_DATABASE.orders.pop(order_id)
 
     def create_market(self, ticker):
         from market_manager import MarketManager
-        self.markets.__setitem__(ticker, MarketManager(ticker))
+        self.markets.__setitem__(ticker, MarketManager(ticker,
+                                                       sequenced=self.sequenced,
+                                                       shard_pool=self.shard_pool))
 
     def remove_market(self, ticker):
         l = self.markets[ticker].close(delete=True)
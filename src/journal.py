@@ -0,0 +1,350 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from order_matching.side import Side
+from order_matching.execution import Execution
+
+from order_store import OrderRecord, TimeInForce
+
+
+class JournalEvent:
+    # Records carry the state of what they touch after the event, so replaying one twice is harmless
+    ORDER = 0
+    CANCEL = 1
+    TRADE = 2
+    PAYMENT = 3
+    TRANSFER = 4
+    MARKET = 5
+    FILLED = 6
+    # Bracket a ledger batch, what is between them only replays once the end made it to disk
+    BATCH = 7
+    BATCH_END = 8
+    # First event number of a segment, written when the segment is opened and never replayed
+    SEQUENCE = 9
+
+
+# Payload length, CRC32 of event and payload, event
+_HEADER = struct.Struct('<IIB')
+_STRING = struct.Struct('<H')
+# Order ID, side, execution, price, size
+_ORDER = struct.Struct('<qBBqq')
+_CANCEL = struct.Struct('<q')
+# Time in force, expiry
+_TIF = struct.Struct('<Bd')
+# Queue priority
+_PRIORITY = struct.Struct('<q')
+# Placed by a mass quote
+_QUOTE = struct.Struct('<B')
+# Balance, number of positions
+_ACCOUNT = struct.Struct('<qH')
+_POSITION = struct.Struct('<q')
+# Buy volume, sell volume, traded value, has last, last
+_MARKET = struct.Struct('<qqqBq')
+_SEQUENCE = struct.Struct('<q')
+
+
+def _pack_string(value: str):
+    encoded = value.encode()
+    return _STRING.pack(len(encoded)) + encoded
+
+
+def _unpack_string(payload, offset):
+    length, = _STRING.unpack_from(payload, offset)
+    offset += _STRING.size
+    return payload[offset:offset + length].decode(), offset + length
+
+
+def pack_order(order: OrderRecord):
+    ticker = order.ticker.encode()
+    trader_id = order.trader_id.encode()
+    return b''.join((_ORDER.pack(order.order_id,
+                                 0 if order.side == Side.BUY else 1,
+                                 0 if order.execution == Execution.LIMIT else 1,
+                                 order.price if order.execution == Execution.LIMIT else 0,
+                                 order.size),
+                     _STRING.pack(len(ticker)), ticker,
+                     _STRING.pack(len(trader_id)), trader_id,
+                     _TIF.pack(order.tif, order.expires_at if order.expires_at is not None else 0),
+                     _PRIORITY.pack(order.priority),
+                     _QUOTE.pack(order.quote)))
+
+
+def pack_cancel(order_id: int):
+    return _CANCEL.pack(order_id)
+
+
+def pack_filled(order_id: int):
+    return _CANCEL.pack(order_id)
+
+
+def order_frame(order: OrderRecord):
+    # Orders that left the book only need their ID
+    if order.size <= 0:
+        return JournalEvent.FILLED, pack_filled(order.order_id)
+
+    return JournalEvent.ORDER, pack_order(order)
+
+
+def pack_account(username: str, user: dict):
+    parts = [_pack_string(username)]
+
+    for state in ('current', 'settled'):
+        account = user['immediate'][state]
+        parts.append(_ACCOUNT.pack(int(account['balance']), len(account['assets'])))
+        for ticker, units in account['assets'].items():
+            parts.append(_pack_string(ticker))
+            parts.append(_POSITION.pack(units))
+
+    return b''.join(parts)
+
+
+def pack_market(ticker: str, asset: dict):
+    session_data = asset['sessionData']
+    last = asset['immediate']['last']
+    return _MARKET.pack(session_data['buyVolume'],
+                        session_data['sellVolume'],
+                        session_data['tradedValue'],
+                        last is not None,
+                        last if last is not None else 0) + _pack_string(ticker)
+
+
+def unpack(event: int, payload: bytes):
+    match (event):
+        case JournalEvent.ORDER:
+            order_id, side, execution, price, size = _ORDER.unpack_from(payload)
+            ticker, offset = _unpack_string(payload, _ORDER.size)
+            issuer, offset = _unpack_string(payload, offset)
+            tif, expires_at = _TIF.unpack_from(payload, offset)
+            priority, = _PRIORITY.unpack_from(payload, offset + _TIF.size)
+            quote, = _QUOTE.unpack_from(payload, offset + _TIF.size + _PRIORITY.size)
+
+            if execution == 1:
+                price = float('inf') if side == 0 else 0
+
+            return order_id, {
+                'execution': 'LIMIT' if execution == 0 else 'MARKET',
+                'ticker': ticker,
+                'issuer': issuer,
+                'side': 'BUY' if side == 0 else 'SELL',
+                'size': size,
+                'price': price,
+                'tif': TimeInForce.NAMES[tif],
+                'expiresAt': expires_at if tif == TimeInForce.GTD else None,
+                'priority': priority,
+                'quote': quote == 1
+            }
+
+        case JournalEvent.CANCEL | JournalEvent.FILLED:
+            return _CANCEL.unpack_from(payload)[0]
+
+        case JournalEvent.TRADE | JournalEvent.PAYMENT | JournalEvent.TRANSFER:
+            username, offset = _unpack_string(payload, 0)
+            account = {}
+
+            for state in ('current', 'settled'):
+                balance, count = _ACCOUNT.unpack_from(payload, offset)
+                offset += _ACCOUNT.size
+                assets = {}
+
+                for _ in range(count):
+                    ticker, offset = _unpack_string(payload, offset)
+                    assets.__setitem__(ticker, _POSITION.unpack_from(payload, offset)[0])
+                    offset += _POSITION.size
+
+                account.__setitem__(state, {'balance': balance, 'assets': assets})
+
+            return username, account
+
+        case JournalEvent.MARKET:
+            buy_volume, sell_volume, traded_value, has_last, last = _MARKET.unpack_from(payload)
+            ticker, _ = _unpack_string(payload, _MARKET.size)
+            return ticker, {
+                'buyVolume': buy_volume,
+                'sellVolume': sell_volume,
+                'tradedValue': traded_value,
+                'last': last if has_last else None
+            }
+
+
+class Journal:
+    # Seconds between group commits, appending never waits for the disk
+    commit_interval = 0.05
+
+    def __init__(self, prefix: str) -> None:
+        self._prefix = prefix
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        # Held while frames are written out, so a rotation can't interleave with a commit
+        self._commit_lock = threading.Lock()
+        # Held from begin() to end(), a rotation waits for it so a batch never spans two segments
+        self._batch_lock = threading.Lock()
+        self._file = None
+        self._segment = 0
+        # Number of the last event appended, snapshots record it to say which events they hold
+        self._sequence = 0
+        self._running = False
+
+    def _path(self, segment: int):
+        return f'{self._prefix}.{segment}.journal'
+
+    def segments(self):
+        directory, name = os.path.split(self._prefix)
+        directory = directory if directory != '' else '.'
+        if not os.path.isdir(directory):
+            return []
+
+        segments = []
+        for filename in os.listdir(directory):
+            number = filename[len(name) + 1:-len('.journal')]
+            if filename.startswith(name + '.') and filename.endswith('.journal') and number.isdigit():
+                segments.append(int(number))
+
+        return sorted(segments)
+
+    def start(self):
+        # Always write to a fresh segment, the last one may end with a torn record
+        segments = self.segments()
+        self._segment = segments[-1] + 1 if len(segments) > 0 else 1
+        os.makedirs(os.path.dirname(self._prefix) or '.', exist_ok=True)
+        self._file = open(self._path(self._segment), 'ab')
+        self._buffer.insert(0, self._frame(JournalEvent.SEQUENCE, _SEQUENCE.pack(self._sequence + 1)))
+        self._running = True
+        threading.Thread(target=self._committer, daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        self.commit()
+
+    def _frame(self, event: int, payload: bytes):
+        return _HEADER.pack(len(payload), zlib.crc32(payload, event), event) + payload
+
+    def append(self, event: int, payload: bytes):
+        frame = self._frame(event, payload)
+        with self._buffer_lock:
+            self._sequence += 1
+            self._buffer.append(frame)
+
+    def begin(self):
+        self._batch_lock.acquire()
+        self.append(JournalEvent.BATCH, b'')
+
+    def end(self):
+        self.append(JournalEvent.BATCH_END, b'')
+        self._batch_lock.release()
+
+    def _committer(self):
+        while self._running:
+            time.sleep(self.commit_interval)
+            self.commit()
+
+    def _write(self, file, frames):
+        if len(frames) == 0:
+            return
+
+        file.write(b''.join(frames))
+        file.flush()
+        os.fsync(file.fileno())
+
+    def commit(self):
+        with self._commit_lock:
+            if self._file is None:
+                return
+
+            with self._buffer_lock:
+                frames, self._buffer = self._buffer, []
+            self._write(self._file, frames)
+
+    def rotate(self, on_rotate=None):
+        # Returns the new segment and the last event before it. on_rotate runs while no event can be appended,
+        # whatever it captures holds exactly the events before the new segment
+        with self._batch_lock, self._commit_lock:
+            # Nothing has been written yet, a snapshot taken now has to replay whatever comes after it
+            if self._file is None:
+                with self._buffer_lock:
+                    if on_rotate is not None:
+                        on_rotate()
+                    return self._segment, self._sequence
+
+            with self._buffer_lock:
+                frames, self._buffer = self._buffer, [self._frame(JournalEvent.SEQUENCE, _SEQUENCE.pack(self._sequence + 1))]
+                old_file = self._file
+                self._segment += 1
+                self._file = open(self._path(self._segment), 'ab')
+                sequence = self._sequence
+                if on_rotate is not None:
+                    on_rotate()
+
+            self._write(old_file, frames)
+            old_file.close()
+            return self._segment, sequence
+
+    def discard(self, before: int):
+        for segment in self.segments():
+            if segment < before:
+                os.remove(self._path(segment))
+
+    def replay(self, since=0, sequence=None):
+        # Events are numbered on from the snapshot's last one, every segment says where it picks up
+        self._sequence = sequence if sequence is not None else 0
+        for segment in self.segments():
+            if segment < since:
+                continue
+
+            with open(self._path(segment), 'rb') as file:
+                data = file.read()
+
+            offset = 0
+            # Events of a batch whose end marker has not been read yet. Other threads' events appended in the
+            # meantime wait with them, so everything still comes out in the order it was written
+            held = None
+            while offset + _HEADER.size <= len(data):
+                length, crc, event = _HEADER.unpack_from(data, offset)
+                start = offset + _HEADER.size
+                payload = data[start:start + length]
+
+                # A short or corrupt record is the tail that was being written when the process died
+                if len(payload) < length or zlib.crc32(payload, event) != crc:
+                    break
+
+                offset = start + length
+                if event == JournalEvent.SEQUENCE:
+                    first, = _SEQUENCE.unpack(payload)
+                    if sequence is not None and first != self._sequence + 1:
+                        logging.warning(f'Journal segment {segment} starts at event {first}, expected {self._sequence + 1}')
+                    sequence = first
+                    self._sequence = first - 1
+                    continue
+
+                self._sequence += 1
+                if event == JournalEvent.BATCH:
+                    held = []
+                elif event == JournalEvent.BATCH_END:
+                    yield from held or ()
+                    held = None
+                elif held is not None:
+                    held.append((event, payload))
+                else:
+                    yield event, payload
+
+            # A batch left open at the end of a segment was cut short by the crash, none of it is replayed
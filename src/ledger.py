@@ -0,0 +1,156 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import threading
+from collections import deque
+
+from unet.singleton import UNetSingleton
+
+from exdb import EXCHANGE_DATABASE
+from event_engine import EventEngine, ExchangeEvent
+from journal import JournalEvent
+from risk import RiskCache
+
+
+class LedgerEntry:
+    __slots__ = ('deltas', 'frames', 'users_to_notify')
+
+    def __init__(self, deltas, frames, users_to_notify) -> None:
+        # Username -> [units, cash]
+        self.deltas = deltas
+        # Journal records of the orders involved, captured under the engine lock
+        self.frames = frames
+        self.users_to_notify = users_to_notify
+
+
+class PositionLedger(UNetSingleton):
+    def __setup__(self):
+        self._queues = {}
+        self._wakeup = threading.Event()
+        # Held while a batch is applied, so a flush returns only once everything before it is visible
+        self._apply_lock = threading.Lock()
+        # Old username -> new one, for entries queued before a rename reached them
+        self._renamed = {}
+
+        self._applier_thread = threading.Thread(target=self._applier_loop, daemon=True)
+        self._applier_thread.start()
+        EXCHANGE_DATABASE.save_hooks.append(self.flush)
+
+    def post(self, ticker: str, deltas: dict, frames: list, users_to_notify=()):
+        entries = self._queues.get(ticker)
+        if entries is None:
+            entries = self._queues.setdefault(ticker, deque())
+
+        entries.append(LedgerEntry(deltas, frames, users_to_notify))
+        self._wakeup.set()
+
+    def _applier_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except:
+                logging.exception('Position ledger flush failed')
+
+    def flush(self):
+        with self._apply_lock:
+            users_to_notify = self._apply()
+
+        if len(users_to_notify) > 0:
+            EventEngine().notify_async(users_to_notify, ExchangeEvent.ORDER_FILLED)
+
+    def rename_user(self, username: str, new_username: str, rename):
+        # Entries already queued, or queued by trades that still carry the old name, follow the account.
+        # rename runs with the ledger stopped, so no batch sees the account half renamed
+        with self._apply_lock:
+            users_to_notify = self._apply()
+            rename()
+            self._renamed.__setitem__(username, new_username)
+
+        if len(users_to_notify) > 0:
+            EventEngine().notify_async(users_to_notify, ExchangeEvent.ORDER_FILLED)
+
+    def _resolve(self, username: str):
+        while username not in EXCHANGE_DATABASE.users and username in self._renamed:
+            username = self._renamed[username]
+        return username
+
+    def _apply(self):
+        batch = []
+        for ticker, entries in list(self._queues.items()):
+            while len(entries) > 0:
+                batch.append((ticker, entries.popleft()))
+
+        if len(batch) == 0:
+            return set()
+
+        # Username -> ticker -> [units, cash], every account is locked once per batch
+        accounts = {}
+        users_to_notify = set()
+        for i, (ticker, entry) in enumerate(batch):
+            deltas = {self._resolve(username): delta for username, delta in entry.deltas.items()}
+            batch[i] = (ticker, deltas, entry.frames)
+            for username, (units, cash) in deltas.items():
+                delta = accounts.setdefault(username, {}).setdefault(ticker, [0, 0])
+                delta[0] += units
+                delta[1] += cash
+
+            users_to_notify.update(self._resolve(username) for username in entry.users_to_notify)
+
+        # The accounts and order records of a batch replay together or not at all
+        journal = EXCHANGE_DATABASE.journal
+        journal.begin()
+        try:
+            self._settle(batch, accounts)
+        finally:
+            journal.end()
+
+        return users_to_notify
+
+    def _settle(self, batch, accounts):
+        # (username, ticker) pairs left for the next flush
+        failed = set()
+        for username, positions in accounts.items():
+            remaining = dict(positions)
+            try:
+                with EXCHANGE_DATABASE.users[username] as user:
+                    assets = user['immediate']['current']['assets']
+                    for ticker, (units, cash) in positions.items():
+                        assets[ticker] = assets.get(ticker, 0) + units
+                        if assets[ticker] == 0:
+                            assets.pop(ticker)
+                        user['immediate']['current']['balance'] += cash
+                        remaining.pop(ticker)
+
+                    EXCHANGE_DATABASE.journal_account(JournalEvent.TRADE, username, user)
+            except:
+                # What did not land is queued again and keeps counting as pending exposure until it does
+                logging.exception(f'Could not apply trades to {username}, retrying on the next flush')
+                for ticker, (units, cash) in remaining.items():
+                    failed.add((username, ticker))
+                    self._queues[ticker].append(LedgerEntry({username: (units, cash)}, [], ()))
+
+        # Once in the accounts, deltas no longer count as pending exposure
+        risk = RiskCache()
+        for ticker, deltas, _ in batch:
+            risk.applied(ticker, {username: delta for username, delta in deltas.items() if (username, ticker) not in failed})
+
+        for ticker, _, frames in batch:
+            for event, payload in frames:
+                EXCHANGE_DATABASE.journal.append(event, payload)
@@ -16,10 +16,9 @@
 
 
 import json
-from datetime import datetime, timedelta
+import threading
 
 from order_matching.side import Side
-from order_matching.order import LimitOrder, MarketOrder, Order
 from order_matching.execution import Execution
 from order_matching.status import Status
 
@@ -27,64 +26,192 @@ from object_lock import ObjectLock
 from global_market import GlobalMarket
 from platformdb import PlatformDB
 from exdb import EXCHANGE_DATABASE
+from order_store import OrderRecord, TimeInForce
 
 from matching_layer import MatchingLayer
-from event_engine import EventEngine, ExchangeEvent
+from sequencer import MarketSequencer, sequenced
+from shard import RemoteMatchingLayer
+from journal import JournalEvent, order_frame, pack_cancel
+from ledger import PositionLedger
+from quotes import QuoteBoard
+from tape import TradeTape
+from risk import RiskCache
 
 
 class MarketManager:
-    def __init__(self, ticker: str):
+    def __init__(self, ticker: str, sequenced=False, shard_pool=None):
         self._ticker = ticker
         self._tradable = True
+        # During a call auction orders only rest, nothing trades until the book is uncrossed
+        self._auction = False
+        # In sequenced mode a single thread owns the engine and callers wait on futures. This fixes the order operations
+        # run in, it does not speed them up: the engine lock is still taken so close() and chticker can stop the market,
+        # and the hand-off to the sequencer thread costs more than an uncontended lock
+        self._sequencer = MarketSequencer(ticker) if sequenced else None
+        self._tape = TradeTape()
+        # IDs come from a block reserved for this market, so tickers never contend on one counter
+        self._order_ids = iter(())
+        self._order_ids_lock = threading.Lock()
 
         ml = None
         with EXCHANGE_DATABASE.assets[ticker] as asset:
-            ml = MatchingLayer(sum([ord(c) for c in ticker]),
-                               last_bid=asset['immediate']['lastBid'],
-                               last_offer=asset['immediate']['lastAsk'])
+            if shard_pool is not None:
+                ml = RemoteMatchingLayer(shard_pool,
+                                         ticker,
+                                         last_bid=asset['immediate']['lastBid'],
+                                         last_offer=asset['immediate']['lastAsk'])
+            else:
+                ml = MatchingLayer(sum([ord(c) for c in ticker]),
+                                   last_bid=asset['immediate']['lastBid'],
+                                   last_offer=asset['immediate']['lastAsk'])
+            QuoteBoard().publish(ticker, asset)
 
         self._engine_lock = ObjectLock(ml)
 
-    def add_limit_order(self, side, size, price, issuer):
-        order = LimitOrder(side=side,
-                           price=price,
-                           size=size,
-                           order_id=GlobalMarket().next_order_index(),
-                           trader_id=issuer,
-                           timestamp=datetime.now(),
-                           expiration=datetime.now() + timedelta(days=365),
-                           price_number_of_digits=2)
+    @sequenced
+    def add_limit_order(self, side, size, price, issuer, tif=TimeInForce.GTC, expires_at=None, reserve=0):
+        return self._add_order(self._new_limit_order(side, size, price, issuer, tif, expires_at, reserve))
+
+    @sequenced
+    def add_market_order(self, side, size, issuer, tif=TimeInForce.GTC, expires_at=None, reserve=0):
+        return self._add_order(self._new_market_order(side, size, issuer, tif, expires_at, reserve))
 
+    def _add_order(self, order):
         with self._engine_lock as engine:
             if not self._tradable:
                 return
             
-            trades = engine.place(order)
+            # A fill-or-kill that can't be filled in full never reaches the book
+            if not self._auction and order.tif == TimeInForce.FOK and not engine.fillable(order):
+                order.status = Status.CANCEL
+                order.size = 0
+                RiskCache().release_order(order, order.left)
+                return order
+
+            trades = engine.rest(order) if self._auction else engine.place(order)
+            self._kill_remainder(order, engine)
             self.update_asset(order, engine)
             GlobalMarket().add_order(self._ticker, order)
-            self.transact(trades=trades, engine=engine)
+            self.transact(trades=trades, engine=engine, placed=(order,))
 
+            if order.status == Status.CANCEL and order.order_id in GlobalMarket().orders:
+                GlobalMarket().remove_order(order.order_id)
+        
         return order
 
-    def add_market_order(self, side, size, issuer):
-        order = MarketOrder(side=side,
-                            size=size,
-                            order_id=GlobalMarket().next_order_index(),
-                            trader_id=issuer,
-                            timestamp=datetime.now(),
-                            expiration=datetime.now() + timedelta(days=365))
+    def _kill_remainder(self, order, engine: MatchingLayer):
+        # Immediate orders never rest, whatever did not trade on arrival is cancelled
+        if order.tif in (TimeInForce.IOC, TimeInForce.FOK) and order.size > 0:
+            # Fills are released by the transaction that follows, only the unmatched rest is given back here
+            RiskCache().release_order(order, order.size)
+            engine.delete(order)
+            order.status = Status.CANCEL
+            order.size = 0
+
+    @sequenced
+    def add_orders(self, specs):
+        # Limit and market orders go into the book in the order they were given
+        return self._add_orders([self._new_limit_order(side, size, price, issuer, reserve=reserve)
+                                 if execution == Execution.LIMIT else
+                                 self._new_market_order(side, size, issuer, reserve=reserve)
+                                 for execution, side, size, price, issuer, reserve in specs])
 
+    def _add_orders(self, orders):
         with self._engine_lock as engine:
             if not self._tradable:
                 return
             
-            trades = engine.place(order)
-            self.update_asset(order, engine)
-            GlobalMarket().add_order(self._ticker, order)
-            self.transact(trades=trades, engine=engine)
-        
-        return order
+            trades = []
+            for order in orders:
+                placed = engine.rest(order) if self._auction else engine.place(order)
+                GlobalMarket().add_order(self._ticker, order)
+                if placed:
+                    trades.extend(placed)
+
+            # Quotes and volumes are only published once the whole batch is in the book
+            self.update_assets(orders, engine)
+            self.transact(trades=trades, engine=engine, placed=orders)
+
+        return orders
+
+    @sequenced
+    def restore_orders(self, orders):
+        # Persisted orders were resting when saved, so they go straight into the book in priority (time) order
+        with self._engine_lock as engine:
+            engine.load(orders)
+            market = GlobalMarket()
+            risk = RiskCache()
+            for order in orders:
+                market.add_order(self._ticker, order)
+                # Restored orders were admitted before the restart, their exposure is held again without a check
+                order.reserve, _ = risk.reserve(order.trader_id, self._ticker, order.side, order.execution,
+                                                order.price, order.left, check=False)
+
+            # A book saved in the middle of an auction comes back crossed
+            max_bid = engine.max_bid()
+            min_offer = engine.min_offer()
+            if max_bid is not None and min_offer is not None and max_bid >= min_offer:
+                self._uncross(engine)
+                return
+
+            with EXCHANGE_DATABASE.assets[self._ticker] as asset:
+                self._publish_quotes(asset, engine)
+                QuoteBoard().publish(self._ticker, asset)
+
+    @sequenced
+    def start_auction(self):
+        with self._engine_lock as _:
+            self._auction = True
 
+    @sequenced
+    def uncross(self):
+        with self._engine_lock as engine:
+            if not self._auction:
+                return None
+
+            return self._uncross(engine)
+
+    def _uncross(self, engine: MatchingLayer):
+        self._auction = False
+        reference = EXCHANGE_DATABASE.assets[self._ticker].get_unsafe()['immediate']['last']
+        price, trades = engine.uncross(reference)
+
+        # Every auction fill is between two resting orders, the buy side is reported as the incoming one
+        orders = GlobalMarket().orders
+        buyers = {}
+        for trade in trades:
+            buyers.__setitem__(trade.incoming_order_id, orders[trade.incoming_order_id])
+
+        self.transact(trades=trades, engine=engine, placed=buyers.values(), auction=True)
+
+        with EXCHANGE_DATABASE.assets[self._ticker] as asset:
+            if price is not None and asset['sessionData']['open'] is None:
+                asset['sessionData']['open'] = price
+            self._publish_quotes(asset, engine)
+            EXCHANGE_DATABASE.journal_market(self._ticker, asset)
+            QuoteBoard().publish(self._ticker, asset)
+
+        return price
+
+    def _new_limit_order(self, side, size, price, issuer, tif=TimeInForce.GTC, expires_at=None, reserve=0):
+        return OrderRecord.limit(self._next_order_id(), self._ticker, issuer, side, price, size, tif, expires_at, reserve)
+
+    def _new_market_order(self, side, size, issuer, tif=TimeInForce.GTC, expires_at=None, reserve=0):
+        return OrderRecord.market(self._next_order_id(), self._ticker, issuer, side, size, tif, expires_at, reserve)
+
+    def _next_order_id(self):
+        # Advancing a range iterator is atomic, the lock is only taken to reserve the next block
+        try:
+            return next(self._order_ids)
+        except StopIteration:
+            with self._order_ids_lock:
+                try:
+                    return next(self._order_ids)
+                except StopIteration:
+                    self._order_ids = iter(GlobalMarket().reserve_order_ids(GlobalMarket.order_id_block))
+                    return next(self._order_ids)
+
+    @sequenced
     def cancel_order(self, order, issuer):
         if order.trader_id != issuer:
             return -2
@@ -93,81 +220,254 @@ class MarketManager:
             engine.delete(order)
             order.status = Status.CANCEL
             order.size = 0
+            RiskCache().release_order(order, order.left)
+            PositionLedger().post(self._ticker, {}, [(JournalEvent.CANCEL, pack_cancel(order.order_id))])
             self.update_asset(order, engine)
             GlobalMarket().remove_order(order.order_id)
 
-    def update_asset(self, order: Order, engine: MatchingLayer):
-        # Assignign variables outside to save on lock time
-        side = 'bids' if order.side == Side.BUY else 'offers'
-        level = str(order.price)
+    @sequenced
+    def amend_order(self, order, issuer, size, price=None):
+        if order.trader_id != issuer:
+            return -2
 
-        with EXCHANGE_DATABASE.assets[self._ticker] as asset:
-            session_data = asset['sessionData']
-            immediate = asset['immediate']
+        with self._engine_lock as engine:
+            if not self._tradable:
+                return
 
-            if order.side == Side.SELL:
-                session_data['sellVolume'] = int(session_data['sellVolume'] + order.size)
-            else:
-                session_data['buyVolume'] = int(session_data['buyVolume'] + order.size)
+            # The order may have traded out or been cancelled since it was looked up
+            if GlobalMarket().orders.get(order.order_id) is not order:
+                return -1
+
+            if price is not None and order.execution == Execution.MARKET:
+                return 'Market orders have no price'
+
+            price = order.price if price is None else price
+            # Unlike new orders the check needs the order's current hold, so it runs under the engine lock
+            reserve, reason = RiskCache().swap(order, order.execution, price, size)
+            if reason is not None:
+                return reason
+
+            # The order keeps its ID and record, only the book and the journal see the change
+            priority = order.priority
+            requeued = not engine.keeps_priority(order, size, price)
+            if requeued:
+                order.priority = self._next_order_id()
+
+            try:
+                trades = engine.amend(order, size, price, rest=self._auction)
+            except Exception:
+                # A shard that refused the change leaves the order as it was, hold included
+                order.priority = priority
+                RiskCache().unswap(order, reserve, size)
+                raise
+
+            order.reserve = reserve
+            # Going to the back of the queue counts as a new order, as it does for a replace
+            self.update_assets((order,) if requeued else (), engine)
+            self.transact(trades=trades, engine=engine, placed=(order,))
 
-            immediate['bid'] = engine.max_bid()
-            immediate['ask'] = engine.min_offer()
-            immediate['mid'] = engine.current_price()
-            immediate['lastBid'] = engine.last_bid()
-            immediate['lastAsk'] = engine.last_offer()
-            immediate['bidVolume'] = engine.max_bid_size()
-            immediate['askVolume'] = engine.min_offer_size()
+        return order
 
-            if not immediate['mid']:
-                immediate['mid'] = immediate['ask']
+    @sequenced
+    def replace_order(self, order, issuer, size, price):
+        if order.trader_id != issuer:
+            return -2
 
-            if not immediate['mid']:
-                immediate['mid'] = immediate['bid']
+        market = GlobalMarket()
+        with self._engine_lock as engine:
+            if not self._tradable:
+                return
 
-            depth = immediate['depth'][side]
+            if market.orders.get(order.order_id) is not order:
+                return -1
 
-            if order.status == Status.CANCEL:
-                depth[level] -= order.left
-                if depth[level] <= 0:
-                    depth.pop(level)
-            elif order.left == order.size:
-                depth.__setitem__(level, depth.setdefault(level, 0) + order.size)
+            replacement = self._new_limit_order(order.side, size, price, issuer, order.tif, order.expires_at)
+            replacement.reserve, reason = RiskCache().swap(order, Execution.LIMIT, price, size)
+            if reason is not None:
+                return reason
 
-            if session_data['open'] == None:
-                session_data['open'] = immediate['mid']
+            # Cancel and new order in a single engine operation, the book never shows neither or both
+            try:
+                trades = engine.replace(order, replacement, rest=self._auction)
+            except Exception:
+                RiskCache().unswap(order, replacement.reserve, size)
+                raise
 
-    def transact(self, trades, engine: MatchingLayer):
-        if trades == None:
-            return
+            order.status = Status.CANCEL
+            order.size = 0
+            market.remove_order(order.order_id)
+            market.add_order(self._ticker, replacement)
+            self.update_asset(replacement, engine)
+            self.transact(trades=trades, engine=engine, placed=(order, replacement))
 
-        users_to_notify = set()
+        return replacement
 
-        for trade in trades:
+    @sequenced
+    def mass_quote(self, issuer, bids, asks):
+        market = GlobalMarket()
+        levels = [(Side.BUY, size, price) for size, price in bids] + [(Side.SELL, size, price) for size, price in asks]
+
+        with self._engine_lock as engine:
+            if not self._tradable:
+                return
+
+            # The quote set is what earlier mass quotes left resting on this ticker, other orders are not touched.
+            # A level quoted again at the same price reuses its order, the rest is cancelled
+            resting = {}
+            stale = []
+            for order in market.orders.of_trader(issuer):
+                if order.ticker != self._ticker or not order.quote:
+                    continue
+
+                if (order.side, order.price) not in resting:
+                    resting.__setitem__((order.side, order.price), order)
+                else:
+                    stale.append(order)
+
+            kept = [resting.pop((side, price), None) for side, _, price in levels]
+            stale.extend(resting.values())
+
+            reserves, reason = RiskCache().requote(issuer, self._ticker,
+                                                   [order for order in kept if order is not None] + stale, levels)
+            if reason is not None:
+                return reason
+
+            engine.delete_many(stale)
+            for order in stale:
+                order.status = Status.CANCEL
+                order.size = 0
+                market.remove_order(order.order_id)
+
+            trades = []
+            quotes = []
+            new_orders = []
+            for (side, size, price), order, reserve in zip(levels, kept, reserves):
+                if order is None:
+                    order = self._new_limit_order(side, size, price, issuer, reserve=reserve)
+                    order.quote = True
+                    placed = engine.rest(order) if self._auction else engine.place(order)
+                    market.add_order(self._ticker, order)
+                    new_orders.append(order)
+                else:
+                    order.reserve = reserve
+                    if not engine.keeps_priority(order, size, price):
+                        order.priority = self._next_order_id()
+                        new_orders.append(order)
+
+                    placed = engine.amend(order, size, price, rest=self._auction)
+
+                trades.extend(placed or ())
+                quotes.append(order)
+
+            # One depth update and one ledger post for the whole set
+            self.update_assets(new_orders, engine)
+            self.transact(trades=trades, engine=engine, placed=stale + quotes)
+
+        return quotes, len(stale)
+
+    @sequenced
+    def expire_orders(self, orders):
+        market = GlobalMarket()
+
+        with self._engine_lock as engine:
+            # Orders may have traded out or been cancelled since they were picked
+            orders = [order for order in orders if market.orders.get(order.order_id) is order and order.size > 0]
+            if len(orders) == 0:
+                return
+
+            engine.delete_many(orders)
+            frames = []
+            risk = RiskCache()
+            for order in orders:
+                order.status = Status.CANCEL
+                order.size = 0
+                risk.release_order(order, order.left)
+                frames.append((JournalEvent.CANCEL, pack_cancel(order.order_id)))
+                market.remove_order(order.order_id)
+
+            PositionLedger().post(self._ticker, {}, frames)
+            self.update_assets((), engine)
+
+    def update_asset(self, order: OrderRecord, engine: MatchingLayer):
+        self.update_assets((order,), engine)
+
+    def update_assets(self, orders, engine: MatchingLayer):
+        # Summed outside to save on lock time
+        buy_volume = 0
+        sell_volume = 0
+        for order in orders:
+            if order.side == Side.SELL:
+                sell_volume += order.size
+            else:
+                buy_volume += order.size
+
+        with EXCHANGE_DATABASE.assets[self._ticker] as asset:
+            session_data = asset['sessionData']
+            session_data['sellVolume'] = int(session_data['sellVolume'] + sell_volume)
+            session_data['buyVolume'] = int(session_data['buyVolume'] + buy_volume)
+            self._publish_quotes(asset, engine)
+            EXCHANGE_DATABASE.journal_market(self._ticker, asset)
+            QuoteBoard().publish(self._ticker, asset)
+
+    def _publish_quotes(self, asset, engine: MatchingLayer):
+        session_data = asset['sessionData']
+        immediate = asset['immediate']
+
+        immediate['bid'] = engine.max_bid()
+        immediate['ask'] = engine.min_offer()
+        immediate['mid'] = engine.current_price()
+        immediate['lastBid'] = engine.last_bid()
+        immediate['lastAsk'] = engine.last_offer()
+        immediate['bidVolume'] = engine.max_bid_size()
+        immediate['askVolume'] = engine.min_offer_size()
+
+        if not immediate['mid']:
+            immediate['mid'] = immediate['ask']
+
+        if not immediate['mid']:
+            immediate['mid'] = immediate['bid']
+
+        # The opening price of an auction session is the uncrossing price
+        if session_data['open'] == None and not self._auction:
+            session_data['open'] = immediate['mid']
+
+    def transact(self, trades, engine: MatchingLayer, placed=(), auction=False):
+        orders = GlobalMarket().orders
+        users_to_notify = set()
+        # Username -> [units, cash], a sweep posts one delta per counterparty no matter how many of its orders it hits
+        deltas = {}
+        book_orders = {}
+        traded_value = 0
+        last = None
+        risk = RiskCache()
+
+        for trade in trades or ():
             sell_order_id = None
             buy_order_id = None
 
-            depth_side = None
-            level = str(trade.price)
-
             match (trade.side):
                 case Side.SELL:
                     sell_order_id = trade.incoming_order_id
                     buy_order_id = trade.book_order_id
-                    depth_side = 'bids'
 
                 case Side.BUY:
                     sell_order_id = trade.book_order_id
                     buy_order_id = trade.incoming_order_id
-                    depth_side = 'offers'
 
-            sell_order: Order = GlobalMarket().orders[sell_order_id]
-            buy_order: Order = GlobalMarket().orders[buy_order_id]
-            book_order: Order = GlobalMarket().orders[trade.book_order_id]
+            sell_order: OrderRecord = orders[sell_order_id]
+            buy_order: OrderRecord = orders[buy_order_id]
+            book_order: OrderRecord = orders[trade.book_order_id]
+            book_orders.__setitem__(book_order.order_id, book_order)
 
             sell_price = sell_order.price
             buy_price = buy_order.price
 
-            if sell_order.execution == Execution.MARKET and buy_order.execution == Execution.MARKET:
+            # Auction fills all settle at the uncrossing price
+            if auction:
+                sell_price = trade.price
+                buy_price = trade.price
+
+            if not auction and sell_order.execution == Execution.MARKET and buy_order.execution == Execution.MARKET:
                 sell_price = engine.last_available_bid()
                 buy_price = engine.last_available_ask()
                 if buy_price < sell_price:
@@ -176,43 +476,30 @@ class MarketManager:
                     sell_price = bp
                 trade.price = buy_price
             else:
-                with EXCHANGE_DATABASE.assets[self._ticker] as asset:
-                    sz = round(trade.price * trade.size, 2)
-                    GlobalMarket().orders[trade.incoming_order_id].fill_cost += sz
-                    asset['sessionData']['tradedValue'] = round(asset['sessionData']['tradedValue'] + sz, 2)
-                    asset['immediate']['last'] = round(trade.price, 2)
-                    d = asset['immediate']['depth'][depth_side]
-                    d[level] -= trade.size
-                    if d[level] <= 0:
-                        d.pop(level)
-            
-            seller = sell_order.trader_id
-            buyer = buy_order.trader_id
+                sz = trade.price * trade.size
+                orders[trade.incoming_order_id].fill_cost += sz
+                # Batched orders can be filled as book orders before their results are reported
+                book_order.fill_cost += sz
+                traded_value += sz
+                last = trade.price
 
             if sell_price <= 0:
                 sell_price = buy_price
             if buy_price == float('inf'):
                 buy_price = sell_price
 
-            with EXCHANGE_DATABASE.users[buyer] as b:
-                assets = b['immediate']['current']['assets']
-                assets[self._ticker] += trade.size
-                if assets[self._ticker] == 0:
-                    assets.pop(self._ticker)
-                b['immediate']['current']['balance'] = round(b['immediate']['current']['balance'] - round(buy_price * trade.size, 2), 2)
-            
-            with EXCHANGE_DATABASE.users[seller] as s:
-                assets = s['immediate']['current']['assets']
-                assets[self._ticker] -= trade.size
-                if assets[self._ticker] == 0:
-                    assets.pop(self._ticker)
-                s['immediate']['current']['balance'] = round(s['immediate']['current']['balance'] + round(sell_price * trade.size, 2), 2)
+            buyer_delta = deltas.setdefault(buy_order.trader_id, [0, 0])
+            buyer_delta[0] += trade.size
+            buyer_delta[1] -= buy_price * trade.size
 
-            EXCHANGE_DATABASE.update_order(buy_order.order_id, buy_order.size)
-            EXCHANGE_DATABASE.update_order(sell_order.order_id, sell_order.size)
+            seller_delta = deltas.setdefault(sell_order.trader_id, [0, 0])
+            seller_delta[0] -= trade.size
+            seller_delta[1] += sell_price * trade.size
 
             buy_order.left -= trade.size
             sell_order.left -= trade.size
+            risk.release_order(buy_order, trade.size)
+            risk.release_order(sell_order, trade.size)
 
             if buy_order.left == 0:
                 GlobalMarket().remove_order(buy_order_id)
@@ -221,13 +508,37 @@ class MarketManager:
 
             if book_order.left < 1:
                 users_to_notify.add(book_order.trader_id)
+            if auction and buy_order.left < 1:
+                users_to_notify.add(buy_order.trader_id)
+
+        if trades:
+            self._tape.record(trades)
 
-        EventEngine().notify_async(users_to_notify, ExchangeEvent.ORDER_FILLED)
+        if last is not None:
+            with EXCHANGE_DATABASE.assets[self._ticker] as asset:
+                asset['sessionData']['tradedValue'] += traded_value
+                asset['immediate']['last'] = last
+                EXCHANGE_DATABASE.journal_market(self._ticker, asset)
+                QuoteBoard().publish(self._ticker, asset)
+
+        # Accounts are updated by the ledger, matching never waits on user locks
+        changed = list(book_orders.values()) + list(placed)
+        frames = [order_frame(order) for order in changed]
+        for order in changed:
+            EXCHANGE_DATABASE.orders.touch(order.order_id)
+        risk.pending(self._ticker, deltas)
+        PositionLedger().post(self._ticker, deltas, frames, users_to_notify)
+
+    @sequenced
+    def depth(self, levels=None):
+        with self._engine_lock as engine:
+            return engine.snapshot(levels)
 
     def close(self, delete=False):
         if delete:
-            for order_id in EXCHANGE_DATABASE.orders.copy():
-                self.cancel_order(GlobalMarket().orders[order_id], GlobalMarket().orders[order_id].trader_id)
+            for order in EXCHANGE_DATABASE.orders:
+                if order.ticker == self._ticker:
+                    self.cancel_order(order, order.trader_id)
 
         self._engine_lock._lock.acquire()
 
@@ -237,6 +548,7 @@ class MarketManager:
                 with open(f'{self._ticker}.save.json', 'w') as file:
                     file.write(json.dumps(PlatformDB.to_dict(asset)))
                 EXCHANGE_DATABASE.assets.pop(self._ticker)
+                QuoteBoard().remove(self._ticker)
                 EXCHANGE_DATABASE.asset_classes[asset['info']['class']].remove(self._ticker)
         self._tradable = False
         return self._engine_lock._lock
@@ -244,3 +556,11 @@ class MarketManager:
     def open(self):
         with self._engine_lock as _:
             self._tradable = True
+
+    @property
+    def sequencer(self):
+        return self._sequencer
+
+    @property
+    def tape(self):
+        return self._tape
@@ -1,33 +1,40 @@
-from order_matching.matching_engine import MatchingEngine
-from order_matching.side import Side
-from order_matching.order import Order
-from order_matching.orders import Orders
+from order_store import OrderRecord
+
+from order_book import OrderBook
 
 
 class MatchingLayer:
     def __init__(self, seed: int, last_bid=None, last_offer=None) -> None:
-        self._engine = MatchingEngine(seed)
-        self._max_bid = None
-        self._min_offer = None
-        self._max_bid_size = None
-        self._min_offer_size = None
+        self._book = OrderBook()
         self._last_bid = last_bid
         self._last_offer = last_offer
-        self._max_bid_ids = []
-        self._min_offer_ids = []
 
     def max_bid(self):
-        return self._max_bid
+        best = self._book.bids.best()
+        if best is None or best.price == float('inf'):
+            return None
+        return best.price
     
     def min_offer(self):
-        return self._min_offer
+        best = self._book.offers.best()
+        if best is None:
+            return None
+        return best.price
     
     def max_bid_size(self):
-        return self._max_bid_size
+        best = self._book.bids.best()
+        return best.size if best is not None else None
     
     def min_offer_size(self):
-        return self._min_offer_size
+        best = self._book.offers.best()
+        return best.size if best is not None else None
     
+    def sequence(self):
+        return self._book.sequence
+
+    def snapshot(self, levels=None):
+        return self._book.snapshot(levels)
+
     def last_bid(self):
         return self._last_bid
     
@@ -35,15 +42,24 @@ class MatchingLayer:
         return self._last_offer
 
     def current_price(self):
-        return round((self._max_bid + self._min_offer) / 2, 2) \
-                        if self._max_bid != None and self._min_offer != None else None
+        max_bid = self.max_bid()
+        min_offer = self.min_offer()
+        return (max_bid + min_offer) // 2 \
+                        if max_bid != None and min_offer != None else None
     
     def imbalance(self):
-        return self._engine.unprocessed_orders.get_imbalance()
+        bid_size = self.max_bid_size() or 0
+        offer_size = self.min_offer_size() or 0
+        if bid_size + offer_size == 0:
+            return 0
+        return (bid_size - offer_size) / (bid_size + offer_size)
     
     def last_available_bid(self):
-        if self._max_bid != None and self._min_offer != None:
-            return self._max_bid
+        max_bid = self.max_bid()
+        min_offer = self.min_offer()
+
+        if max_bid != None and min_offer != None:
+            return max_bid
         
         if self._last_bid != None and self._last_offer != None:
             return self._last_bid
@@ -51,123 +67,72 @@ class MatchingLayer:
         return 0
     
     def last_available_ask(self):
-        if self._max_bid != None and self._min_offer != None:
-            return self._min_offer
+        max_bid = self.max_bid()
+        min_offer = self.min_offer()
+
+        if max_bid != None and min_offer != None:
+            return min_offer
         
         if self._last_bid != None and self._last_offer != None:
             return self._last_offer
         
         return 0
 
-    def place(self, order: Order):
+    def place(self, order: OrderRecord):
         order.left = order.size
         order.fill_cost = 0
 
-        if not self._matching_order_exists(order):
-            self._engine.unprocessed_orders.append(order)
-            self._update_quotes_unmatched(order)
+        if not self._book.crosses(order):
+            self._book.append(order)
             return
         
-        match (order.side):
-            case Side.SELL:
-                self._max_bid_size -= order.size
+        self._last_bid = self.max_bid()
+        self._last_offer = self.min_offer()
+        return self._book.match(order)
+    
+    def rest(self, order: OrderRecord):
+        # Auction orders join the book without matching
+        order.left = order.size
+        order.fill_cost = 0
+        self._book.append(order)
 
-            case Side.BUY:
-                self._min_offer_size -= order.size
+    @staticmethod
+    def keeps_priority(order: OrderRecord, size: int, price):
+        # A smaller size at the same price keeps priority, anything else goes to the back of the queue
+        return price == order.price and size <= order.size
 
-        trades = self._engine.match(order.timestamp, Orders([order]))
-        self._update_quotes_matched(order)
+    def amend(self, order: OrderRecord, size: int, price, rest=False):
+        if self.keeps_priority(order, size, price):
+            # Only the size changes, what the order already filled stays on it
+            self._book.reduce(order, size)
+            order.left = size
+            return None
 
-        if order.size > 0:
-            self._update_quotes_unmatched(order)
+        self._book.remove(order)
+        order.price = price
+        order.size = size
+        return self.rest(order) if rest else self.place(order)
 
-        return trades.trades
-    
-    def delete(self, order: Order):
-        self._engine.unprocessed_orders.remove(order)
-        if int(order.order_id) not in self._max_bid_ids and int(order.order_id) not in self._min_offer_ids:
-            return
+    def replace(self, order: OrderRecord, replacement: OrderRecord, rest=False):
+        self._book.remove(order)
+        return self.rest(replacement) if rest else self.place(replacement)
 
-        match (order.side):
-            case Side.SELL:
-                self._min_offer_ids.remove(int(order.order_id))
-                self._min_offer_size -= order.size
-                self._recompute_offers()
-
-            case Side.BUY:
-                self._max_bid_ids.remove(int(order.order_id))
-                self._max_bid_size -= order.size
-                self._recompute_bids()
-        self._fix_quotes()
-
-    def _matching_order_exists(self, order: Order):
-        match (order.side):
-            case Side.SELL:
-                return self._max_bid != None and self._max_bid >= order.price
-            
-            case Side.BUY:
-                return self._min_offer != None and self._min_offer <= order.price
-            
-    def _update_quotes_unmatched(self, order: Order):
-        match (order.side):
-            case Side.SELL:
-                if order.price == self._min_offer:
-                    self._min_offer_size += order.size
-                    self._min_offer_ids.append(int(order.order_id))
-
-                if self._min_offer == None or order.price < self._min_offer:
-                    self._min_offer = order.price
-                    self._min_offer_size = order.size
-                    self._min_offer_ids = [int(order.order_id),]
-
-            case Side.BUY:
-                if order.price == self._max_bid:
-                    self._max_bid_size += order.size
-                    self._max_bid_ids.append(int(order.order_id))
-
-                if self._max_bid == None or order.price > self._max_bid:
-                    self._max_bid = order.price
-                    self._max_bid_size = order.size
-                    self._max_bid_ids = [int(order.order_id),]
-        self._fix_quotes()
-    
-    def _update_quotes_matched(self, order: Order):
-        self._last_bid = self._max_bid
-        self._last_offer = self._min_offer
-        
-        match (order.side):
-            case Side.SELL:
-                self._recompute_bids()
-
-            case Side.BUY:
-                self._recompute_offers()
-
-        self._fix_quotes()
-
-    def _recompute_bids(self):
-        if self._max_bid_size <= 0:
-            self._max_bid = self._engine.unprocessed_orders.max_bid
-            if self._max_bid in self._engine.unprocessed_orders.bids:
-                orders = self._engine.unprocessed_orders.bids[self._max_bid]
-                self._max_bid_size = sum([o.size for o in orders])
-                self._max_bid_ids = [int(o.order_id) for o in orders]
-            else:
-                self._max_bid_size = None
-                self._max_bid_ids = []
-
-    def _recompute_offers(self):
-        if self._min_offer_size <= 0:
-            self._min_offer = self._engine.unprocessed_orders.min_offer
-            if self._min_offer in self._engine.unprocessed_orders.offers:
-                orders = self._engine.unprocessed_orders.offers[self._min_offer]
-                self._min_offer_size = sum([o.size for o in orders])
-                self._min_offer_ids = [int(o.order_id) for o in orders]
-            else:
-                self._min_offer_size = None
-                self._min_offer_ids = []
-
-    def _fix_quotes(self):
-        if self._max_bid == float('inf') or self._max_bid == float('nan') or self._max_bid_size == None or self._max_bid_size <= 0:
-            self._max_bid = None
-        if self._min_offer_size == float('inf') or self._min_offer == float('nan') or self._min_offer_size == None or self._min_offer_size <= 0:
-            self._min_offer = None
+    def uncross(self, reference=None):
+        return self._book.uncross(reference)
+
+    def load(self, orders):
+        for order in orders:
+            order.left = order.size
+            order.fill_cost = 0
+
+        self._book.load(orders)
+
+    def fillable(self, order: OrderRecord):
+        return self._book.fillable(order)
+
+    def delete(self, order: OrderRecord):
+        self._book.remove(order)
+
+    def delete_many(self, orders):
+        for order in orders:
+            self._book.remove(order)
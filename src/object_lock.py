@@ -19,12 +19,27 @@ import threading
 
 
 class ObjectLock:
+    # Snapshot being taken, if any. It gets a copy of a record before the first change made after it started
+    snapshot = None
+
     def __init__(self, target) -> None:
         self._target = target
         self._lock = threading.Lock()
+        # Bumped every time the lock is taken, snapshots compare it to find what changed.
+        # Bumping on the way in means a change still in progress already counts
+        self.version = 0
+        # (table, key) the record is stored under, for stores that write records one by one
+        self.row = None
 
     def __enter__(self):
         self._lock.acquire()
+        snapshot = ObjectLock.snapshot
+        if snapshot is not None:
+            snapshot.capture(self)
+        self.version += 1
+        row = self.row
+        if row is not None:
+            row[0].touch(row[1])
         return self._target
 
     def __exit__(self, *args, **kwargs):
@@ -0,0 +1,360 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from heapq import heapify, heappop, heappush
+from collections import OrderedDict
+
+from order_matching.side import Side
+from order_matching.execution import Execution
+from order_store import OrderRecord
+
+
+class Trade:
+    __slots__ = ('side', 'price', 'size', 'incoming_order_id', 'book_order_id', 'execution')
+
+    def __init__(self, side, price, size, incoming_order_id, book_order_id, execution) -> None:
+        self.side = side
+        self.price = price
+        self.size = size
+        self.incoming_order_id = incoming_order_id
+        self.book_order_id = book_order_id
+        self.execution = execution
+
+
+class PriceLevel:
+    __slots__ = ('price', 'orders', 'size')
+
+    def __init__(self, price) -> None:
+        self.price = price
+        self.orders = OrderedDict()
+        self.size = 0
+
+    def append(self, order: OrderRecord):
+        self.orders.__setitem__(order.order_id, order)
+        self.size += order.size
+
+    def remove(self, order: OrderRecord):
+        self.orders.pop(order.order_id)
+        self.size -= order.size
+
+    def first(self) -> OrderRecord:
+        return next(iter(self.orders.values()))
+
+
+class BookSide:
+    def __init__(self, side: Side) -> None:
+        self._side = side
+        self._levels = {}
+        # Max-heap of priority keys, stored negated. Offers are keyed by their negated price so that both sides
+        # share the same layout. Dropped levels stay in the heap until they reach the top or the heap is rebuilt
+        self._heap = []
+
+    def _key(self, price):
+        return price if self._side == Side.BUY else -price
+
+    def best(self) -> PriceLevel:
+        heap = self._heap
+        while len(heap) > 0:
+            level = self._levels.get(-heap[0])
+            if level is not None:
+                return level
+            heappop(heap)
+
+        return None
+
+    def level(self, price) -> PriceLevel:
+        return self._levels.get(self._key(price))
+
+    def levels(self):
+        # Every level best first, for auctions and full depth snapshots
+        for key in sorted(self._levels, reverse=True):
+            yield self._levels[key]
+
+    def walk(self):
+        # Best first for callers that mostly stop after a few levels, the walk pops a copy of the heap as it goes
+        # instead of sorting every key up front. A level that came back while its dead entry was still in the heap
+        # shows up twice in a row, the second one is skipped
+        heap = self._heap.copy()
+        last = None
+        while len(heap) > 0:
+            key = -heappop(heap)
+            level = self._levels.get(key)
+            if level is not None and key != last:
+                last = key
+                yield level
+
+    def append(self, order: OrderRecord, keep_sorted=True) -> PriceLevel:
+        key = self._key(order.price)
+        level = self._levels.get(key)
+
+        if level is None:
+            level = PriceLevel(order.price)
+            self._levels.__setitem__(key, level)
+            if keep_sorted:
+                self._push(key)
+
+        level.append(order)
+        return level
+
+    def remove(self, order: OrderRecord, level: PriceLevel):
+        level.remove(order)
+
+        if len(level.orders) == 0:
+            self._levels.pop(self._key(level.price))
+
+    def sort(self):
+        self._heap = [-key for key in self._levels]
+        heapify(self._heap)
+
+    def pop_best(self):
+        self._levels.pop(-heappop(self._heap))
+
+    def _push(self, key):
+        # A level that comes back while its old entry is still in the heap would be listed twice, so the heap is
+        # rebuilt once dead entries outnumber the live ones
+        if len(self._heap) > 2 * len(self._levels) + 16:
+            self.sort()
+        else:
+            heappush(self._heap, -key)
+
+    def __len__(self):
+        return len(self._levels)
+
+
+class OrderBook:
+    def __init__(self) -> None:
+        self.bids = BookSide(Side.BUY)
+        self.offers = BookSide(Side.SELL)
+        # Order ID -> resting level, lets cancels skip the price lookup and queue scan
+        self._handles = {}
+        self.sequence = 0
+
+    def side_of(self, order: OrderRecord) -> BookSide:
+        return self.bids if order.side == Side.BUY else self.offers
+
+    def opposite_of(self, order: OrderRecord) -> BookSide:
+        return self.offers if order.side == Side.BUY else self.bids
+
+    def crosses(self, order: OrderRecord):
+        best = self.opposite_of(order).best()
+        if best is None:
+            return False
+
+        if order.side == Side.BUY:
+            return order.price >= best.price
+        return order.price <= best.price
+
+    def fillable(self, order: OrderRecord):
+        # Whether the resting liquidity the order crosses covers all of it
+        available = 0
+        for level in self.opposite_of(order).walk():
+            if order.side == Side.BUY and order.price < level.price:
+                break
+            if order.side == Side.SELL and order.price > level.price:
+                break
+
+            available += level.size
+            if available >= order.size:
+                return True
+
+        return False
+
+    def append(self, order: OrderRecord):
+        self._handles.__setitem__(order.order_id, self.side_of(order).append(order))
+        self.sequence += 1
+
+    def load(self, orders):
+        # Bulk insert for orders that are known not to cross, levels are only sorted once at the end
+        for order in orders:
+            self._handles.__setitem__(order.order_id, self.side_of(order).append(order, keep_sorted=False))
+
+        self.bids.sort()
+        self.offers.sort()
+        self.sequence += 1
+
+    def remove(self, order: OrderRecord):
+        level = self._handles.pop(order.order_id, None)
+        if level is None:
+            return False
+
+        self.side_of(order).remove(order, level)
+        self.sequence += 1
+        return True
+
+    def reduce(self, order: OrderRecord, size: int):
+        # Shrinking in place keeps the order's place in its queue, only the level total moves
+        level = self._handles[order.order_id]
+        level.size -= order.size - size
+        order.size = size
+        self.sequence += 1
+
+    def snapshot(self, levels=None):
+        return {
+            'sequence': self.sequence,
+            'bids': self._ladder(self.bids, levels),
+            'offers': self._ladder(self.offers, levels)
+        }
+
+    def _ladder(self, side: BookSide, levels):
+        ladder = []
+
+        for level in side.levels() if levels is None else side.walk():
+            if levels is not None and len(ladder) >= levels:
+                break
+
+            # Resting market orders sit at 0 or inf and have no place on a price ladder
+            if level.price == float('inf') or level.price <= 0:
+                continue
+
+            ladder.append([level.price, level.size])
+
+        return ladder
+
+    def uncross(self, reference=None):
+        # Auction books rest crossed, they are cleared here at the single price that trades the most.
+        # Ties go to the smallest surplus, then to the price closest to the reference
+        bids = list(self.bids.levels())
+        bids.reverse()
+        offers = list(self.offers.levels())
+
+        prices = set([level.price for level in bids + offers if 0 < level.price < float('inf')])
+        if reference is not None:
+            prices.add(reference)
+
+        demand = sum([level.size for level in bids])
+        supply = 0
+        b = 0
+        o = 0
+        best = None
+
+        for price in sorted(prices):
+            while b < len(bids) and bids[b].price < price:
+                demand -= bids[b].size
+                b += 1
+            while o < len(offers) and offers[o].price <= price:
+                supply += offers[o].size
+                o += 1
+
+            volume = min(demand, supply)
+            if volume == 0:
+                continue
+
+            rank = (volume, -abs(demand - supply), -abs(price - reference) if reference is not None else 0)
+            if best is None or rank > best[0]:
+                best = (rank, price, volume)
+
+        if best is None:
+            return None, []
+
+        _, price, volume = best
+        buys = self._allocate(self.bids, volume)
+        sells = self._allocate(self.offers, volume)
+        self.sequence += 1
+
+        trades = []
+        b = 0
+        o = 0
+        while b < len(buys) and o < len(sells):
+            size = min(buys[b][1], sells[o][1])
+            trades.append(Trade(Side.BUY, price, size, buys[b][0].order_id, sells[o][0].order_id, Execution.LIMIT))
+
+            buys[b][1] -= size
+            sells[o][1] -= size
+            if buys[b][1] == 0:
+                b += 1
+            if sells[o][1] == 0:
+                o += 1
+
+        return price, trades
+
+    def _allocate(self, side: BookSide, volume):
+        # Takes volume off the side in price-time priority, returns [order, size] pairs
+        allocations = []
+
+        while volume > 0:
+            level = side.best()
+            queue = level.orders
+            level_fill = 0
+
+            while volume > 0 and len(queue) > 0:
+                order = level.first()
+                size = min(volume, order.size)
+                allocations.append([order, size])
+
+                order.size -= size
+                volume -= size
+                level_fill += size
+
+                if order.size <= 0:
+                    queue.popitem(last=False)
+                    self._handles.pop(order.order_id)
+
+            level.size -= level_fill
+            if len(queue) == 0:
+                side.pop_best()
+
+        return allocations
+
+    def __contains__(self, order_id):
+        return order_id in self._handles
+
+    def __len__(self):
+        return len(self._handles)
+
+    def match(self, order: OrderRecord):
+        opposite = self.opposite_of(order)
+        trades = []
+        self.sequence += 1
+
+        while order.size > 0 and self.crosses(order):
+            level = opposite.best()
+            queue = level.orders
+            # Level totals are settled once per swept level rather than once per fill
+            level_fill = 0
+
+            while order.size > 0 and len(queue) > 0:
+                book_order = level.first()
+                size = min(order.size, book_order.size)
+
+                # Resting market orders accept any price, so they trade at the incoming limit
+                price = book_order.price
+                if book_order.execution == Execution.MARKET and order.execution == Execution.LIMIT:
+                    price = order.price
+
+                trades.append(Trade(order.side,
+                                    price,
+                                    size,
+                                    order.order_id,
+                                    book_order.order_id,
+                                    order.execution))
+
+                order.size -= size
+                book_order.size -= size
+                level_fill += size
+
+                if book_order.size <= 0:
+                    queue.popitem(last=False)
+                    self._handles.pop(book_order.order_id)
+
+            level.size -= level_fill
+            if len(queue) == 0:
+                opposite.pop_best()
+
+        if order.size > 0:
+            self.append(order)
+
+        return trades
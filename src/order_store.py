@@ -0,0 +1,146 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+
+from order_matching.side import Side
+from order_matching.execution import Execution
+from order_matching.status import Status
+
+
+class TimeInForce:
+    GTC = 0
+    DAY = 1
+    GTD = 2
+    IOC = 3
+    FOK = 4
+
+    NAMES = ['GTC', 'DAY', 'GTD', 'IOC', 'FOK']
+
+
+class OrderRecord:
+    __slots__ = ('order_id', 'ticker', 'trader_id', 'side', 'execution', 'price', 'size', 'left', 'fill_cost', 'status',
+                 'tif', 'expires_at', 'reserve', 'priority', 'quote')
+
+    def __init__(self, order_id: int, ticker: str, trader_id: str, side: Side, execution: Execution, price, size,
+                 tif=TimeInForce.GTC, expires_at=None, reserve=0, priority=None) -> None:
+        self.order_id = order_id
+        self.ticker = ticker
+        self.trader_id = trader_id
+        self.side = side
+        self.execution = execution
+        self.price = price
+        self.size = size
+        self.left = size
+        self.fill_cost = 0
+        self.status = Status.OPEN
+        self.tif = tif
+        # Epoch seconds, only GTD orders have one
+        self.expires_at = expires_at
+        # Cash held by the risk cache for each unit still open, only buys hold any
+        self.reserve = reserve
+        # Place in time order, drawn from the order IDs. An amend that loses its queue position draws a new one
+        self.priority = order_id if priority is None else priority
+        # Placed by a mass quote, the next mass quote replaces it
+        self.quote = False
+
+    @staticmethod
+    def limit(order_id: int, ticker: str, trader_id: str, side: Side, price, size, tif=TimeInForce.GTC, expires_at=None, reserve=0):
+        return OrderRecord(order_id, ticker, trader_id, side, Execution.LIMIT, price, size, tif, expires_at, reserve)
+
+    @staticmethod
+    def market(order_id: int, ticker: str, trader_id: str, side: Side, size, tif=TimeInForce.GTC, expires_at=None, reserve=0):
+        return OrderRecord(order_id, ticker, trader_id, side, Execution.MARKET,
+                           float('inf') if side == Side.BUY else 0, size, tif, expires_at, reserve)
+
+    def to_dict(self):
+        return {
+            'execution': 'LIMIT' if self.execution == Execution.LIMIT else 'MARKET',
+            'ticker': self.ticker,
+            'issuer': self.trader_id,
+            'side': 'BUY' if self.side == Side.BUY else 'SELL',
+            'size': self.size,
+            'price': self.price,
+            'tif': TimeInForce.NAMES[self.tif],
+            'expiresAt': self.expires_at,
+            'priority': self.priority,
+            'quote': self.quote
+        }
+
+
+class OrderStore:
+    def __init__(self) -> None:
+        self._orders = {}
+        self._by_trader = {}
+        # IDs of the orders added, changed or removed since the last drain, snapshots only write those
+        self._changed = set()
+        self._changed_lock = threading.Lock()
+
+    def add(self, order: OrderRecord):
+        self._orders.__setitem__(order.order_id, order)
+        self._by_trader.setdefault(order.trader_id, {}).__setitem__(order.order_id, order)
+        self.touch(order.order_id)
+
+    def pop(self, order_id: int) -> OrderRecord:
+        order = self._orders.pop(order_id)
+        trader_orders = self._by_trader[order.trader_id]
+        trader_orders.pop(order_id)
+
+        if len(trader_orders) == 0:
+            self._by_trader.pop(order.trader_id)
+
+        self.touch(order_id)
+        return order
+
+    def get(self, order_id: int, default=None) -> OrderRecord:
+        return self._orders.get(order_id, default)
+
+    def of_trader(self, trader_id: str):
+        return list(self._by_trader.get(trader_id, {}).values())
+
+    def rename_trader(self, trader_id: str, new_trader_id: str):
+        trader_orders = self._by_trader.pop(trader_id, {})
+        for order in trader_orders.values():
+            order.trader_id = new_trader_id
+            self.touch(order.order_id)
+
+        if len(trader_orders) > 0:
+            self._by_trader.__setitem__(new_trader_id, trader_orders)
+
+    def touch(self, order_id: int):
+        with self._changed_lock:
+            self._changed.add(order_id)
+
+    def drain(self):
+        with self._changed_lock:
+            changed, self._changed = self._changed, set()
+        return changed
+
+    def to_dict(self):
+        return {str(order_id): order.to_dict() for order_id, order in self._orders.copy().items()}
+
+    def __getitem__(self, order_id: int) -> OrderRecord:
+        return self._orders[order_id]
+
+    def __contains__(self, order_id: int):
+        return order_id in self._orders
+
+    def __iter__(self):
+        return iter(list(self._orders.values()))
+
+    def __len__(self):
+        return len(self._orders)
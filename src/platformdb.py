@@ -18,15 +18,70 @@
 import json
 import logging
 import os
+import threading
 
 from object_lock import ObjectLock
 from repeated_timer import RepeatedTimer
+from snapshot_codec import JSONCodec, BinaryCodec
+
+
+# Leaves of a record, both walks copy them without looking any further
+_PLAIN = {int, float, str, bool, list, type(None)}
+
+
+class RecordSnapshot:
+    # Copy on write image of the records at a cut, a record is copied by the first writer to take its lock after
+    # the cut, or by the save itself if nobody did
+    def __init__(self, clean: dict, codec) -> None:
+        # id(record) -> version the last save wrote, a record still there needs no copy
+        self._clean = clean
+        self._codec = codec
+        # id(record) -> (version, image), the image is None for clean records
+        self._images = {}
+        self.members = {}
+
+    def capture(self, record: ObjectLock):
+        # Called with the lock of the record held
+        if id(record) in self._images or not isinstance(record.get_unsafe(), dict):
+            return
+
+        if self._clean.get(id(record)) == record.version:
+            self._images.__setitem__(id(record), (record.version, None))
+            return
+
+        self._images.__setitem__(id(record), (record.version, PlatformDB.to_dict(record.get_unsafe(), lock=True,
+                                                                                         codec=self._codec)))
+
+    def image(self, record: ObjectLock):
+        # Taking the raw lock does not count as a change
+        with record.lock:
+            self.capture(record)
+        return self._images[id(record)]
 
 
 class PlatformDB:
-    def __init__(self, filename='platformdb.json', schema={}, default={}) -> None:
+    # Saves between two full images, the ones in between only append the records that changed to the delta log
+    compact_every = 20
+    # Generations of full images kept on disk, newest first. Each one keeps its delta log next to it,
+    # .new is only ever left behind by older versions that crashed while saving
+    generations = ['.new', '', '.old']
+
+    def __init__(self, filename='platformdb.json', schema={}, default={}, journal=None, codec=None) -> None:
         self._filename = filename
         self._schema = schema
+        self._journal = journal
+        self._codec = codec if codec is not None else JSONCodec()
+        # Full image the delta log applies to, deltas written against an older one are ignored
+        self._generation = 0
+        self._deltas = 0
+        # (top level key, record key) -> (record, version) as of the last save
+        self._saved = {}
+        # Top level key -> keys drained at the last cut from the stores that track their own changes
+        self._changed = {}
+        # Journal segment of the newest full image, and the oldest segment a generation on disk may still replay from
+        self._image_segment = 0
+        self._kept_segment = 0
+        self._save_lock = threading.Lock()
         self._db = self._load()
         
         if self._db == {}:
@@ -42,36 +97,74 @@ class PlatformDB:
             logging.warning('Empty PlatformDB Database!')
             return {}
 
+        self._generation = l.pop('__PLATFORMDB_GENERATION__', 0)
+        self._image_segment = l.get('journalSegment', 0)
+        self._apply_deltas(l)
         return self._get_items(l)
+
+    def _apply_deltas(self, loaded: dict):
+        # A crash while rotating generations can leave the deltas of the image being loaded in either log,
+        # only the ones written against it are applied
+        deltas = []
+        for suffix in ('', '.old'):
+            try:
+                with open(self._filename + suffix + '.delta', 'rb') as file:
+                    deltas.extend(self._codec.entries(file.read()))
+            except:
+                continue
+
+        for delta in deltas:
+            if delta['base'] != self._generation:
+                continue
+
+            for key, records in delta['records'].items():
+                loaded.setdefault(key, {}).update(records)
+            for key, record_keys in delta['removed'].items():
+                for record_key in record_keys:
+                    loaded.get(key, {}).pop(record_key, None)
+            loaded.update(delta['state'])
     
     def _get_content(self):
-        f = None
-        file_extensions = ['.new', '', '.old']
-
-        for fext in file_extensions:
-            f = self._load_from_file(self._filename + fext)
+        # Newest generation that reads back whole
+        for suffix in self.generations:
+            f = self._load_from_file(self._filename + suffix)
             if f is not None:
-                break
-        
-        return f
+                if suffix != '':
+                    logging.warning(f'Loading PlatformDB from {self._filename + suffix}')
+                return f
+
+        return None
 
     def _load_from_file(self, filename):
         try:
-            with open(filename, 'r') as f:
-                return dict(json.loads(f.read()))
-        except:
+            with open(filename, 'rb') as f:
+                return dict(self._codec.loads(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f'Cannot read {filename}: {e}')
             return None
         
     def _get_items(self, loaded: dict, schema=None, depth=0):
         sc = self._schema if schema is None else schema
         result = sc.copy() if depth > 1 else {}
 
-        for key in loaded.keys():
-            if isinstance(loaded[key], dict):
-                result.__setitem__(key, self._get_items(loaded[key], depth=depth + 1, schema=sc[key] if key in sc.keys() else sc))
+        for key, value in loaded.items():
+            if type(value) in _PLAIN:
+                result[key] = value
+                continue
+
+            # Locked records the codec keeps apart from plain dicts
+            if isinstance(value, tuple):
+                record = self._get_items(value[0], depth=depth + 1, schema=sc[key] if key in sc else sc)
+                result[key] = ObjectLock(dict(record))
+                continue
+
+            if isinstance(value, dict):
+                result[key] = self._get_items(value, depth=depth + 1, schema=sc[key] if key in sc else sc)
                 continue
 
-            result.__setitem__(key, loaded[key])
+            result[key] = value
         
         if '__PLATFORMDB_LOCK__' in result.keys():
             pl = result.pop('__PLATFORMDB_LOCK__')
@@ -80,49 +173,217 @@ class PlatformDB:
         return result
 
     def save(self):
-        new_json = json.dumps(PlatformDB.to_dict(self._db.copy()))
-        if not os.path.exists(self._filename):
-            with open(self._filename, 'w') as file:
-                file.write(new_json)
-            return
+        # Saves can be started by the timer and by hand at the same time, only one cuts the journal
+        with self._save_lock:
+            self._save()
 
-        with open(self._filename + '.new', 'w') as new_file:
-            new_file.write(new_json)
-        
-        old_json = ''
-        with open(self._filename, 'r') as file:
-            old_json = str(file.read())
+    def _save(self):
+        full = len(self._saved) == 0 or self._deltas >= self.compact_every
+        snapshot = RecordSnapshot({} if full else self._clean(), self._codec)
+
+        try:
+            if self._journal is not None:
+                # Every event before the rotation is in this snapshot, a change still in progress at the cut may be
+                # too and is replayed again over it
+                segment, sequence = self._journal.rotate(lambda: self._cut(snapshot))
+                for db in (self._db, snapshot.members):
+                    db.__setitem__('journalSegment', segment)
+                    db.__setitem__('journalSequence', sequence)
+            else:
+                self._cut(snapshot)
+
+            self._persist(snapshot, full)
+        except:
+            # Nothing was written, the next save picks these changes up again
+            for key, record_keys in self._changed.items():
+                for record_key in record_keys:
+                    self._db[key].touch(record_key)
+            raise
+        finally:
+            ObjectLock.snapshot = None
+
+        # The .old image and its deltas can still be loaded, every segment from its image on is kept
+        if self._journal is not None:
+            self._journal.discard(self._kept_segment)
+
+    def _clean(self):
+        # Records still saved under the same key, their image is only needed if they change again
+        clean = {}
+        for (key, record_key), (record, version) in self._saved.items():
+            if version is not None and self._db.get(key, {}).get(record_key) is record:
+                clean.__setitem__(id(record), version)
+        return clean
 
-        with open(self._filename + '.old', 'w') as old_file:
-            old_file.write(old_json)
+    def _cut(self, snapshot):
+        snapshot.members = {key: value.copy() if isinstance(value, dict) else value for key, value in self._db.items()}
+        self._changed = {key: value.drain() for key, value in self._db.items() if hasattr(value, 'drain')}
+        ObjectLock.snapshot = snapshot
 
-        with open(self._filename, 'w') as file:
-            file.write(new_json)
+    def _persist(self, snapshot, full):
+        if full:
+            self._save_full(snapshot)
+        else:
+            self._save_delta(snapshot)
 
-        os.remove(self._filename + '.new')
+    def _save_full(self, snapshot):
+        # The first save of a process is always full, records changed while loading were never versioned
+        records, _, state, saved = self._changes(snapshot, {}, full=True)
+        state.update(records)
+        state.__setitem__('__PLATFORMDB_GENERATION__', self._generation + 1)
+        self._write(self._codec.dumps(state))
+
+        self._generation += 1
+        self._deltas = 0
+        self._saved = saved
+        self._kept_segment, self._image_segment = self._image_segment, snapshot.members.get('journalSegment', 0)
+
+    def _save_delta(self, snapshot):
+        records, removed, state, saved = self._changes(snapshot, self._saved)
+        delta = {
+            'base': self._generation,
+            'records': records,
+            'removed': removed,
+            'state': state
+        }
+
+        with open(self._filename + '.delta', 'ab') as file:
+            file.write(self._codec.entry(delta))
+            file.flush()
+            os.fsync(file.fileno())
+
+        self._deltas += 1
+        self._saved = saved
+
+    def _changes(self, snapshot, previous: dict, full=False):
+        # Records of top level dicts are written only if they are new or their lock was taken since the last save,
+        # stores that track their own changes only write the records they touched. Everything else is small
+        # and always written in full
+        records = {}
+        removed = {}
+        state = {}
+        saved = {}
+
+        for key, value in snapshot.members.items():
+            if key in self._changed:
+                if full:
+                    records.__setitem__(key, value.to_dict())
+                    continue
+
+                changed = {}
+                for record_key in self._changed[key]:
+                    record = value.get(record_key)
+                    if record is None:
+                        removed.setdefault(key, []).append(str(record_key))
+                    else:
+                        changed.__setitem__(str(record_key), record.to_dict())
+                records.__setitem__(key, changed)
+                continue
+
+            if not isinstance(value, dict):
+                state.__setitem__(key, PlatformDB.to_dict({key: value}, codec=self._codec)[key])
+                continue
+
+            changed = {}
+            for record_key, record in value.items():
+                if not isinstance(record, ObjectLock):
+                    saved.__setitem__((key, record_key), (record, None))
+                    changed.__setitem__(record_key, PlatformDB.to_dict({record_key: record}, codec=self._codec)[record_key])
+                    continue
+
+                version, image = snapshot.image(record)
+                saved.__setitem__((key, record_key), (record, version))
+                if previous.get((key, record_key)) == (record, version):
+                    continue
+
+                # Clean at the cut but last saved under another key, copied as it is now
+                if image is None:
+                    image = PlatformDB.to_dict({record_key: record}, codec=self._codec)[record_key]
+                changed.__setitem__(record_key, image)
+
+            records.__setitem__(key, changed)
+
+        for key, record_key in previous.keys() - saved.keys():
+            removed.setdefault(key, []).append(record_key)
+
+        return records, removed, state, saved
+
+    def _write(self, image: bytes):
+        # One write to a temporary file, then renames only. Whatever the crash, one generation is whole on disk
+        # along with its delta log
+        with open(self._filename + '.tmp', 'wb') as file:
+            file.write(image)
+            file.flush()
+            os.fsync(file.fileno())
+
+        # The current image becomes the old one before the new one takes its place, its deltas move with it
+        for suffix in ('', '.delta'):
+            if os.path.exists(self._filename + suffix):
+                os.replace(self._filename + suffix, self._filename + '.old' + suffix)
+            elif suffix == '.delta' and os.path.exists(self._filename + '.old.delta'):
+                os.remove(self._filename + '.old.delta')
+
+        os.replace(self._filename + '.tmp', self._filename)
+        if os.path.exists(self._filename + '.new'):
+            os.remove(self._filename + '.new')
+        self._sync_directory()
+
+    def _sync_directory(self):
+        # Renames are only durable once the directory holding them is
+        fd = os.open(os.path.dirname(os.path.abspath(self._filename)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
     def to_json(self):
         return json.dumps(PlatformDB.to_dict(self._db.copy()), indent=2)
 
+    def convert(self, filename: str, codec):
+        # Moves the whole database to another file and codec, the files it was loaded from are left alone
+        with self._save_lock:
+            self._filename = filename
+            self._codec = codec
+            self._saved = {}
+            self._save()
+
+    @staticmethod
+    def detect_codec(path: str):
+        # The codec whose files are there, for a database whose name comes without the extension
+        for codec in (BinaryCodec, JSONCodec):
+            for suffix in PlatformDB.generations:
+                if os.path.exists(path + codec.extension + suffix):
+                    return codec()
+
+        return JSONCodec()
+
     @staticmethod
-    def to_dict(target: dict, lock=False):
+    def to_dict(target: dict, lock=False, codec=None):
         d = {}
 
-        for key in target.keys():
-            if isinstance(target[key], ObjectLock):
-                i = target[key].get_unsafe()
+        for key, value in target.items():
+            if type(value) in _PLAIN:
+                d[key] = value
+                continue
+
+            if isinstance(value, ObjectLock):
+                i = value.get_unsafe()
                 if isinstance(i, dict):
-                    d.__setitem__(key, PlatformDB.to_dict(i, lock=True))
+                    d[key] = PlatformDB.to_dict(i, lock=True, codec=codec)
                     continue
 
-            if isinstance(target[key], dict):
-                d.__setitem__(key, PlatformDB.to_dict(target[key]))
+            if isinstance(value, dict):
+                d[key] = PlatformDB.to_dict(value, codec=codec)
+                continue
+
+            # Non-dict stores serialize themselves
+            if hasattr(value, 'to_dict'):
+                d[key] = value.to_dict()
                 continue
 
-            d.__setitem__(key, target[key])
+            d[key] = value
 
         if lock:
-            d.__setitem__('__PLATFORMDB_LOCK__', True)
+            return (codec if codec is not None else JSONCodec).lock(d)
         
         return d
 
@@ -0,0 +1,71 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from unet.singleton import UNetSingleton
+
+
+class QuoteSnapshot:
+    # Never modified once published, a newer snapshot replaces it
+    __slots__ = ('ticker', 'version', 'bid', 'ask', 'mid', 'last', 'bid_volume', 'ask_volume',
+                 'buy_volume', 'sell_volume', 'traded_value', 'open', 'previous_close')
+
+    def __init__(self, ticker: str, version: int, asset: dict) -> None:
+        immediate = asset['immediate']
+        session_data = asset['sessionData']
+
+        self.ticker = ticker
+        self.version = version
+        self.bid = immediate['bid']
+        self.ask = immediate['ask']
+        self.mid = immediate['mid']
+        self.last = immediate['last']
+        self.bid_volume = immediate['bidVolume']
+        self.ask_volume = immediate['askVolume']
+        self.buy_volume = session_data['buyVolume']
+        self.sell_volume = session_data['sellVolume']
+        self.traded_value = session_data['tradedValue']
+        self.open = session_data['open']
+        self.previous_close = session_data['previousClose']
+
+    def change(self):
+        price = self.mid if self.mid is not None else self.last
+        if price is None or not self.previous_close:
+            return None
+
+        return (price - self.previous_close) / self.previous_close * 100
+
+
+class QuoteBoard(UNetSingleton):
+    def __setup__(self):
+        # Ticker -> latest QuoteSnapshot, replaced by a single reference swap so readers never lock
+        self._snapshots = {}
+
+    def publish(self, ticker: str, asset: dict):
+        # Writers call this while holding the asset lock, so versions of one ticker never race
+        previous = self._snapshots.get(ticker)
+        snapshot = QuoteSnapshot(ticker, previous.version + 1 if previous is not None else 1, asset)
+        self._snapshots.__setitem__(ticker, snapshot)
+        return snapshot
+
+    def get(self, ticker: str) -> QuoteSnapshot:
+        return self._snapshots.get(ticker)
+
+    def snapshots(self):
+        return dict(self._snapshots)
+
+    def remove(self, ticker: str):
+        self._snapshots.pop(ticker, None)
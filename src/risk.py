@@ -0,0 +1,201 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+
+from order_matching.side import Side
+from order_matching.execution import Execution
+from unet.singleton import UNetSingleton
+
+from exdb import EXCHANGE_DATABASE
+from order_store import OrderRecord
+from quotes import QuoteBoard
+
+
+class Exposure:
+    __slots__ = ('lock', 'reserved_cash', 'reserved_units', 'pending_cash', 'pending_units')
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # Held by open buys and open sells
+        self.reserved_cash = 0
+        self.reserved_units = {}
+        # Traded but still queued in the position ledger
+        self.pending_cash = 0
+        self.pending_units = {}
+
+
+class RiskCache(UNetSingleton):
+    # Set to True to reject orders beyond the cash and units an account has. Off, accounts may go cash-short and
+    # asset-short and exposure is only tracked, settlement margin calls deal with them as before
+    enabled = False
+
+    def __setup__(self):
+        self._exposures = {}
+
+    def exposure(self, username: str) -> Exposure:
+        exposure = self._exposures.get(username)
+        if exposure is None:
+            exposure = self._exposures.setdefault(username, Exposure())
+        return exposure
+
+    def unit_cost(self, ticker: str, side, execution, price):
+        if side == Side.SELL:
+            return 0
+        if execution == Execution.LIMIT:
+            return price
+
+        # Market buys hold cash at the price they would most likely trade at when they arrive
+        quote = QuoteBoard().get(ticker)
+        if quote is None:
+            return 0
+        for estimate in (quote.ask, quote.last, quote.mid):
+            if estimate is not None:
+                return estimate
+        return 0
+
+    def available_cash(self, username: str):
+        exposure = self.exposure(username)
+        immediate = EXCHANGE_DATABASE.users[username].get_unsafe()['immediate']
+        return immediate['settled']['balance'] + immediate['current']['balance'] \
+            + exposure.pending_cash - exposure.reserved_cash
+
+    def available_units(self, username: str, ticker: str):
+        exposure = self.exposure(username)
+        immediate = EXCHANGE_DATABASE.users[username].get_unsafe()['immediate']
+        return immediate['settled']['assets'].get(ticker, 0) + immediate['current']['assets'].get(ticker, 0) \
+            + exposure.pending_units.get(ticker, 0) - exposure.reserved_units.get(ticker, 0)
+
+    def reserve(self, username: str, ticker: str, side, execution, price, size: int, check=True):
+        # Returns the cash held per unit and the reason for a rejection, nothing is held when rejected
+        asset = EXCHANGE_DATABASE.assets[ticker].get_unsafe()
+        unit_cost = self.unit_cost(ticker, side, execution, price)
+        exposure = self.exposure(username)
+
+        with exposure.lock:
+            reason = self._check(username, ticker, asset, side, unit_cost, size) if check else None
+            if reason is None:
+                self._hold(exposure, ticker, side, unit_cost, size)
+
+        return unit_cost, reason
+
+    def swap(self, order: OrderRecord, execution, price, size: int):
+        # Moves the hold of a resting order to its new terms in one step, a rejected change keeps the old hold
+        asset = EXCHANGE_DATABASE.assets[order.ticker].get_unsafe()
+        unit_cost = self.unit_cost(order.ticker, order.side, execution, price)
+        exposure = self.exposure(order.trader_id)
+
+        with exposure.lock:
+            self._hold(exposure, order.ticker, order.side, order.reserve, -order.left)
+            reason = self._check(order.trader_id, order.ticker, asset, order.side, unit_cost, size)
+            if reason is None:
+                self._hold(exposure, order.ticker, order.side, unit_cost, size)
+            else:
+                self._hold(exposure, order.ticker, order.side, order.reserve, order.left)
+
+        return unit_cost, reason
+
+    def unswap(self, order: OrderRecord, unit_cost, size: int):
+        # Gives a resting order back the hold a swap took from it, for when the engine then refused the change
+        exposure = self.exposure(order.trader_id)
+        with exposure.lock:
+            self._hold(exposure, order.ticker, order.side, unit_cost, -size)
+            self._hold(exposure, order.ticker, order.side, order.reserve, order.left)
+
+    def requote(self, username: str, ticker: str, orders, levels):
+        # The holds of the orders being replaced make way for the new (side, size, price) levels, all or nothing
+        asset = EXCHANGE_DATABASE.assets[ticker].get_unsafe()
+        unit_costs = [self.unit_cost(ticker, side, Execution.LIMIT, price) for side, _, price in levels]
+        exposure = self.exposure(username)
+
+        with exposure.lock:
+            for order in orders:
+                self._hold(exposure, ticker, order.side, order.reserve, -order.left)
+
+            for i, (side, size, _) in enumerate(levels):
+                reason = self._check(username, ticker, asset, side, unit_costs[i], size)
+                if reason is not None:
+                    for (held_side, held_size, _), unit_cost in zip(levels[:i], unit_costs):
+                        self._hold(exposure, ticker, held_side, unit_cost, -held_size)
+                    for order in orders:
+                        self._hold(exposure, ticker, order.side, order.reserve, order.left)
+                    return unit_costs, reason
+
+                self._hold(exposure, ticker, side, unit_costs[i], size)
+
+        return unit_costs, None
+
+    def _check(self, username: str, ticker: str, asset: dict, side, unit_cost, size: int):
+        if not self.enabled:
+            return None
+
+        if side == Side.BUY and unit_cost * size > self.available_cash(username):
+            return 'Insufficient funds'
+
+        # Issuers may sell what they have not issued yet
+        if side == Side.SELL \
+            and not EXCHANGE_DATABASE.user_is_issuer(username, asset) \
+            and size > self.available_units(username, ticker):
+            return 'Insufficient units'
+
+        return None
+
+    def release(self, username: str, ticker: str, side, unit_cost, size: int):
+        exposure = self.exposure(username)
+        with exposure.lock:
+            self._hold(exposure, ticker, side, unit_cost, -size)
+
+    def release_order(self, order: OrderRecord, size: int):
+        self.release(order.trader_id, order.ticker, order.side, order.reserve, size)
+
+    def _hold(self, exposure: Exposure, ticker: str, side, unit_cost, size: int):
+        if side == Side.BUY:
+            exposure.reserved_cash += unit_cost * size
+            return
+
+        units = exposure.reserved_units.get(ticker, 0) + size
+        if units == 0:
+            exposure.reserved_units.pop(ticker, None)
+        else:
+            exposure.reserved_units.__setitem__(ticker, units)
+
+    def pending(self, ticker: str, deltas: dict, sign=1):
+        # Deltas posted to the ledger count before they reach the account, and stop counting once they do
+        for username, (units, cash) in deltas.items():
+            exposure = self.exposure(username)
+            with exposure.lock:
+                exposure.pending_cash += cash * sign
+                pending_units = exposure.pending_units.get(ticker, 0) + units * sign
+                if pending_units == 0:
+                    exposure.pending_units.pop(ticker, None)
+                else:
+                    exposure.pending_units.__setitem__(ticker, pending_units)
+
+    def applied(self, ticker: str, deltas: dict):
+        self.pending(ticker, deltas, sign=-1)
+
+    def rename_ticker(self, ticker: str, new_ticker: str):
+        for exposure in list(self._exposures.values()):
+            with exposure.lock:
+                for units in (exposure.reserved_units, exposure.pending_units):
+                    if ticker in units:
+                        units.__setitem__(new_ticker, units.pop(ticker))
+
+    def rename_user(self, username: str, new_username: str):
+        exposure = self._exposures.pop(username, None)
+        if exposure is not None:
+            self._exposures.__setitem__(new_username, exposure)
@@ -24,15 +24,16 @@ from exdb import EXCHANGE_DATABASE
 from settlement import MarketSettlement
 from email_engine import EmailEngine
 from historydb import HistoryDB
+from quotes import QuoteBoard
 import utils
 
 
 class MarketScheduler(UNetSingleton):
     def add_intraday(self):
-        for assetname in EXCHANGE_DATABASE.assets:
-            with EXCHANGE_DATABASE.assets[assetname] as asset:
-                immediate = asset['immediate']
-                HistoryDB().add_asset_intraday(assetname, utils.today(), utils.nowtime(), immediate['bid'], immediate['ask'], immediate['mid'])
+        for assetname, quote in QuoteBoard().snapshots().items():
+            HistoryDB().add_asset_intraday(assetname, utils.today(), utils.nowtime(), utils.from_ticks(quote.bid),
+                                           utils.from_ticks(quote.ask),
+                                           utils.from_ticks(quote.mid))
 
     def schedule_intraday(self):
         # Warning: bad code, gotta refactor
@@ -0,0 +1,67 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import functools
+import threading
+import queue
+from concurrent.futures import Future
+
+
+def sequenced(method):
+    @functools.wraps(method)
+    def inner(self, *args, **kwargs):
+        sequencer = self.sequencer
+        if sequencer is None or sequencer.is_current():
+            return method(self, *args, **kwargs)
+
+        return sequencer.submit(method, self, *args, **kwargs).result()
+
+    return inner
+
+
+class MarketSequencer:
+    def __init__(self, name: str) -> None:
+        self._inbound = queue.SimpleQueue()
+        self._sequence = 0
+        self._thread = threading.Thread(target=self._sequencer_loop,
+                                        name=f'sequencer-{name}',
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        future = Future()
+        self._inbound.put((future, function, args, kwargs))
+        return future
+
+    def is_current(self):
+        return threading.current_thread() is self._thread
+
+    def _sequencer_loop(self):
+        while True:
+            future, function, args, kwargs = self._inbound.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            self._sequence += 1
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    @property
+    def sequence(self):
+        return self._sequence
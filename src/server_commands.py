@@ -39,6 +39,10 @@ from email_engine import EmailEngine
 from historydb import HistoryDB
 from creditdb import CreditDB
 from event_engine import EventEngine, ExchangeEvent
+from journal import JournalEvent
+from ledger import PositionLedger
+from risk import RiskCache
+from quotes import QuoteBoard
 
 import command_backend as cb
 import utils
@@ -51,7 +55,7 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
         GlobalMarket().close_markets()
         time.sleep(0.500)
         EXCHANGE_DATABASE.db.timer.stop()
-        EXCHANGE_DATABASE.db.save()
+        EXCHANGE_DATABASE.save()
         os.kill(os.getpid(), signal.SIGINT)
     
     @unet_command('setbal')
@@ -74,6 +78,7 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
             )
         
         GlobalMarket().create_market(ticker)
+        EXCHANGE_DATABASE.save()
 
         return unet_make_status_message(
             mode=UNetStatusMode.OK,
@@ -115,6 +120,8 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
             
             asset[section][attribute] = eval(vtype)(value)
 
+        EXCHANGE_DATABASE.save()
+
         return unet_make_status_message(
             mode=UNetStatusMode.OK,
             code=UNetStatusCode.DONE,
@@ -134,6 +141,58 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
             }
         )
     
+    @unet_command('auction')
+    def auction(self, command: UNetServerCommand, ticker: str):
+        ticker = ticker.upper()
+        if ticker not in GlobalMarket().markets:
+            return unet_make_status_message(
+                mode=UNetStatusMode.ERR,
+                code=UNetStatusCode.BAD,
+                message={
+                    'content': f"No such ticker '{ticker}'"
+                }
+            )
+        
+        GlobalMarket().markets[ticker].start_auction()
+        return unet_make_status_message(
+            mode=UNetStatusMode.OK,
+            code=UNetStatusCode.DONE,
+            message={
+                'content': f"Call auction started on '{ticker}'"
+            }
+        )
+    
+    @unet_command('uncross')
+    def uncross(self, command: UNetServerCommand, ticker: str):
+        ticker = ticker.upper()
+        if ticker not in GlobalMarket().markets:
+            return unet_make_status_message(
+                mode=UNetStatusMode.ERR,
+                code=UNetStatusCode.BAD,
+                message={
+                    'content': f"No such ticker '{ticker}'"
+                }
+            )
+        
+        price = GlobalMarket().markets[ticker].uncross()
+        if price is None:
+            return unet_make_status_message(
+                mode=UNetStatusMode.ERR,
+                code=UNetStatusCode.DENY,
+                message={
+                    'content': f"Nothing to uncross on '{ticker}'"
+                }
+            )
+
+        return unet_make_status_message(
+            mode=UNetStatusMode.OK,
+            code=UNetStatusCode.DONE,
+            message={
+                'price': utils.from_ticks(price),
+                'content': f"'{ticker}' uncrossed at '{utils.ticks_fmt(price)}'"
+            }
+        )
+    
     @unet_command('addrole')
     def addrole(self, command: UNetServerCommand, who: str, role: str):
         UNetUserDatabase().add_role(name=who, role=role)
@@ -178,6 +237,7 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
                 }
             )
         
+        PositionLedger().flush()
         units = defaultdict(lambda: 0)
         for username in EXCHANGE_DATABASE.users:
             with EXCHANGE_DATABASE.users[username] as user:
@@ -190,6 +250,7 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
                         user['immediate']['settled']['assets'].pop(ticker)
 
         GlobalMarket().remove_market(ticker)
+        EXCHANGE_DATABASE.save()
 
         return unet_make_multi_message(
             unet_make_status_message(
@@ -217,6 +278,8 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
         with EXCHANGE_DATABASE.assets[ticker] as asset:
             market = GlobalMarket().markets.pop(ticker)
             market._engine_lock._lock.acquire()
+            # Trades queued before the market stopped still carry the old ticker
+            PositionLedger().flush()
             market._ticker = new_ticker
             GlobalMarket().markets.__setitem__(new_ticker, market)
             
@@ -231,16 +294,27 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
                     if ticker in user['immediate']['settled']['assets']:
                         user['immediate']['settled']['assets'][new_ticker] = user['immediate']['settled']['assets'].pop(ticker)
                     HistoryDB().update_ticker(ticker, new_ticker)
-                    
+
+            for order in EXCHANGE_DATABASE.orders:
+                if order.ticker == ticker:
+                    order.ticker = new_ticker
+                    EXCHANGE_DATABASE.orders.touch(order.order_id)
+
+            RiskCache().rename_ticker(ticker, new_ticker)
+            QuoteBoard().remove(ticker)
+            QuoteBoard().publish(new_ticker, asset)
 
             market._engine_lock._lock.release()
-            return unet_make_status_message(
-                mode=UNetStatusMode.OK,
-                code=UNetStatusCode.DONE,
-                message={
-                    'content': 'Ticker changed'
-                }
-            )
+
+        # Saving takes every record lock, so it cannot run with the asset still held
+        EXCHANGE_DATABASE.save()
+        return unet_make_status_message(
+            mode=UNetStatusMode.OK,
+            code=UNetStatusCode.DONE,
+            message={
+                'content': 'Ticker changed'
+            }
+        )
 
     @unet_command('newcredit')
     def newcredit(self, command: UNetServerCommand, creditor: str, debtor: str, amount: str, amount_due: str, duration: str, frequency: str, collateral: str, spread: str, id_benchmark: str, note: str):
@@ -269,8 +343,12 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
                 }
             )
 
+        # Credits are booked in currency units, balances in ticks
+        amount_ticks = utils.to_ticks(real_amount)
+        collateral_ticks = utils.to_ticks(real_collateral)
+
         with EXCHANGE_DATABASE.users[creditor] as creditor_user:
-            if creditor_user['immediate']['settled']['balance'] < real_amount:
+            if creditor_user['immediate']['settled']['balance'] < amount_ticks:
                 return unet_make_status_message(
                     mode=UNetStatusMode.ERR,
                     code=UNetStatusCode.DENY,
@@ -279,10 +357,11 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
                     }
                 )
 
-            creditor_user['immediate']['settled']['balance'] = round(creditor_user['immediate']['settled']['balance'] - real_amount, 2)
+            creditor_user['immediate']['settled']['balance'] -= amount_ticks
+            EXCHANGE_DATABASE.journal_account(JournalEvent.PAYMENT, creditor, creditor_user)
 
         with EXCHANGE_DATABASE.users[debtor] as debtor_user:
-            if debtor_user['immediate']['settled']['balance'] < real_collateral:
+            if debtor_user['immediate']['settled']['balance'] < collateral_ticks:
                 return unet_make_status_message(
                     mode=UNetStatusMode.ERR,
                     code=UNetStatusCode.DENY,
@@ -291,8 +370,9 @@ class ExchangePriviledgedCommandHandler(UNetCommandHandler):
                     }
                 )
 
-            debtor_user['immediate']['settled']['balance'] = round(debtor_user['immediate']['settled']['balance'] - real_collateral, 2)
-            debtor_user['immediate']['settled']['balance'] = round(debtor_user['immediate']['settled']['balance'] + real_amount, 2)
+            debtor_user['immediate']['settled']['balance'] -= collateral_ticks
+            debtor_user['immediate']['settled']['balance'] += amount_ticks
+            EXCHANGE_DATABASE.journal_account(JournalEvent.PAYMENT, debtor, debtor_user)
 
         CreditDB().add_credit(creditor, debtor, real_amount, real_amount_due, real_duration, real_frequency, real_collateral, real_spread, real_benchmark, note)
 
@@ -318,9 +398,11 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
         settled = 0
         current = 0
         
+        # Trades still queued in the ledger have to be visible to the reader
+        PositionLedger().flush()
         with EXCHANGE_DATABASE.users[command.issuer] as user:
-            settled = user['immediate']['settled']['balance']
-            current = user['immediate']['current']['balance']
+            settled = utils.from_ticks(user['immediate']['settled']['balance'])
+            current = utils.from_ticks(user['immediate']['current']['balance'])
     
         return unet_make_multi_message(
             unet_make_value_message(
@@ -339,29 +421,25 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
         colums = ['TICKER', 'LAST', 'BID', 'ASK', 'MID', 'BID V', 'ASK V', 'CHANGE']
         tables = []
 
+        # Published quotes are read without taking any asset lock, matching never waits on this
+        quotes = QuoteBoard().snapshots()
         for aclass in sorted(list(EXCHANGE_DATABASE.asset_classes.keys())):
             rows = []
 
-            for index, ticker in enumerate(sorted(EXCHANGE_DATABASE.asset_classes[aclass])):
-                rows.append([])
-                with EXCHANGE_DATABASE.assets[ticker] as asset:
-                    info = asset['info']
-                    immediate = asset['immediate']
-                    session_data = asset['sessionData']
+            for ticker in sorted(EXCHANGE_DATABASE.asset_classes[aclass]):
+                quote = quotes.get(ticker)
+                if quote is None:
+                    continue
 
-                    rows[index].append(ticker)
-                    rows[index].append(utils.value_fmt(immediate['last']))
-                    rows[index].append(utils.value_fmt(immediate['bid']))
-                    rows[index].append(utils.value_fmt(immediate['ask']))
-                    rows[index].append(utils.value_fmt(immediate['mid']))
-                    rows[index].append(utils.value_fmt(immediate['bidVolume']))
-                    rows[index].append(utils.value_fmt(immediate['askVolume']))
-                    change = utils.value_fmt(None)
-                    if utils.are_none(immediate['mid'], session_data['previousClose']):
-                        change = f"{(((immediate['mid'] - session_data['previousClose']) / session_data['previousClose']) * 100):+.2f}%"
-                    elif utils.are_none(immediate['last'], session_data['previousClose']):
-                        change = f"{(((immediate['last'] - session_data['previousClose']) / session_data['previousClose']) * 100):+.2f}%"
-                    rows[index].append(change)
+                change = quote.change()
+                rows.append([ticker,
+                             utils.ticks_fmt(quote.last),
+                             utils.ticks_fmt(quote.bid),
+                             utils.ticks_fmt(quote.ask),
+                             utils.ticks_fmt(quote.mid),
+                             utils.value_fmt(quote.bid_volume),
+                             utils.value_fmt(quote.ask_volume),
+                             f'{change:+.2f}%' if change is not None else utils.value_fmt(None)])
                     
             tables.append(unet_make_table_message(
                 title=f'CLASS {aclass} MARKET',
@@ -398,21 +476,37 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
     def depth(self, command: UNetServerCommand, ticker: str):
         return cb.show_chart(ticker.upper(), 'today', property='__DEPTH__')
 
+    @unet_command('tape', 'nastro', 'tp')
+    def tape(self, command: UNetServerCommand, ticker: str, count: str = '20'):
+        return cb.show_tape(ticker, count=count)
+
+    @unet_command('tapesince', 'nastroda', 'tps')
+    def tape_since(self, command: UNetServerCommand, ticker: str, sequence: str):
+        return cb.show_tape(ticker, since=sequence)
+
     @unet_command('selllimit', 'vendilimite', 'sl', 'vl')
-    def sell_limit(self, command: UNetServerCommand, ticker: str, qty: str, price: str):
-        return cb.place_order(ticker.upper(), command.issuer, Execution.LIMIT, Side.SELL, qty, price)
+    def sell_limit(self, command: UNetServerCommand, ticker: str, qty: str, price: str, tif: str = 'GTC', expiry: str = None):
+        return cb.place_order(ticker.upper(), command.issuer, Execution.LIMIT, Side.SELL, qty, price, tif, expiry)
 
     @unet_command('sellmarket', 'vendimercato', 'sm', 'vm')
-    def sell_market(self, command: UNetServerCommand, ticker: str, qty: str):
-        return cb.place_order(ticker.upper(), command.issuer, Execution.MARKET, Side.SELL, qty, 0)
+    def sell_market(self, command: UNetServerCommand, ticker: str, qty: str, tif: str = 'GTC', expiry: str = None):
+        return cb.place_order(ticker.upper(), command.issuer, Execution.MARKET, Side.SELL, qty, 0, tif, expiry)
 
     @unet_command('buyliimt', 'compralimite', 'bl', 'cl')
-    def buy_limit(self, command: UNetServerCommand, ticker: str, qty: str, price: str):
-        return cb.place_order(ticker.upper(), command.issuer, Execution.LIMIT, Side.BUY, qty, price)
+    def buy_limit(self, command: UNetServerCommand, ticker: str, qty: str, price: str, tif: str = 'GTC', expiry: str = None):
+        return cb.place_order(ticker.upper(), command.issuer, Execution.LIMIT, Side.BUY, qty, price, tif, expiry)
 
     @unet_command('buymarket', 'compramercato', 'bm', 'cm')
-    def buy_market(self, command: UNetServerCommand, ticker: str, qty: str):
-        return cb.place_order(ticker.upper(), command.issuer, Execution.MARKET, Side.BUY, qty, 0)
+    def buy_market(self, command: UNetServerCommand, ticker: str, qty: str, tif: str = 'GTC', expiry: str = None):
+        return cb.place_order(ticker.upper(), command.issuer, Execution.MARKET, Side.BUY, qty, 0, tif, expiry)
+
+    @unet_command('bulk', 'blocco', 'bk')
+    def bulk(self, command: UNetServerCommand, ticker: str, orders: str):
+        return cb.place_orders(ticker.upper(), command.issuer, orders)
+
+    @unet_command('massquote', 'quotazione', 'mq', 'qt')
+    def mass_quote(self, command: UNetServerCommand, ticker: str, bids: str, asks: str):
+        return cb.mass_quote(ticker.upper(), command.issuer, bids, asks)
 
     @unet_command('pay', 'paga', 'pp', 'pa')
     def pay(self, command: UNetServerCommand, who: str, amount: str, category: str):
@@ -427,7 +521,7 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
         
         real_amount = 0
         try:
-            real_amount = round(float(amount), 2)
+            real_amount = utils.to_ticks(amount)
             if real_amount < 0:
                 raise Exception()
         except:
@@ -442,16 +536,18 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
         if UNetUserDatabase().has_role(command.issuer, 'centralbank'):
             with EXCHANGE_DATABASE.users[who] as receiver:
                 receiver['immediate']['settled']['balance'] += real_amount
+                EXCHANGE_DATABASE.journal_account(JournalEvent.PAYMENT, who, receiver)
 
-            HistoryDB().add_payment(command.issuer, who, real_amount, category)
+            HistoryDB().add_payment(command.issuer, who, utils.from_ticks(real_amount), category)
             return unet_make_status_message(
                 mode=UNetStatusMode.OK,
                 code=UNetStatusCode.DONE,
                 message={
-                    'content': f"Transfered {real_amount} to '{who}'"
+                    'content': f"Transfered {utils.from_ticks(real_amount)} to '{who}'"
                 }
             )
 
+        PositionLedger().flush()
         with EXCHANGE_DATABASE.users[command.issuer] as sender:
             if sender['immediate']['settled']['balance'] + sender['immediate']['current']['balance'] < real_amount:
                 return unet_make_status_message(
@@ -466,22 +562,25 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
                 sender['immediate']['current']['balance'] -= real_amount
             else:
                 sender['immediate']['settled']['balance'] -= real_amount
+            EXCHANGE_DATABASE.journal_account(JournalEvent.PAYMENT, command.issuer, sender)
 
         if not UNetUserDatabase().has_role(who, 'centralbank'):
             with EXCHANGE_DATABASE.users[who] as receiver:
                 receiver['immediate']['settled']['balance'] += real_amount
+                EXCHANGE_DATABASE.journal_account(JournalEvent.PAYMENT, who, receiver)
 
-        HistoryDB().add_payment(command.issuer, who, real_amount, category)
+        HistoryDB().add_payment(command.issuer, who, utils.from_ticks(real_amount), category)
         return unet_make_status_message(
             mode=UNetStatusMode.OK,
             code=UNetStatusCode.DONE,
             message={
-                'content': f"Transfered {real_amount} to '{who}'"
+                'content': f"Transfered {utils.from_ticks(real_amount)} to '{who}'"
             }
         )
     
     @unet_command('positions', 'posizioni', 'ps')
     def positions(self, command: UNetServerCommand):
+        PositionLedger().flush()
         with EXCHANGE_DATABASE.users[command.issuer] as user:
             # return unet_make_multi_message(
             #     unet_make_table_message(
@@ -499,7 +598,7 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
 
             current = user['immediate']['current']['assets']
             settled = user['immediate']['settled']['assets']
-            orders = user['immediate']['orders']
+            orders = EXCHANGE_DATABASE.orders.of_trader(command.issuer)
 
             rows = {}
             cols = ['TICKER', 'SETTLED', 'UNSETTLED', 'PENDING', 'NET', 'VALUE']
@@ -510,12 +609,9 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
             for ticker, qty in current.items():
                 rows.setdefault(ticker, [0, 0, 0])[1] = qty
                 
-            for order_id in orders:
-                order = EXCHANGE_DATABASE.orders[str(order_id)]
-
-                if order['side'] == 'SELL':
-                    ticker = order['ticker']
-                    rows[ticker][2] -= int(order['size'])
+            for order in orders:
+                if order.side == Side.SELL:
+                    rows.setdefault(order.ticker, [0, 0, 0])[2] -= int(order.size)
 
             final_rows = []
 
@@ -529,7 +625,7 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
                     else:
                         price = 0
 
-                val = round((row[0] + row[1]) * price)
+                val = round(utils.from_ticks((row[0] + row[1]) * price))
                 net = row[0] + row[1] + row[2]
                 final_rows.append([ticker, row[0], f'{row[1]:+}', row[2], f'{net:+}', val])
 
@@ -545,6 +641,7 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
         colums = ['TICKER', 'L BID', 'L ASK', 'BUY V', 'SELL V', 'TRADED', 'SPREAD', 'SHORT']
         tables = []
 
+        PositionLedger().flush()
         for aclass in sorted(list(EXCHANGE_DATABASE.asset_classes.keys())):
             rows = []
 
@@ -571,12 +668,12 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
                     session_data = asset['sessionData']
 
                     rows[index].append(ticker)
-                    rows[index].append(utils.value_fmt(immediate['lastBid']))
-                    rows[index].append(utils.value_fmt(immediate['lastAsk']))
+                    rows[index].append(utils.ticks_fmt(immediate['lastBid']))
+                    rows[index].append(utils.ticks_fmt(immediate['lastAsk']))
                     rows[index].append(utils.value_fmt(session_data['buyVolume']))
                     rows[index].append(utils.value_fmt(session_data['sellVolume']))
-                    rows[index].append(utils.value_fmt(session_data['tradedValue']))
-                    rows[index].append(utils.value_fmt(round((immediate['ask'] - immediate['bid']) / round(immediate['mid'], 2) * 10000, 2)\
+                    rows[index].append(utils.ticks_fmt(session_data['tradedValue']))
+                    rows[index].append(utils.value_fmt(round((immediate['ask'] - immediate['bid']) / immediate['mid'] * 10000, 2)\
                                                         if immediate['bid'] != None and immediate['ask'] != None
                                                         else None))
 
@@ -630,16 +727,14 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
         colums = ['TICKER', 'ORDER', 'EXEC', 'SIDE', 'SIZE', 'PRICE']
         rows = []
 
-        with EXCHANGE_DATABASE.users[command.issuer] as user:
-            for index, order_id in enumerate(user['immediate']['orders']):
-                order = EXCHANGE_DATABASE.orders[order_id]
-                rows.append([])
-                rows[index].append(order['ticker'])
-                rows[index].append(order_id)
-                rows[index].append(order['execution'])
-                rows[index].append(order['side'])
-                rows[index].append(order['size'])
-                rows[index].append(utils.value_fmt(order['price']))
+        for index, order in enumerate(EXCHANGE_DATABASE.orders.of_trader(command.issuer)):
+            rows.append([])
+            rows[index].append(order.ticker)
+            rows[index].append(str(order.order_id))
+            rows[index].append('LIMIT' if order.execution == Execution.LIMIT else 'MARKET')
+            rows[index].append('BUY' if order.side == Side.BUY else 'SELL')
+            rows[index].append(order.size)
+            rows[index].append(utils.ticks_fmt(order.price))
 
         return unet_make_table_message(
             title=f'PENDING ORDERS',
@@ -660,9 +755,9 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
             )
         
         order_ids = []
-        for order_id in EXCHANGE_DATABASE.users[command.issuer].get_unsafe()['immediate']['orders']:
-            if EXCHANGE_DATABASE.orders[order_id]['ticker'] == ticker:
-                order_ids.append(order_id)
+        for order in EXCHANGE_DATABASE.orders.of_trader(command.issuer):
+            if order.ticker == ticker:
+                order_ids.append(order.order_id)
 
         tot = 0
         for order_id in order_ids:
@@ -698,6 +793,14 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
             }
         )
     
+    @unet_command('amend', 'modifica', 'am', 'mo')
+    def amend(self, command: UNetServerCommand, order_id: str, qty: str, price: str = None):
+        return cb.amend_order(order_id, command.issuer, qty, price)
+
+    @unet_command('replace', 'sostituisci', 'rp', 'so')
+    def replace(self, command: UNetServerCommand, order_id: str, qty: str, price: str):
+        return cb.replace_order(order_id, command.issuer, qty, price)
+
     @unet_command('transfer', 'trasferisci', 'tr', 'mv')
     def transfer(self, command: UNetServerCommand, ticker: str, qty: str, who: str):
         ticker = ticker.upper()
@@ -732,6 +835,7 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
                 }
             )
     
+        PositionLedger().flush()
         with EXCHANGE_DATABASE.users[command.issuer] as sender:
             if not EXCHANGE_DATABASE.user_is_issuer(command.issuer, EXCHANGE_DATABASE.assets[ticker].get_unsafe()):
                 asset_qty = 0
@@ -751,11 +855,13 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
             sender['immediate']['settled']['assets'][ticker] -= qty
             if sender['immediate']['settled']['assets'][ticker] == 0:
                 sender['immediate']['settled']['assets'].pop(ticker)
+            EXCHANGE_DATABASE.journal_account(JournalEvent.TRANSFER, command.issuer, sender)
 
         with EXCHANGE_DATABASE.users[who] as receiver:
             receiver['immediate']['settled']['assets'][ticker] += qty
             if receiver['immediate']['settled']['assets'][ticker] == 0:
                 receiver['immediate']['settled']['assets'].pop(ticker)
+            EXCHANGE_DATABASE.journal_account(JournalEvent.TRANSFER, who, receiver)
         
         HistoryDB().add_payment(command.issuer, who, qty, None, ticker)
         return unet_make_status_message(
@@ -768,6 +874,7 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
     
     @unet_command('json')
     def json(self, command: UNetServerCommand, path: str):
+        PositionLedger().flush()
         path_steps = path.split('/')
         target_key = path_steps.pop(len(path_steps) - 1) if len(path_steps) > 0 and path != '' else 'db'
         if '' in path_steps:
@@ -802,6 +909,8 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
                 root = root.get_unsafe()
 
             target = PlatformDB.to_dict(root) if isinstance(root, dict) else root
+            if hasattr(target, 'to_dict'):
+                target = target.to_dict()
             for lock in locks:
                 lock.release()
 
@@ -839,12 +948,18 @@ class ExchangeUserCommandHandler(UNetCommandHandler):
                 }
             )
 
-        with EXCHANGE_DATABASE.users[command.issuer] as user:
-            EXCHANGE_DATABASE.users.__setitem__(new_name, EXCHANGE_DATABASE.users.pop(command.issuer))
-            UNetUserDatabase().change_user_username(command.issuer, new_name)
-            CreditDB().update_names(command.issuer, new_name)
-            self.parent._user = new_name
-        
+        def rename():
+            with EXCHANGE_DATABASE.users[command.issuer] as user:
+                EXCHANGE_DATABASE.users.__setitem__(new_name, EXCHANGE_DATABASE.users.pop(command.issuer))
+                EXCHANGE_DATABASE.orders.rename_trader(command.issuer, new_name)
+                RiskCache().rename_user(command.issuer, new_name)
+                UNetUserDatabase().change_user_username(command.issuer, new_name)
+                CreditDB().update_names(command.issuer, new_name)
+                self.parent._user = new_name
+
+        PositionLedger().rename_user(command.issuer, new_name, rename)
+
+        EXCHANGE_DATABASE.save()
         return unet_make_status_message(
             mode=UNetStatusMode.OK,
             code=UNetStatusCode.DONE,
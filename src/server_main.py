@@ -23,6 +23,7 @@ from unet.server import UNetAuthenticatedHandler, UNetAuthenticationHandler, UNe
 from exdb import EXCHANGE_DATABASE
 from scheduler import MarketScheduler
 from global_market import GlobalMarket
+from risk import RiskCache
 from email_engine import EmailEngine
 from historydb import HistoryDB
 from event_engine import EventEngine
@@ -71,15 +72,26 @@ This is free software, and you are welcome to redistribute it
         with open('settings.json', 'r') as file:
             settings = json.loads(file.read())
             ee.password = settings['googleAppPassword']
+            # Sequenced markets run every operation on one thread per ticker in arrival order, slower than the default
+            GlobalMarket.sequenced = settings.get('sequencedMarkets', False)
+            # Experimental: in every configuration benchmarked so far shards match slower than the in-process engine
+            GlobalMarket.shards = settings.get('marketShards', 0)
+            RiskCache.enabled = settings.get('riskChecks', False)
     except:
         with open('settings.json', 'w') as file:
             file.write(json.dumps({
-                'googleAppPassword': ''
+                'googleAppPassword': '',
+                'sequencedMarkets': False,
+                'marketShards': 0,
+                'riskChecks': False
             }, indent=4))
             exit()
 
     logging.info("E-Mail Engine started!")
 
+    if GlobalMarket.shards > 0:
+        logging.warning("marketShards is experimental and currently slower than matching in the server process")
+
     mkt = GlobalMarket()
     logging.info("Order Matching Engine started!")
 
@@ -23,11 +23,18 @@ import command_backend as cb
 from exdb import EXCHANGE_DATABASE
 from historydb import HistoryDB
 from creditdb import CreditDB, CreditState
+from ledger import PositionLedger
+from global_market import GlobalMarket
+from quotes import QuoteBoard
 import utils
 
 
 class MarketSettlement(UNetSingleton):
     def settle(self):
+        # Margin calls placed below are applied by the ledger after the account is released,
+        # so they land in the next session's current positions
+        PositionLedger().flush()
+        GlobalMarket().expire_day_orders()
         for username in EXCHANGE_DATABASE.users:
             with EXCHANGE_DATABASE.users[username] as user:
                 current_assets = user['immediate']['current']['assets']
@@ -47,13 +54,14 @@ class MarketSettlement(UNetSingleton):
                                        Execution.MARKET,
                                        Side.BUY,
                                        abs(qty),
-                                       0)
+                                       0,
+                                       risk_check=False)
 
-                user['immediate']['settled']['balance'] = round(user['immediate']['settled']['balance'] + user['immediate']['current']['balance'], 2)
+                user['immediate']['settled']['balance'] += user['immediate']['current']['balance']
                 user['immediate']['current']['balance'] = 0
                 user['immediate']['current']['assets'].clear()
 
-                HistoryDB().add_user_daily(username, EXCHANGE_DATABASE.get_open_date(), user['immediate']['settled']['balance'], user['immediate']['settled']['assets'])
+                HistoryDB().add_user_daily(username, EXCHANGE_DATABASE.get_open_date(), utils.from_ticks(user['immediate']['settled']['balance']), user['immediate']['settled']['assets'])
         
         for assetname in EXCHANGE_DATABASE.assets:
             with EXCHANGE_DATABASE.assets[assetname] as asset:
@@ -64,16 +72,22 @@ class MarketSettlement(UNetSingleton):
                 if session_data['close'] == None:
                     session_data['close'] = immediate['last']
 
-                HistoryDB().add_asset_daily(assetname, EXCHANGE_DATABASE.get_open_date(), session_data['buyVolume'], session_data['sellVolume'], session_data['tradedValue'], session_data['open'], session_data['close'])
+                HistoryDB().add_asset_daily(assetname, EXCHANGE_DATABASE.get_open_date(), session_data['buyVolume'], session_data['sellVolume'],
+                                            utils.from_ticks(session_data['tradedValue']),
+                                            utils.from_ticks(session_data['open']),
+                                            utils.from_ticks(session_data['close']))
 
                 session_data['sellVolume'] = 0
                 session_data['buyVolume'] = 0
                 session_data['tradedValue'] = 0
-                session_data['open'] = immediate['mid']
+                # Auction sessions open at the uncrossing price instead
+                session_data['open'] = immediate['mid'] if asset['info'].get('openingAuction', 0) <= 0 else None
                 session_data['previousClose'] = session_data['close']
                 session_data['close'] = None
+                QuoteBoard().publish(assetname, asset)
 
         EXCHANGE_DATABASE.set_open_date(utils.today())
+        GlobalMarket().open_auctions()
 
         CreditDB().update_matured_days()
 
@@ -88,12 +102,14 @@ class MarketSettlement(UNetSingleton):
             base = credit[len(credit) - 1]
             rate_due = (float(base + spread) / 7 * frequency) / 10000
             amount_due = round(amount * rate_due, 2)
+            # Credits are booked in currency units, balances in ticks
+            ticks_due = utils.to_ticks(amount_due)
             success = True
 
             if amount_due >= 0:
                 with EXCHANGE_DATABASE.users[debtor] as debtor_user:
-                    if debtor_user['immediate']['settled']['balance'] >= amount_due:
-                        debtor_user['immediate']['settled']['balance'] = round(debtor_user['immediate']['settled']['balance'] - amount_due, 2)
+                    if debtor_user['immediate']['settled']['balance'] >= ticks_due:
+                        debtor_user['immediate']['settled']['balance'] -= ticks_due
                         CreditDB().add_history_instance(credit[0], amount_due, CreditState.PAID_CASH)
                     elif CreditDB().collateral_call(credit[0], amount_due):
                         CreditDB().add_history_instance(credit[0], amount_due, CreditState.PAID_COLLATERAL)
@@ -104,11 +120,11 @@ class MarketSettlement(UNetSingleton):
 
                 if success:
                     with EXCHANGE_DATABASE.users[creditor] as creditor_user:
-                        creditor_user['immediate']['settled']['balance'] = round(creditor_user['immediate']['settled']['balance'] + amount_due, 2)
+                        creditor_user['immediate']['settled']['balance'] += ticks_due
             else:
                 with EXCHANGE_DATABASE.users[creditor] as creditor_user:
-                    if creditor_user['immediate']['settled']['balance'] >= amount_due:
-                        creditor_user['immediate']['settled']['balance'] = round(creditor_user['immediate']['settled']['balance'] + amount_due, 2)
+                    if creditor_user['immediate']['settled']['balance'] >= ticks_due:
+                        creditor_user['immediate']['settled']['balance'] += ticks_due
                         CreditDB().add_history_instance(credit[0], amount_due, CreditState.PAID_CASH)
                     else:
                         CreditDB().add_history_instance(credit[0], amount_due, CreditState.DEFAULT)
@@ -117,7 +133,7 @@ class MarketSettlement(UNetSingleton):
                 
                 if success:
                     with EXCHANGE_DATABASE.users[debtor] as debtor_user:
-                        debtor_user['immediate']['settled']['balance'] = round(debtor_user['immediate']['settled']['balance'] - amount_due, 2)
+                        debtor_user['immediate']['settled']['balance'] -= ticks_due
 
         maturities = CreditDB().get_all_mature()
 
@@ -126,11 +142,12 @@ class MarketSettlement(UNetSingleton):
             debtor = credit[2]
             amount_due = credit[4]
             success = True
-            refund = credit[10]
+            ticks_due = utils.to_ticks(amount_due)
+            refund = utils.to_ticks(credit[10])
 
             with EXCHANGE_DATABASE.users[debtor] as debtor_user:
-                if debtor_user['immediate']['settled']['balance'] + refund >= amount_due:
-                    debtor_user['immediate']['settled']['balance'] = round(debtor_user['immediate']['settled']['balance'] - amount_due, 2)
+                if debtor_user['immediate']['settled']['balance'] + refund >= ticks_due:
+                    debtor_user['immediate']['settled']['balance'] -= ticks_due
                     CreditDB().add_history_instance(credit[0], amount_due, CreditState.PAID_CASH)
                 else:
                     CreditDB().add_history_instance(credit[0], amount_due, CreditState.DEFAULT)
@@ -139,8 +156,11 @@ class MarketSettlement(UNetSingleton):
                     refund = 0
 
                 if success:
-                    debtor_user['immediate']['settled']['balance'] = round(debtor_user['immediate']['settled']['balance'] + refund, 2)
+                    debtor_user['immediate']['settled']['balance'] += refund
             
             if success:
                 with EXCHANGE_DATABASE.users[creditor] as creditor_user:
-                    creditor_user['immediate']['settled']['balance'] = round(creditor_user['immediate']['settled']['balance'] + amount_due, 2)
+                    creditor_user['immediate']['settled']['balance'] += ticks_due
+
+        # Settlement rewrites most of the database, a snapshot is cheaper than journaling all of it
+        EXCHANGE_DATABASE.save()
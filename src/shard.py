@@ -0,0 +1,381 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Connection
+
+
+from matching_layer import MatchingLayer
+from order_store import OrderRecord
+
+
+class ShardRequest:
+    PLACE = 0
+    CANCEL = 1
+    SNAPSHOT = 2
+    OPEN = 3
+    STOP = 4
+    LOAD = 5
+    FILLABLE = 6
+    REST = 7
+    UNCROSS = 8
+    AMEND = 9
+    REPLACE = 10
+
+
+def _quotes(engine: MatchingLayer):
+    return (engine.max_bid(),
+            engine.min_offer(),
+            engine.max_bid_size(),
+            engine.min_offer_size(),
+            engine.last_bid(),
+            engine.last_offer(),
+            engine.sequence())
+
+
+def _track(resting: dict, order: OrderRecord, trades):
+    # Keeps the shard's resting orders in step after the order has been matched
+    if order.size > 0:
+        resting.__setitem__(order.order_id, order)
+    else:
+        resting.pop(order.order_id, None)
+
+    for trade in trades or ():
+        if resting[trade.book_order_id].size <= 0:
+            resting.pop(trade.book_order_id)
+
+
+def _shard_main(connection):
+    engines = {}
+    orders = {}
+
+    def shard_call(request):
+        try:
+            return handle(request)
+        except Exception as e:
+            return e
+
+    def handle(request):
+        match (request[0]):
+            case ShardRequest.OPEN:
+                _, ticker, last_bid, last_offer = request
+                engine = engines.setdefault(ticker, MatchingLayer(0, last_bid=last_bid, last_offer=last_offer))
+                orders.setdefault(ticker, {})
+                return _quotes(engine)
+
+            case ShardRequest.PLACE:
+                _, ticker, execution, side, size, price, order_id = request
+                engine = engines[ticker]
+                resting = orders[ticker]
+
+                order = OrderRecord(order_id, ticker, None, side, execution, price, size)
+
+                trades = engine.place(order)
+                _track(resting, order, trades)
+                return order.size, trades, _quotes(engine)
+
+            case ShardRequest.AMEND:
+                _, ticker, order_id, size, price, rest = request
+                engine = engines[ticker]
+                resting = orders[ticker]
+
+                order = resting[order_id]
+                trades = engine.amend(order, size, price, rest)
+                _track(resting, order, trades)
+                return order.size, trades, _quotes(engine)
+
+            case ShardRequest.REPLACE:
+                _, ticker, old_order_id, execution, side, size, price, order_id, rest = request
+                engine = engines[ticker]
+                resting = orders[ticker]
+
+                order = OrderRecord(order_id, ticker, None, side, execution, price, size)
+                trades = engine.replace(resting.pop(old_order_id), order, rest)
+                _track(resting, order, trades)
+                return order.size, trades, _quotes(engine)
+
+            case ShardRequest.REST:
+                _, ticker, execution, side, size, price, order_id = request
+                order = OrderRecord(order_id, ticker, None, side, execution, price, size)
+                engines[ticker].rest(order)
+                orders[ticker].__setitem__(order_id, order)
+                return _quotes(engines[ticker])
+
+            case ShardRequest.UNCROSS:
+                _, ticker, reference = request
+                engine = engines[ticker]
+                resting = orders[ticker]
+
+                price, trades = engine.uncross(reference)
+                for trade in trades:
+                    for order_id in (trade.incoming_order_id, trade.book_order_id):
+                        if order_id in resting and resting[order_id].size <= 0:
+                            resting.pop(order_id)
+
+                return price, trades, _quotes(engine)
+
+            case ShardRequest.LOAD:
+                _, ticker, specs = request
+                engine = engines[ticker]
+                resting = orders[ticker]
+
+                loaded = [OrderRecord(order_id, ticker, None, side, execution, price, size)
+                          for execution, side, size, price, order_id in specs]
+                engine.load(loaded)
+                for order in loaded:
+                    resting.__setitem__(order.order_id, order)
+
+                return _quotes(engine)
+
+            case ShardRequest.CANCEL:
+                _, ticker, order_id = request
+                engine = engines[ticker]
+                order = orders[ticker].pop(order_id, None)
+                if order is not None:
+                    engine.delete(order)
+                return _quotes(engine)
+
+            case ShardRequest.FILLABLE:
+                _, ticker, execution, side, size, price = request
+                return engines[ticker].fillable(OrderRecord(None, ticker, None, side, execution, price, size))
+
+            case ShardRequest.SNAPSHOT:
+                _, ticker, levels = request
+                return engines[ticker].snapshot(levels)
+
+    while True:
+        try:
+            requests = connection.recv()
+        except EOFError:
+            return
+
+        if requests[0][0] == ShardRequest.STOP:
+            connection.close()
+            return
+
+        connection.send([shard_call(request) for request in requests])
+
+
+class MarketShard:
+    def __init__(self) -> None:
+        # A fresh interpreter that only imports this module: forking would copy the server's running threads
+        # and spawn would import the server's main module, database included, into every shard
+        parent, child = socket.socketpair()
+        self._lock = threading.Lock()
+        self._process = subprocess.Popen([sys.executable, '-m', 'shard', str(child.fileno())],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         pass_fds=(child.fileno(),))
+        child.close()
+        self._connection = Connection(parent.detach())
+
+    def call(self, requests: list):
+        with self._lock:
+            self._connection.send(requests)
+            results = self._connection.recv()
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        return results
+
+    def stop(self):
+        with self._lock:
+            self._connection.send([(ShardRequest.STOP,)])
+            self._connection.close()
+        self._process.wait()
+
+
+class ShardPool:
+    def __init__(self, size: int) -> None:
+        self._shards = [MarketShard() for _ in range(size)]
+
+    def shard_of(self, ticker: str) -> MarketShard:
+        return self._shards[sum([ord(c) for c in ticker]) % len(self._shards)]
+
+    def call(self, ticker: str, *requests):
+        return self.shard_of(ticker).call(list(requests))
+
+    def stop(self):
+        for shard in self._shards:
+            shard.stop()
+
+    def __len__(self):
+        return len(self._shards)
+
+
+class RemoteMatchingLayer(MatchingLayer):
+    def __init__(self, pool: ShardPool, ticker: str, last_bid=None, last_offer=None) -> None:
+        self._pool = pool
+        self._ticker = ticker
+        # Local mirror of the resting orders, kept in step with the fills reported by the shard
+        self._orders = {}
+        self._set_quotes(pool.call(ticker, (ShardRequest.OPEN, ticker, last_bid, last_offer))[0])
+
+    def _set_quotes(self, quotes):
+        self._max_bid, self._min_offer, self._max_bid_size, self._min_offer_size, \
+            self._last_bid, self._last_offer, self._sequence = quotes
+
+    def max_bid(self):
+        return self._max_bid
+
+    def min_offer(self):
+        return self._min_offer
+
+    def max_bid_size(self):
+        return self._max_bid_size
+
+    def min_offer_size(self):
+        return self._min_offer_size
+
+    def sequence(self):
+        return self._sequence
+
+    def snapshot(self, levels=None):
+        return self._pool.call(self._ticker, (ShardRequest.SNAPSHOT, self._ticker, levels))[0]
+
+    def place(self, order: OrderRecord):
+        order.left = order.size
+        order.fill_cost = 0
+
+        size, trades, quotes = self._pool.call(self._ticker, (ShardRequest.PLACE,
+                                                              self._ticker,
+                                                              order.execution,
+                                                              order.side,
+                                                              order.size,
+                                                              order.price,
+                                                              order.order_id))[0]
+        self._set_quotes(quotes)
+        order.size = size
+        self._track(order, trades)
+        return trades
+
+    def _track(self, order: OrderRecord, trades):
+        for trade in trades or ():
+            book_order = self._orders[trade.book_order_id]
+            book_order.size -= trade.size
+            if book_order.size <= 0:
+                self._orders.pop(trade.book_order_id)
+
+        if order.size > 0:
+            self._orders.__setitem__(order.order_id, order)
+        else:
+            self._orders.pop(order.order_id, None)
+
+    def amend(self, order: OrderRecord, size: int, price, rest=False):
+        requeued = not self.keeps_priority(order, size, price)
+        size_left, trades, quotes = self._pool.call(self._ticker, (ShardRequest.AMEND,
+                                                                   self._ticker,
+                                                                   order.order_id,
+                                                                   size,
+                                                                   price,
+                                                                   rest))[0]
+        self._set_quotes(quotes)
+        order.price = price
+        order.left = size
+        if requeued:
+            order.fill_cost = 0
+        order.size = size_left
+        self._track(order, trades)
+        return trades
+
+    def replace(self, order: OrderRecord, replacement: OrderRecord, rest=False):
+        replacement.left = replacement.size
+        replacement.fill_cost = 0
+        self._orders.pop(order.order_id, None)
+
+        size, trades, quotes = self._pool.call(self._ticker, (ShardRequest.REPLACE,
+                                                              self._ticker,
+                                                              order.order_id,
+                                                              replacement.execution,
+                                                              replacement.side,
+                                                              replacement.size,
+                                                              replacement.price,
+                                                              replacement.order_id,
+                                                              rest))[0]
+        self._set_quotes(quotes)
+        replacement.size = size
+        self._track(replacement, trades)
+        return trades
+
+    def rest(self, order: OrderRecord):
+        order.left = order.size
+        order.fill_cost = 0
+        self._orders.__setitem__(order.order_id, order)
+        self._set_quotes(self._pool.call(self._ticker, (ShardRequest.REST,
+                                                        self._ticker,
+                                                        order.execution,
+                                                        order.side,
+                                                        order.size,
+                                                        order.price,
+                                                        order.order_id))[0])
+
+    def uncross(self, reference=None):
+        price, trades, quotes = self._pool.call(self._ticker, (ShardRequest.UNCROSS, self._ticker, reference))[0]
+        self._set_quotes(quotes)
+
+        # Both sides of an auction fill were resting, the mirror is brought in step for each
+        for trade in trades:
+            for order_id in (trade.incoming_order_id, trade.book_order_id):
+                order = self._orders[order_id]
+                order.size -= trade.size
+                if order.size <= 0:
+                    self._orders.pop(order_id)
+
+        return price, trades
+
+    def load(self, orders):
+        specs = []
+        for order in orders:
+            order.left = order.size
+            order.fill_cost = 0
+            specs.append((order.execution, order.side, order.size, order.price, order.order_id))
+            self._orders.__setitem__(order.order_id, order)
+
+        self._set_quotes(self._pool.call(self._ticker, (ShardRequest.LOAD, self._ticker, specs))[0])
+
+    def fillable(self, order: OrderRecord):
+        return self._pool.call(self._ticker, (ShardRequest.FILLABLE,
+                                              self._ticker,
+                                              order.execution,
+                                              order.side,
+                                              order.size,
+                                              order.price))[0]
+
+    def delete(self, order: OrderRecord):
+        self._orders.pop(order.order_id, None)
+        self._set_quotes(self._pool.call(self._ticker, (ShardRequest.CANCEL, self._ticker, order.order_id))[0])
+
+    def delete_many(self, orders):
+        if len(orders) == 0:
+            return
+
+        # One round trip for the whole batch, only the quotes after the last cancel matter
+        for order in orders:
+            self._orders.pop(order.order_id, None)
+
+        results = self._pool.call(self._ticker, *[(ShardRequest.CANCEL, self._ticker, order.order_id) for order in orders])
+        if len(results) > 0:
+            self._set_quotes(results[-1])
+
+
+if __name__ == '__main__':
+    _shard_main(Connection(int(sys.argv[1])))
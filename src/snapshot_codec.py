@@ -0,0 +1,247 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import struct
+import zlib
+
+
+# Both codecs turn plain dicts, lists, strings and numbers into bytes and back. Records behind an ObjectLock
+# go through lock() on the way out, and come back either as a marked dict or as a one element tuple
+
+
+class JSONCodec:
+    extension = '.json'
+
+    @staticmethod
+    def lock(record: dict):
+        record.__setitem__('__PLATFORMDB_LOCK__', True)
+        return record
+
+    def dumps(self, value) -> bytes:
+        return json.dumps(value).encode()
+
+    def loads(self, data: bytes):
+        return json.loads(data)
+
+    def entry(self, value) -> bytes:
+        return json.dumps(value).encode() + b'\n'
+
+    def entries(self, data: bytes):
+        for line in data.splitlines():
+            try:
+                yield json.loads(line)
+            except:
+                # A torn last line is a save that never finished, the journal covers it
+                return
+
+
+# Magic and format version, then the tagged image
+_MAGIC = b'NSEDB\x01'
+# Length and CRC32 of each delta log entry
+_ENTRY = struct.Struct('<II')
+
+# Every value starts with a one byte tag, numbers are little endian. Strings are written once per image or entry,
+# repeats refer back to the first one by index, which keeps record keys from being stored over and over
+_NONE = b'N'
+_TRUE = b'T'
+_FALSE = b'F'
+_INT = struct.Struct('<ci')
+_LONG = struct.Struct('<cq')
+_FLOAT = struct.Struct('<cd')
+# Strings, string references, ints too large for 64 bits, lists, tuples and dicts
+_SIZED = struct.Struct('<cI')
+_INT_RANGE = range(-0x80000000, 0x80000000)
+_LONG_RANGE = range(-0x8000000000000000, 0x8000000000000000)
+
+
+def _encode(value, out: list, strings: dict):
+    kind = type(value)
+    if kind is str:
+        index = strings.get(value)
+        if index is not None:
+            out.append(_SIZED.pack(b'R', index))
+            return
+
+        strings[value] = len(strings)
+        encoded = value.encode()
+        out.append(_SIZED.pack(b'S', len(encoded)))
+        out.append(encoded)
+    elif kind is int:
+        if value in _INT_RANGE:
+            out.append(_INT.pack(b'i', value))
+        elif value in _LONG_RANGE:
+            out.append(_LONG.pack(b'q', value))
+        else:
+            encoded = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+            out.append(_SIZED.pack(b'I', len(encoded)))
+            out.append(encoded)
+    elif kind is dict:
+        out.append(_SIZED.pack(b'D', len(value)))
+        for key, item in value.items():
+            index = strings.get(key)
+            if index is not None:
+                out.append(_SIZED.pack(b'R', index))
+            else:
+                _encode(key, out, strings)
+            _encode(item, out, strings)
+    elif value is None:
+        out.append(_NONE)
+    elif kind is bool:
+        out.append(_TRUE if value else _FALSE)
+    elif kind is float:
+        out.append(_FLOAT.pack(b'f', value))
+    elif isinstance(value, (list, tuple)):
+        out.append(_SIZED.pack(b'L' if isinstance(value, list) else b'U', len(value)))
+        for item in value:
+            _encode(item, out, strings)
+    elif isinstance(value, dict):
+        _encode(dict(value), out, strings)
+    else:
+        raise TypeError(f'Cannot store {kind.__name__} in a binary PlatformDB image')
+
+
+_R, _S, _I, _Q, _D, _L, _U, _N, _T, _F, _X, _BIG = b'RSiqDLUNTFfI'
+
+
+def _decode(data: bytes, offset: int, strings: list):
+    tag = data[offset]
+    if tag == _R:
+        return strings[_SIZED.unpack_from(data, offset)[1]], offset + _SIZED.size
+
+    if tag == _I:
+        return _INT.unpack_from(data, offset)[1], offset + _INT.size
+
+    if tag == _D:
+        count = _SIZED.unpack_from(data, offset)[1]
+        offset += _SIZED.size
+        result = {}
+        for _ in range(count):
+            # Keys are nearly always strings seen before and most values are small ints or repeated strings,
+            # those are read here without another call
+            if data[offset] == _R:
+                key = strings[_SIZED.unpack_from(data, offset)[1]]
+                offset += _SIZED.size
+            else:
+                key, offset = _decode(data, offset, strings)
+
+            tag = data[offset]
+            if tag == _I:
+                result[key] = _INT.unpack_from(data, offset)[1]
+                offset += _INT.size
+            elif tag == _R:
+                result[key] = strings[_SIZED.unpack_from(data, offset)[1]]
+                offset += _SIZED.size
+            else:
+                result[key], offset = _decode(data, offset, strings)
+        return result, offset
+
+    if tag == _S or tag == _BIG:
+        length = _SIZED.unpack_from(data, offset)[1]
+        start = offset + _SIZED.size
+        if start + length > len(data):
+            raise ValueError('Truncated binary PlatformDB value')
+
+        if tag == _BIG:
+            return int.from_bytes(data[start:start + length], 'little', signed=True), start + length
+
+        value = data[start:start + length].decode()
+        strings.append(value)
+        return value, start + length
+
+    if tag == _Q:
+        return _LONG.unpack_from(data, offset)[1], offset + _LONG.size
+
+    if tag == _N:
+        return None, offset + 1
+
+    if tag == _L or tag == _U:
+        count = _SIZED.unpack_from(data, offset)[1]
+        offset += _SIZED.size
+        result = []
+        for _ in range(count):
+            item, offset = _decode(data, offset, strings)
+            result.append(item)
+        return (result if tag == _L else tuple(result)), offset
+
+    if tag == _X:
+        return _FLOAT.unpack_from(data, offset)[1], offset + _FLOAT.size
+
+    if tag == _T:
+        return True, offset + 1
+
+    if tag == _F:
+        return False, offset + 1
+
+    raise ValueError(f'Bad tag {tag} in binary PlatformDB value')
+
+
+def _dumps(value) -> bytes:
+    out = []
+    _encode(value, out, {})
+    return b''.join(out)
+
+
+def _loads(data: bytes):
+    # Anything a damaged file can make the decoder trip on comes out as a ValueError
+    try:
+        value, offset = _decode(data, 0, [])
+    except (struct.error, IndexError, UnicodeDecodeError, TypeError, RecursionError) as e:
+        raise ValueError(f'Malformed binary PlatformDB value: {e}')
+
+    if offset != len(data):
+        raise ValueError('Trailing bytes after binary PlatformDB value')
+    return value
+
+
+class BinaryCodec:
+    extension = '.db'
+
+    @staticmethod
+    def lock(record: dict):
+        # Lists never become tuples, so a tuple is always a locked record
+        return (record,)
+
+    def dumps(self, value) -> bytes:
+        return _MAGIC + _dumps(value)
+
+    def loads(self, data: bytes):
+        if not data.startswith(_MAGIC):
+            raise ValueError('Not a binary PlatformDB image')
+        return _loads(data[len(_MAGIC):])
+
+    def entry(self, value) -> bytes:
+        payload = _dumps(value)
+        return _ENTRY.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def entries(self, data: bytes):
+        offset = 0
+        while offset + _ENTRY.size <= len(data):
+            length, crc = _ENTRY.unpack_from(data, offset)
+            start = offset + _ENTRY.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+
+            yield _loads(payload)
+            offset = start + length
+
+
+CODECS = {
+    'json': JSONCodec,
+    'binary': BinaryCodec
+}
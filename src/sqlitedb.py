@@ -0,0 +1,143 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import sqlite3
+import threading
+
+from object_lock import ObjectLock
+from platformdb import PlatformDB
+from repeated_timer import RepeatedTimer
+
+
+class RecordTable(dict):
+    # Top level dict kept as rows, remembers the keys added, removed or locked since the last drain
+    def __init__(self, records={}) -> None:
+        super().__init__(records)
+        self._changed = set()
+        self._changed_lock = threading.Lock()
+
+        for key, record in self.items():
+            if isinstance(record, ObjectLock):
+                record.row = (self, key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if isinstance(value, ObjectLock):
+            value.row = (self, key)
+        self.touch(key)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.__setitem__(key, default)
+        return self[key]
+
+    def pop(self, key, *default):
+        value = super().pop(key, *default)
+        if isinstance(value, ObjectLock) and value.row is not None and value.row[0] is self:
+            value.row = None
+        self.touch(key)
+        return value
+
+    def touch(self, key):
+        with self._changed_lock:
+            self._changed.add(key)
+
+    def drain(self):
+        with self._changed_lock:
+            changed, self._changed = self._changed, set()
+        return changed
+
+
+class SQLiteDB(PlatformDB):
+    # Top level dicts stored one row per record, everything else is small and goes to the state table whole
+    tables = ('usersByName', 'assetsByTicker', 'ordersById')
+    # Seconds between commits, a commit only writes the rows that changed since the previous one
+    commit_interval = 1
+
+    def __init__(self, filename='platformdb.sqlite', schema={}, default={}, journal=None, codec=None) -> None:
+        super().__init__(filename, schema, default, journal, codec)
+        self._changed = {}
+
+        for key in self.tables:
+            self._db.__setitem__(key, RecordTable(self._db.get(key, {})))
+
+        self._timer = RepeatedTimer(self.commit_interval, self.save)
+
+    def _load(self):
+        self._connection = sqlite3.connect(self._filename, check_same_thread=False)
+        with self._connection:
+            # Journal segments are dropped once a commit covers them, so commits have to survive a power cut
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.execute('PRAGMA synchronous = FULL')
+            for table in self.tables + ('state',):
+                self._connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+
+        loaded = {}
+        for table in self.tables:
+            rows = self._connection.execute(f'SELECT key, value FROM "{table}"')
+            loaded.__setitem__(table, {key: self._codec.loads(value) for key, value in rows})
+        for key, value in self._connection.execute('SELECT key, value FROM state'):
+            loaded.__setitem__(key, self._codec.loads(value))
+
+        if all(len(value) == 0 for value in loaded.values()):
+            logging.warning('Empty PlatformDB Database!')
+            return {}
+
+        return self._get_items(loaded)
+
+    def _cut(self, snapshot):
+        # Only the keys that changed are taken from the tables, so a commit costs what changed and not what is stored
+        snapshot.members = {key: value.copy() if isinstance(value, dict) else value
+                            for key, value in self._db.items() if key not in self.tables}
+        self._changed = {key: self._db[key].drain() for key in self.tables}
+        ObjectLock.snapshot = snapshot
+
+    def _persist(self, snapshot, full):
+        rows = {}
+        removed = {}
+
+        for table, keys in self._changed.items():
+            records = self._db[table]
+            for key in keys:
+                record = records.get(key)
+                if record is None:
+                    removed.setdefault(table, []).append((str(key),))
+                    continue
+
+                if isinstance(record, ObjectLock):
+                    _, image = snapshot.image(record)
+                else:
+                    image = PlatformDB.to_dict({key: record}, codec=self._codec)[key]
+                rows.setdefault(table, []).append((str(key), self._codec.dumps(image)))
+
+        state = [(key, self._codec.dumps(PlatformDB.to_dict({key: value}, codec=self._codec)[key]))
+                 for key, value in snapshot.members.items()]
+
+        # One transaction per commit, the rows and the journal position it covers land together
+        with self._connection:
+            for table, table_rows in rows.items():
+                self._connection.executemany(f'INSERT OR REPLACE INTO "{table}" (key, value) VALUES (?, ?)', table_rows)
+            for table, keys in removed.items():
+                self._connection.executemany(f'DELETE FROM "{table}" WHERE key = ?', keys)
+            self._connection.executemany('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', state)
+
+        # There is no older generation to fall back on, the commit covers every segment before its own
+        self._kept_segment = snapshot.members.get('journalSegment', 0)
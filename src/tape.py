@@ -0,0 +1,71 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+from array import array
+
+from order_matching.side import Side
+
+
+class TradeTape:
+    # Number of prints kept per ticker, older ones are overwritten
+    capacity = 4096
+
+    def __init__(self) -> None:
+        # Parallel arrays allocated once, recording a print only overwrites slots
+        self._prices = array('q', bytes(8 * self.capacity))
+        self._sizes = array('q', bytes(8 * self.capacity))
+        self._sides = array('b', bytes(self.capacity))
+        self._times = array('d', bytes(8 * self.capacity))
+        # Sequence number of the last recorded print, the first one is 1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def record(self, trades, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for trade in trades:
+                self._sequence += 1
+                slot = self._sequence % self.capacity
+                self._prices[slot] = trade.price
+                self._sizes[slot] = trade.size
+                self._sides[slot] = 0 if trade.side == Side.BUY else 1
+                self._times[slot] = timestamp
+
+    def sequence(self):
+        return self._sequence
+
+    def since(self, sequence: int, limit=None):
+        # Prints after the given sequence, oldest first, as (sequence, price, size, aggressor, time)
+        with self._lock:
+            first = max(sequence + 1, self._sequence - self.capacity + 1, 1)
+            if limit is not None:
+                first = max(first, self._sequence - limit + 1)
+
+            prints = []
+            for seq in range(first, self._sequence + 1):
+                slot = seq % self.capacity
+                prints.append((seq,
+                               self._prices[slot],
+                               self._sizes[slot],
+                               Side.BUY if self._sides[slot] == 0 else Side.SELL,
+                               self._times[slot]))
+            return prints
+
+    def last(self, count: int):
+        return self.since(0, limit=count)
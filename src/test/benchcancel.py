@@ -0,0 +1,61 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.benchcancel
+
+import random
+import time
+
+from order_matching.side import Side
+
+from matching_layer import MatchingLayer
+from order_store import OrderRecord
+
+
+DEPTHS = [1_000, 10_000, 100_000]
+CANCELS = 1_000
+
+
+def make_order(order_id, side, price, size):
+    return OrderRecord.limit(order_id, 'BENCH', 'bench', side, price, size)
+
+
+def bench(depth):
+    rng = random.Random(depth)
+    engine = MatchingLayer(0)
+    orders = []
+
+    # Bids below 100, offers above, so nothing crosses while the book is built
+    for i in range(depth):
+        if i % 2 == 0:
+            order = make_order(i, Side.BUY, rng.randint(5000, 9999), rng.randint(1, 100))
+        else:
+            order = make_order(i, Side.SELL, rng.randint(10000, 14999), rng.randint(1, 100))
+        engine.place(order)
+        orders.append(order)
+
+    victims = rng.sample(orders, CANCELS)
+    start = time.perf_counter()
+    for order in victims:
+        engine.delete(order)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / CANCELS * 1_000_000
+
+
+for depth in DEPTHS:
+    print(f'{depth:>8} resting orders: {bench(depth):8.2f} us/cancel')
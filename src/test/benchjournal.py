@@ -0,0 +1,97 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.benchjournal
+
+import os
+import random
+import time
+
+from test.scratch import enter_scratch_dir
+enter_scratch_dir()
+
+from order_matching.side import Side
+
+from exdb import EXCHANGE_DATABASE
+from journal import Journal, JournalEvent, pack_order, pack_cancel, pack_account, pack_market, unpack
+from order_store import OrderRecord
+
+
+EVENTS = 1_000_000
+USERS = 100
+TICKERS = 8
+
+
+def write(journal: Journal):
+    rng = random.Random(0)
+    account = EXCHANGE_DATABASE.user()
+    account['immediate']['current']['assets'].update({f'T{i}': rng.randint(-50, 50) for i in range(3)})
+    asset = EXCHANGE_DATABASE.asset()
+
+    start = time.perf_counter()
+    for i in range(EVENTS):
+        ticker = f'T{i % TICKERS}'
+        kind = i % 10
+
+        if kind < 5:
+            journal.append(JournalEvent.ORDER, pack_order(OrderRecord.limit(i,
+                                                                            ticker,
+                                                                            f'user{i % USERS}',
+                                                                            Side.BUY if kind % 2 == 0 else Side.SELL,
+                                                                            rng.randint(5000, 14999),
+                                                                            rng.randint(1, 100))))
+        elif kind < 7:
+            account['immediate']['current']['balance'] = rng.randint(-10_000_000, 10_000_000)
+            journal.append(JournalEvent.TRADE, pack_account(f'user{i % USERS}', account))
+        elif kind < 9:
+            asset['sessionData']['tradedValue'] += 1
+            journal.append(JournalEvent.MARKET, pack_market(ticker, asset))
+        else:
+            journal.append(JournalEvent.CANCEL, pack_cancel(i - 9))
+
+        if i % 10_000 == 0:
+            journal.commit()
+
+    journal.commit()
+    return time.perf_counter() - start
+
+
+def replay(journal: Journal):
+    start = time.perf_counter()
+    events = 0
+    for event, payload in journal.replay():
+        EXCHANGE_DATABASE.redo(event, unpack(event, payload))
+        events += 1
+
+    return events, time.perf_counter() - start
+
+
+for ticker in range(TICKERS):
+    EXCHANGE_DATABASE.add_asset(f'T{ticker}', 'BENCH')
+
+journal = Journal('db/bench')
+journal.start()
+journal.stop()
+
+elapsed = write(journal)
+print(f'write:  {EVENTS / elapsed:12,.0f} events/s ({EVENTS / elapsed * 60 / 1_000_000:.1f}M events/min)')
+
+events, elapsed = replay(journal)
+print(f'replay: {events / elapsed:12,.0f} events/s ({events / elapsed * 60 / 1_000_000:.1f}M events/min)')
+print(f'{events:,} events, {os.path.getsize("db/bench.1.journal") / events:.1f} bytes/event')
+
+os._exit(0)
@@ -0,0 +1,79 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.benchsequencer
+
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from order_matching.side import Side
+from order_matching.execution import Execution
+
+
+THREADS = 200
+ORDERS_PER_THREAD = 50
+
+
+def run(sequenced):
+    # The mode is fixed when GlobalMarket starts, so every run is its own process
+    from test.scratch import enter_scratch_dir
+    enter_scratch_dir()
+
+    from global_market import GlobalMarket
+    GlobalMarket.sequenced = sequenced
+
+    from exdb import EXCHANGE_DATABASE
+    import command_backend as cb
+
+    EXCHANGE_DATABASE.db.timer.stop()
+    EXCHANGE_DATABASE.add_asset('HOT', 'EQ')
+    for i in range(THREADS):
+        EXCHANGE_DATABASE.add_user(f'user{i}')
+
+    GlobalMarket()
+    rng = random.Random(0)
+    orders = [[(rng.choice([Side.BUY, Side.SELL]), rng.randint(1, 20), 100 + rng.randint(-20, 20) * 0.5)
+               for _ in range(ORDERS_PER_THREAD)] for _ in range(THREADS)]
+
+    # Every connection thread hits the same ticker
+    def client(i):
+        for side, size, price in orders[i]:
+            cb.place_order('HOT', f'user{i}', Execution.LIMIT, side, str(size), str(price))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    rate = THREADS * ORDERS_PER_THREAD / (time.perf_counter() - start)
+
+    print(f'{"sequenced" if sequenced else "locked":>10} {rate:>12,.0f}', flush=True)
+    os._exit(0)
+
+
+if len(sys.argv) > 1:
+    run(sys.argv[1] == 'sequenced')
+
+print(f'{THREADS} threads, one ticker')
+print(f'{"mode":>10} {"orders/s":>12}')
+for mode in ('locked', 'sequenced'):
+    subprocess.run([sys.executable, '-m', 'test.benchsequencer', mode], check=True)
@@ -0,0 +1,96 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.benchshards
+
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from order_matching.side import Side
+from order_matching.execution import Execution
+
+
+# 0 keeps matching in the server process
+SHARDS = [0, 1, 2, 4, 8]
+TICKERS = ['T' + chr(ord('A') + i) for i in range(8)]
+ORDERS = 2_000
+BATCH_SIZE = 50
+
+
+def make_orders(ticker):
+    rng = random.Random(ticker)
+    return [(rng.choice([Side.BUY, Side.SELL]), rng.randint(1, 20), 100 + rng.randint(-20, 20) * 0.5)
+            for _ in range(ORDERS)]
+
+
+def spec(side, size, price):
+    return f'{"b" if side == Side.BUY else "s"}:{size}@{price}'
+
+
+def run(shards):
+    # Each shard count needs a fresh GlobalMarket, so every run is its own process
+    from test.scratch import enter_scratch_dir
+    enter_scratch_dir()
+
+    from global_market import GlobalMarket
+    GlobalMarket.shards = shards
+
+    from exdb import EXCHANGE_DATABASE
+    import command_backend as cb
+
+    EXCHANGE_DATABASE.db.timer.stop()
+    for ticker in TICKERS:
+        EXCHANGE_DATABASE.add_user(ticker.lower())
+        EXCHANGE_DATABASE.add_asset(ticker, 'EQ')
+
+    GlobalMarket()
+    orders = {ticker: make_orders(ticker) for ticker in TICKERS}
+
+    # One client per ticker, all of them through the same path a server command takes
+    def single(ticker):
+        for side, size, price in orders[ticker]:
+            cb.place_order(ticker, ticker.lower(), Execution.LIMIT, side, str(size), str(price))
+
+    def bulk(ticker):
+        for i in range(0, ORDERS, BATCH_SIZE):
+            cb.place_orders(ticker, ticker.lower(), ' '.join(spec(*order) for order in orders[ticker][i:i + BATCH_SIZE]))
+
+    rates = []
+    for client in (single, bulk):
+        threads = [threading.Thread(target=client, args=(ticker,)) for ticker in TICKERS]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rates.append(len(TICKERS) * ORDERS / (time.perf_counter() - start))
+
+    print(f'{shards:>7} {rates[0]:>12,.0f} {rates[1]:>12,.0f}', flush=True)
+    os._exit(0)
+
+
+if len(sys.argv) > 1:
+    run(int(sys.argv[1]))
+
+print(f'{os.cpu_count()} CPU(s), {len(TICKERS)} tickers, {len(TICKERS)} concurrent clients')
+print(f'{"shards":>7} {"single/s":>12} {"bulk/s":>12}')
+for shards in SHARDS:
+    subprocess.run([sys.executable, '-m', 'test.benchshards', str(shards)], check=True)
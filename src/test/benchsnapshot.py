@@ -0,0 +1,97 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.benchsnapshot
+
+import os
+import random
+import time
+
+from test.scratch import enter_scratch_dir
+enter_scratch_dir()
+
+from object_lock import ObjectLock
+from exdb import EXCHANGE_DATABASE
+from platformdb import PlatformDB
+from snapshot_codec import CODECS
+
+
+SIZES = [1_000, 10_000, 100_000]
+TICKERS = 50
+ORDERS_PER_USER = 2
+
+
+def fill(db: PlatformDB, users: int):
+    rng = random.Random(users)
+    tickers = [f'T{i}' for i in range(TICKERS)]
+
+    for ticker in tickers:
+        asset = EXCHANGE_DATABASE.asset()
+        asset['immediate']['last'] = rng.randint(5000, 14999)
+        db.db['assetsByTicker'].__setitem__(ticker, ObjectLock(asset))
+
+    for i in range(users):
+        user = EXCHANGE_DATABASE.user()
+        user['immediate']['current']['balance'] = rng.randint(-10_000_000, 10_000_000)
+        user['immediate']['current']['assets'].update({ticker: rng.randint(-50, 50) for ticker in rng.sample(tickers, 3)})
+        db.db['usersByName'].__setitem__(f'user{i}', ObjectLock(user))
+
+    orders = db.db['ordersById']
+    for i in range(users * ORDERS_PER_USER):
+        orders.__setitem__(str(i), {
+            'execution': 'LIMIT',
+            'ticker': rng.choice(tickers),
+            'issuer': f'user{rng.randrange(users)}',
+            'side': rng.choice(['BUY', 'SELL']),
+            'size': rng.randint(1, 100),
+            'price': rng.randint(5000, 14999),
+            'tif': 'GTC',
+            'expiresAt': None
+        })
+
+
+def bench(users: int, name: str):
+    filename = f'db/bench{users}' + CODECS[name].extension
+    schema = {
+        'usersByName': EXCHANGE_DATABASE.user(),
+        'assetsByTicker': EXCHANGE_DATABASE.asset(),
+        'assetsByClass': {},
+        'ordersById': EXCHANGE_DATABASE.order()
+    }
+
+    db = PlatformDB(filename=filename, schema=schema, codec=CODECS[name]())
+    fill(db, users)
+
+    # Full image, the first save of a process always writes one
+    start = time.perf_counter()
+    db.save()
+    save = time.perf_counter() - start
+
+    start = time.perf_counter()
+    PlatformDB(filename=filename, schema=schema, codec=CODECS[name]())
+    load = time.perf_counter() - start
+
+    return save, load, os.path.getsize(filename)
+
+
+print(f'{"users":>8} {"codec":>7} {"save ms":>9} {"load ms":>9} {"size KiB":>9}')
+for users in SIZES:
+    for name in CODECS:
+        save, load, size = bench(users, name)
+        print(f'{users:>8,} {name:>7} {save * 1000:>9.1f} {load * 1000:>9.1f} {size / 1024:>9,.0f}')
+
+os._exit(0)
@@ -0,0 +1,82 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.testcodec
+
+import copy
+import random
+
+from snapshot_codec import CODECS, BinaryCodec
+
+
+IMAGE = {
+    'openDate': '2099-01-01',
+    'journalSegment': 3,
+    'usersByName': {
+        'alice': {'immediate': {'current': {'balance': -1_250_000, 'assets': {'NSE': 40, 'ÆØÅ': -2}},
+                                'settled': {'balance': 2 ** 40, 'assets': {}}},
+                  'orders': ['1', '2'], 'flag': True, 'other': False, 'pending': None},
+        'bob': {'immediate': {'current': {'balance': 0, 'assets': {'NSE': -40}},
+                              'settled': {'balance': 0, 'assets': {}}},
+                'orders': [], 'flag': False, 'other': True, 'pending': 1.25}
+    },
+    'limits': [2 ** 31 - 1, -2 ** 31, 2 ** 31, 2 ** 63 - 1, -2 ** 63, 2 ** 63, -2 ** 90, 0.1, float('inf'), '', []]
+}
+
+
+for name, codec in CODECS.items():
+    codec = codec()
+    image = copy.deepcopy(IMAGE)
+    image['usersByName'] = codec.lock(image['usersByName'])
+    assert codec.loads(codec.dumps(image)) == image, name
+
+    # A torn last entry is dropped, the ones before it come back whole
+    log = codec.entry({'base': 1, 'records': IMAGE['usersByName']}) + codec.entry({'base': 1, 'state': {'x': 1}})
+    assert [entry['base'] for entry in codec.entries(log)] == [1, 1], name
+    assert [entry['base'] for entry in codec.entries(log[:-3])] == [1], name
+
+
+binary = BinaryCodec()
+data = binary.dumps(binary.lock(IMAGE))
+assert binary.loads(data) == (IMAGE,)
+assert type(binary.loads(binary.dumps([1, (2,)]))[1]) is tuple
+
+# Damaged images are refused with a ValueError and nothing else, however they are cut or flipped
+for length in range(len(data)):
+    try:
+        binary.loads(data[:length])
+        assert False, length
+    except ValueError:
+        pass
+
+rng = random.Random(0)
+for _ in range(2_000):
+    damaged = bytearray(data)
+    damaged[rng.randrange(6, len(damaged))] = rng.randrange(256)
+    try:
+        binary.loads(bytes(damaged))
+    except ValueError:
+        pass
+
+for bad in (b'NSEDB\x02' + data[6:], b'{"a": 1}', data + b'N'):
+    try:
+        binary.loads(bad)
+        assert False, bad
+    except ValueError:
+        pass
+
+print('OK')
@@ -0,0 +1,114 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.testjournal
+
+import os
+
+from test.scratch import enter_scratch_dir
+enter_scratch_dir()
+
+from order_matching.side import Side
+
+from exdb import EXCHANGE_DATABASE
+from journal import Journal, JournalEvent, pack_order, pack_cancel, pack_account, unpack, _HEADER
+from order_store import OrderRecord
+
+
+def replayed(since=0, sequence=None):
+    return [(event, unpack(event, payload)) for event, payload in Journal('db/test').replay(since, sequence)]
+
+
+account = EXCHANGE_DATABASE.user()
+account['immediate']['current']['balance'] = -12_345
+account['immediate']['current']['assets'].__setitem__('NSE', 7)
+orders = [OrderRecord.limit(i, 'NSE', 'alice', Side.BUY if i % 2 else Side.SELL, 1000 + i, i) for i in range(1, 6)]
+
+journal = Journal('db/test')
+journal.start()
+for order in orders:
+    journal.append(JournalEvent.ORDER, pack_order(order))
+journal.append(JournalEvent.CANCEL, pack_cancel(2))
+journal.append(JournalEvent.TRADE, pack_account('alice', account))
+journal.commit()
+
+# Appended but never committed, lost with the process
+journal.append(JournalEvent.CANCEL, pack_cancel(3))
+
+# The process dies halfway through writing the next frame
+with open('db/test.1.journal', 'ab') as file:
+    file.write(b'\x40\x00\x00\x00\x01\x02')
+
+events = replayed()
+assert [event for event, _ in events] == [JournalEvent.ORDER] * 5 + [JournalEvent.CANCEL, JournalEvent.TRADE]
+assert [record[0] for _, record in events[:5]] == [1, 2, 3, 4, 5]
+assert events[1][1][1] == {'execution': 'LIMIT', 'ticker': 'NSE', 'issuer': 'alice', 'side': 'SELL', 'size': 2,
+                           'price': 1002, 'tif': 'GTC', 'expiresAt': None, 'priority': 2, 'quote': False}
+assert events[5][1] == 2
+assert events[6][1] == ('alice', {'current': {'balance': -12_345, 'assets': {'NSE': 7}},
+                                  'settled': {'balance': 0, 'assets': {}}})
+
+# A frame whose checksum does not match ends the segment just the same
+with open('db/test.1.journal', 'r+b') as file:
+    data = file.read()
+    file.seek(len(data) - 7)
+    file.write(b'\xff')
+assert len(replayed()) == 6
+
+# After a restart the journal writes to a new segment, event numbers carry on across it
+journal = Journal('db/test')
+assert len(list(journal.replay())) == 6
+journal.start()
+journal.append(JournalEvent.CANCEL, pack_cancel(4))
+journal.commit()
+assert journal.segments() == [1, 2]
+assert replayed()[-1] == (JournalEvent.CANCEL, 4)
+assert replayed(since=2, sequence=6) == [(JournalEvent.CANCEL, 4)]
+
+# A batch replays only once its end marker is on disk
+journal.begin()
+journal.append(JournalEvent.CANCEL, pack_cancel(2))
+journal.append(JournalEvent.CANCEL, pack_cancel(4))
+journal.end()
+journal.begin()
+journal.append(JournalEvent.CANCEL, pack_cancel(1))
+journal.append(JournalEvent.CANCEL, pack_cancel(3))
+journal.commit()
+assert [record for _, record in replayed(since=2)] == [4, 2, 4]
+journal.end()
+journal.commit()
+assert [record for _, record in replayed(since=2)] == [4, 2, 4, 1, 3]
+
+# A crash before the end marker was written leaves the batch open, none of it replays
+with open('db/test.2.journal', 'r+b') as file:
+    file.truncate(len(file.read()) - _HEADER.size)
+assert [record for _, record in replayed(since=2)] == [4, 2, 4]
+
+# Replaying into the exchange database leaves only the orders that are still resting
+EXCHANGE_DATABASE.add_asset('NSE', 'TEST')
+for event, record in replayed():
+    EXCHANGE_DATABASE.redo(event, record)
+assert sorted(EXCHANGE_DATABASE.restored_orders) == ['1', '3', '5']
+# The account frame was the damaged one
+assert 'alice' not in EXCHANGE_DATABASE.users
+
+# Segments older than a snapshot's are dropped once it is on disk
+journal.discard(2)
+assert journal.segments() == [2]
+
+print('OK')
+os._exit(0)
@@ -0,0 +1,112 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.testorderbook
+
+from order_matching.side import Side
+
+from matching_layer import MatchingLayer
+from order_store import OrderRecord
+
+
+def limit(order_id, side, price, size):
+    return OrderRecord.limit(order_id, 'TEST', f'trader{order_id}', side, price, size)
+
+
+def market(order_id, side, size):
+    return OrderRecord.market(order_id, 'TEST', f'trader{order_id}', side, size)
+
+
+def fills(trades):
+    return [(trade.book_order_id, trade.price, trade.size) for trade in trades]
+
+
+# Price first, then time within a level
+engine = MatchingLayer(0)
+for order in (limit(1, Side.SELL, 1010, 5), limit(2, Side.SELL, 1000, 5), limit(3, Side.SELL, 1000, 5),
+              limit(4, Side.BUY, 990, 5), limit(5, Side.BUY, 995, 5)):
+    assert engine.place(order) is None
+
+assert (engine.max_bid(), engine.min_offer()) == (995, 1000)
+assert engine.snapshot()['offers'] == [[1000, 10], [1010, 5]]
+
+buy = limit(6, Side.BUY, 1010, 12)
+assert fills(engine.place(buy)) == [(2, 1000, 5), (3, 1000, 5), (1, 1010, 2)]
+assert buy.size == 0
+assert engine.snapshot()['offers'] == [[1010, 3]]
+
+# A limit that sweeps the side rests what is left at its own price
+buy = limit(7, Side.BUY, 1020, 10)
+assert fills(engine.place(buy)) == [(1, 1010, 3)]
+assert (engine.max_bid(), engine.max_bid_size(), engine.min_offer()) == (1020, 7, None)
+
+# Market orders take whatever is there, best price first
+sell = market(8, Side.SELL, 9)
+assert fills(engine.place(sell)) == [(7, 1020, 7), (5, 995, 2)]
+assert engine.snapshot()['bids'] == [[995, 3], [990, 5]]
+
+# Cancels take the order out of its queue and drop levels that empty
+engine = MatchingLayer(0)
+orders = [limit(i, Side.BUY, 1000 - i % 3, 1) for i in range(1, 10)]
+for order in orders:
+    engine.place(order)
+
+engine.delete(orders[2])
+engine.delete(orders[5])
+assert engine.snapshot()['bids'] == [[1000, 1], [999, 3], [998, 3]]
+engine.delete(orders[8])
+assert engine.max_bid() == 999
+assert engine.snapshot()['bids'] == [[999, 3], [998, 3]]
+
+# A level that comes back after emptying is one level again, with time priority among its new orders
+engine.place(limit(20, Side.BUY, 1000, 2))
+engine.place(limit(21, Side.BUY, 1000, 3))
+assert engine.snapshot()['bids'] == [[1000, 5], [999, 3], [998, 3]]
+assert fills(engine.place(limit(22, Side.SELL, 1000, 4))) == [(20, 1000, 2), (21, 1000, 2)]
+
+# Emptying and refilling the top over and over never leaves a stale best level behind
+for i in range(1_000):
+    top = limit(100 + i, Side.BUY, 1005 + i % 4, 1)
+    engine.place(top)
+    assert engine.max_bid() == 1005 + i % 4
+    engine.delete(top)
+    assert engine.max_bid() == 1000
+
+# Cancelling an order that already left the book changes nothing
+engine.delete(orders[2])
+assert engine.snapshot()['bids'] == [[1000, 1], [999, 3], [998, 3]]
+
+# A level below the top that empties and comes back is listed once, bounded snapshots included
+for order in (orders[0], orders[3], orders[6]):
+    engine.delete(order)
+engine.place(limit(30, Side.BUY, 999, 4))
+assert engine.snapshot()['bids'] == [[1000, 1], [999, 4], [998, 3]]
+assert engine.snapshot(levels=2)['bids'] == [[1000, 1], [999, 4]]
+
+# An amend down at the same price keeps the order's place and what it already filled, a price change re-queues it
+engine = MatchingLayer(0)
+first, second = limit(40, Side.SELL, 1000, 5), limit(41, Side.SELL, 1000, 5)
+engine.place(first)
+engine.place(second)
+first.fill_cost = 3_000
+assert engine.amend(first, 3, 1000) is None
+assert (first.size, first.left, first.fill_cost) == (3, 3, 3_000)
+assert fills(engine.place(limit(42, Side.BUY, 1000, 4))) == [(40, 1000, 3), (41, 1000, 1)]
+engine.amend(second, 4, 1010)
+assert engine.snapshot()['offers'] == [[1010, 4]]
+
+print('OK')
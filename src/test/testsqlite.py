@@ -0,0 +1,91 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.testsqlite
+
+import sqlite3
+
+from test.scratch import enter_scratch_dir
+enter_scratch_dir()
+
+from object_lock import ObjectLock
+from platformdb import PlatformDB
+from sqlitedb import SQLiteDB
+
+
+FILENAME = 'db/test.sqlite'
+USERS = 1_000
+
+
+def rows(table):
+    with sqlite3.connect(FILENAME) as connection:
+        return dict(connection.execute(f'SELECT key, value FROM "{table}"'))
+
+
+def changes(db: SQLiteDB):
+    # Rows inserted, replaced or deleted by one commit
+    before = db._connection.total_changes
+    db.save()
+    return db._connection.total_changes - before
+
+
+db = SQLiteDB(filename=FILENAME)
+users = db.db['usersByName']
+for i in range(USERS):
+    users.__setitem__(f'user{i}', ObjectLock({'immediate': {'balance': i}}))
+db.db['ordersById'].__setitem__('1', {'ticker': 'NSE', 'size': 5})
+db.db.__setitem__('openDate', '2099-01-01')
+
+# Every row goes out with the first commit, the keys outside the tables are written whole each time
+assert changes(db) == USERS + 1 + len(db.db) - len(SQLiteDB.tables)
+assert len(rows('usersByName')) == USERS
+
+# Nothing changed, only the state rows are written again
+state = len(rows('state'))
+assert changes(db) == state
+
+# One record written through its lock is one row
+with users['user7'] as user:
+    user['immediate']['balance'] = -7
+assert changes(db) == 1 + state
+
+# Added and removed records are one row each
+users.__setitem__('newcomer', ObjectLock({'immediate': {'balance': 0}}))
+users.pop('user8')
+db.db['ordersById'].pop('1')
+assert changes(db) == 3 + state
+assert 'user8' not in rows('usersByName') and 'newcomer' in rows('usersByName')
+assert rows('ordersById') == {}
+
+# A commit that fails leaves its rows for the next one
+with users['user9'] as user:
+    user['immediate']['balance'] = -9
+connection, db._connection = db._connection, sqlite3.connect(':memory:')
+try:
+    db.save()
+    assert False
+except sqlite3.OperationalError:
+    pass
+db._connection = connection
+assert changes(db) == 1 + state
+
+# What comes back is what was committed
+loaded = SQLiteDB(filename=FILENAME)
+assert PlatformDB.to_dict(loaded.db) == PlatformDB.to_dict(db.db)
+assert loaded.db['usersByName']['user7'].get_unsafe()['immediate']['balance'] == -7
+
+print('OK')
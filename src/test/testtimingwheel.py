@@ -0,0 +1,74 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Run from src/ with: python -m test.testtimingwheel
+
+import math
+import random
+
+from timing_wheel import TimingWheel
+
+
+# An entry fires at the first advance that reaches its deadline rounded up to the resolution, never earlier
+wheel = TimingWheel(100.0)
+wheel.add('a', 100.5)
+wheel.add('b', 101.0)
+wheel.add('c', 164.0)
+assert wheel.advance(100.9) == []
+assert sorted(wheel.advance(101.0)) == ['a', 'b']
+assert wheel.advance(163.99) == []
+assert wheel.advance(164.0) == ['c']
+assert len(wheel) == 0
+
+# Deadlines already past fire on the next tick
+wheel.add('late', 50.0)
+assert wheel.advance(164.5) == []
+assert wheel.advance(165.0) == ['late']
+
+# Long idle stretches and deadlines beyond every level, including the overflow list
+horizon = TimingWheel.SLOTS ** TimingWheel.LEVELS
+wheel = TimingWheel(0.0)
+wheel.add('far', horizon * 3 + 7)
+wheel.add('near', 10.0)
+assert wheel.advance(horizon * 3) == ['near']
+assert wheel.advance(horizon * 3 + 6) == []
+assert wheel.advance(horizon * 3 + 7) == ['far']
+
+# Random deadlines and steps against a plain sorted list, for whole and fractional resolutions
+for resolution in (1.0, 0.25):
+    rng = random.Random(int(resolution * 100))
+    now = 1_000.0
+    wheel = TimingWheel(now, resolution)
+    pending = {}
+    key = 0
+
+    for _ in range(5_000):
+        for _ in range(rng.randint(0, 3)):
+            key += 1
+            deadline = now + rng.choice([rng.uniform(-5, 5), rng.uniform(0, 100), rng.uniform(0, 10 ** 5), rng.uniform(0, 10 ** 8)])
+            pending.__setitem__(key, max(math.ceil(deadline / resolution), math.floor(now / resolution) + 1))
+            wheel.add(key, deadline)
+
+        now += rng.choice([0, resolution / 2, resolution, rng.uniform(0, 50), rng.uniform(0, 10 ** 6)])
+        tick = math.floor(now / resolution)
+        due = sorted(key for key, deadline in pending.items() if deadline <= tick)
+        assert sorted(wheel.advance(now)) == due, (resolution, now)
+        for key_due in due:
+            pending.pop(key_due)
+        assert len(wheel) == len(pending)
+
+print('OK')
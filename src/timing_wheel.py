@@ -0,0 +1,103 @@
+# NSE Market System
+# Copyright (C) 2023 - 2025 Alessandro Salerno
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+class TimingWheel:
+    # Hierarchical wheel: level N slots are SLOTS^N ticks wide, entries move down a level as their time gets close
+    SLOT_BITS = 6
+    SLOTS = 1 << SLOT_BITS
+    LEVELS = 4
+
+    def __init__(self, now: float, resolution=1.0) -> None:
+        self._resolution = resolution
+        self._tick = int(now // resolution)
+        self._wheels = [[[] for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+        self._counts = [0] * self.LEVELS
+        # Entries further away than the top level can reach, looked at again whenever the top level turns
+        self._overflow = []
+        self._size = 0
+
+    def add(self, key, deadline: float):
+        # Rounded up, an entry never fires before its deadline
+        self._place(key, int(-(-deadline // self._resolution)))
+        self._size += 1
+
+    def _place(self, key, tick: int):
+        delta = max(tick - self._tick, 1)
+        for level in range(self.LEVELS):
+            if delta < 1 << (self.SLOT_BITS * (level + 1)):
+                slot = (max(tick, self._tick + 1) >> (self.SLOT_BITS * level)) & (self.SLOTS - 1)
+                self._wheels[level][slot].append((key, tick))
+                self._counts[level] += 1
+                return
+
+        self._overflow.append((key, tick))
+
+    def advance(self, now: float):
+        # Returns the keys of every entry whose deadline is now past
+        expired = []
+        target = int(now // self._resolution)
+
+        while self._tick < target:
+            # Empty lower levels have nothing due before the next cascade, idle stretches are skipped in one go
+            level = 0
+            while level < self.LEVELS and self._counts[level] == 0:
+                level += 1
+
+            if level > 0:
+                shift = self.SLOT_BITS * level
+                cascade_tick = ((self._tick >> shift) + 1) << shift
+                if self._size == 0 or cascade_tick > target:
+                    self._tick = target
+                    break
+                self._tick = cascade_tick - 1
+
+            self._tick += 1
+            self._cascade()
+
+            slot = self._wheels[0][self._tick & (self.SLOTS - 1)]
+            if len(slot) > 0:
+                expired.extend([key for key, _ in slot])
+                self._counts[0] -= len(slot)
+                self._size -= len(slot)
+                slot.clear()
+
+        return expired
+
+    def _cascade(self):
+        # Higher levels first, what they hand down may land in a lower slot that is also due now
+        for level in range(self.LEVELS, 0, -1):
+            shift = self.SLOT_BITS * level
+            if self._tick & ((1 << shift) - 1) != 0:
+                continue
+
+            if level == self.LEVELS:
+                entries, self._overflow = self._overflow, []
+            else:
+                slot = self._wheels[level][(self._tick >> shift) & (self.SLOTS - 1)]
+                entries = list(slot)
+                self._counts[level] -= len(entries)
+                slot.clear()
+
+            for key, tick in entries:
+                if tick <= self._tick:
+                    self._wheels[0][self._tick & (self.SLOTS - 1)].append((key, tick))
+                    self._counts[0] += 1
+                else:
+                    self._place(key, tick)
+
+    def __len__(self):
+        return self._size
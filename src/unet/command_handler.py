@@ -22,7 +22,10 @@ import inspect
 def unet_command(*names):
     def inner(handler):
         handler._unet_command_handler = True
-        handler._unet_command_argc = len(inspect.signature(handler).parameters) - 2
+        parameters = list(inspect.signature(handler).parameters.values())[2:]
+        handler._unet_command_argc = len(parameters)
+        # Trailing parameters with a default may be left out by the caller
+        handler._unet_command_min_argc = len([p for p in parameters if p.default is inspect.Parameter.empty])
         handler._unet_command_names = list()
         for name in names:
             handler._unet_command_names.append(name)
@@ -52,7 +55,7 @@ class UNetCommandHandler:
     def call_command(self, command: UNetCommand) -> any:
         handler = self.get_command(command.command_name)
         
-        if handler._unet_command_argc != len(command.arguments):
+        if not handler._unet_command_min_argc <= len(command.arguments) <= handler._unet_command_argc:
             raise UNetCommandIncompatibleArgumentException(command.command_name, handler._unet_command_argc, len(command.arguments))
         
         return handler(command, *command.arguments)
@@ -15,6 +15,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import math
 from datetime import datetime, timedelta
 import pytz
 
@@ -49,3 +50,31 @@ def nowtime():
     now = datetime.now(tz=pytz.timezone('Europe/Rome'))
     return now.strftime('%H:%M:%S')
 
+
+def parse_duration(duration: str):
+    # <n><s|m|h|d>, in seconds
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = float(duration[:-1]) * units[duration[-1].lower()]
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f"Invalid duration '{duration}'")
+    return value
+
+
+def timestamp_fmt(timestamp: float):
+    return datetime.fromtimestamp(timestamp, tz=pytz.timezone('Europe/Rome')).strftime('%H:%M:%S')
+
+
+# Prices and cash amounts are held as integer ticks, only the protocol edge sees currency units
+TICKS_PER_UNIT = 100
+
+
+def to_ticks(value):
+    return None if value is None else int(round(float(value) * TICKS_PER_UNIT))
+
+
+def from_ticks(ticks):
+    return None if ticks is None else ticks / TICKS_PER_UNIT
+
+
+def ticks_fmt(ticks):
+    return value_fmt(from_ticks(ticks))